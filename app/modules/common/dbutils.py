@@ -24,7 +24,7 @@ def create_dataset_db(id, publication_type=PublicationType.DATA_MANAGEMENT_PLAN,
     db.session.add(user_test)
     db.session.commit()
 
-    ds_metrics = DSMetrics(number_of_models='1', number_of_features='5')
+    ds_metrics = DSMetrics(number_of_models=1, number_of_features=5)
     db.session.add(ds_metrics)
     db.session.commit()
 
@@ -113,6 +113,46 @@ function hide_loading() {
     document.getElementById("loading").style.display = "none";
 }
 
+const PUBLICATION_STEPS = {
+    created: "Analyzing the feature models...",
+    analyzed: "Creating the deposition...",
+    deposited: "Uploading the feature models...",
+    files_uploaded: "Publishing the deposition...",
+    published: "Getting the DOI...",
+};
+
+function wait_for_publication(status_url) {
+    // The dataset exists already; follow its publication until it has a DOI or gives up
+    let loading = document.getElementById("loading");
+    let message = document.createElement('span');
+    loading.appendChild(message);
+
+    function poll() {
+        fetch(status_url)
+            .then(response => response.json())
+            .then(data => {
+                if (data.status === "pending") {
+                    message.textContent = " " + (PUBLICATION_STEPS[data.state] || "");
+                    setTimeout(poll, 2000);
+                    return;
+                }
+                if (data.status === "failed") {
+                    loading.style.display = "none";
+                    write_upload_error("the dataset was created but could not be published: " + data.error);
+                    setTimeout(() => window.location.href = "/dataset/list", 5000);
+                    return;
+                }
+                window.location.href = "/dataset/list";
+            })
+            .catch(error => {
+                console.error('Error polling the publication:', error);
+                setTimeout(poll, 5000);
+            });
+    }
+
+    poll();
+}
+
 function clean_upload_errors() {
     let upload_error = document.getElementById("upload_error");
     upload_error.innerHTML = "";
@@ -211,7 +251,7 @@ window.onload = function () {
                             console.log('Dataset sent successfully');
                             response.json().then(data => {
                                 console.log(data.message);
-                                window.location.href = "/dataset/list";
+                                wait_for_publication(data.status_url);
                             });
                         } else {
                             response.json().then(data => {
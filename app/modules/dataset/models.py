@@ -47,8 +47,11 @@ class Author(db.Model):
 
 class DSMetrics(db.Model):
     id = db.Column(db.Integer, primary_key=True)
-    number_of_models = db.Column(db.String(120))
-    number_of_features = db.Column(db.String(120))
+    number_of_models = db.Column(db.Integer, index=True)
+    number_of_features = db.Column(db.Integer, index=True)
+    number_of_constraints = db.Column(db.Integer, index=True)
+    max_depth = db.Column(db.Integer, index=True)
+    number_of_configurations = db.Column(db.Float(precision=53), index=True)
 
     def __repr__(self):
         return f'DSMetrics<models={self.number_of_models}, features={self.number_of_features}>'
@@ -84,6 +87,7 @@ class DataSet(db.Model):
 
     ds_meta_data = db.relationship('DSMetaData', backref=db.backref('data_set', uselist=False))
     feature_models = db.relationship('FeatureModel', backref='data_set', lazy=True, cascade="all, delete")
+    publication = db.relationship('DSPublication', uselist=False, backref='data_set', cascade="all, delete")
 
     def name(self):
         return self.ds_meta_data.title
@@ -92,8 +96,22 @@ class DataSet(db.Model):
         return [file for fm in self.feature_models for file in fm.files]
 
     def delete(self):
-        db.session.delete(self)
-        db.session.commit()
+        from app.modules.hubfile.services import HubfileBlobService
+
+        # Only files recorded as stored in the blob store hold a reference to it. The references are released
+        # in the transaction that deletes the dataset, and the blob files removed only once it is committed
+        blob_service = HubfileBlobService()
+        set_aside = []
+        try:
+            for checksum in [file.checksum for file in self.files() if file.blob_id is not None]:
+                blob_service.release(checksum, set_aside=set_aside)
+            db.session.delete(self)
+            db.session.commit()
+        except Exception:
+            db.session.rollback()
+            blob_service.restore(set_aside)
+            raise
+        blob_service.discard(set_aside)
 
     def get_cleaned_publication_type(self):
         return self.ds_meta_data.publication_type.name.replace('_', ' ').title()
@@ -141,6 +159,58 @@ class DataSet(db.Model):
         return f'DataSet<{self.id}>'
 
 
+class DSPublication(db.Model):
+    """
+    Progress of the analysis and publication of a dataset to Zenodo/Fakenodo, advanced one step at a time by
+    the worker: created -> analyzed -> deposited -> files_uploaded -> published -> doi_synced. ``state`` is
+    the last step completed. A failed step is retried later with backoff; after too many attempts
+    ``failed_at`` is set and the publication waits to be retried by hand. ``locked_until`` is the lease of
+    the worker running a step: once it expires (the worker died) another worker resumes from ``state``.
+    """
+    __tablename__ = 'ds_publication'
+    id = db.Column(db.Integer, primary_key=True)
+    dataset_id = db.Column(db.Integer, db.ForeignKey('data_set.id'), nullable=False, unique=True)
+    state = db.Column(db.String(20), nullable=False, default='created', index=True)
+    attempts = db.Column(db.Integer, nullable=False, default=0)
+    error = db.Column(db.Text)
+    next_attempt_at = db.Column(db.DateTime)
+    locked_until = db.Column(db.DateTime)
+    failed_at = db.Column(db.DateTime)
+    created_at = db.Column(db.DateTime, nullable=False, default=datetime.utcnow)
+    updated_at = db.Column(db.DateTime, nullable=False, default=datetime.utcnow, onupdate=datetime.utcnow)
+
+    CREATED = 'created'
+    ANALYZED = 'analyzed'
+    DEPOSITED = 'deposited'
+    FILES_UPLOADED = 'files_uploaded'
+    PUBLISHED = 'published'
+    DOI_SYNCED = 'doi_synced'
+    STATES = (CREATED, ANALYZED, DEPOSITED, FILES_UPLOADED, PUBLISHED, DOI_SYNCED)
+
+    @property
+    def status(self):
+        if self.state == self.DOI_SYNCED:
+            return 'done'
+        return 'failed' if self.failed_at else 'pending'
+
+    def to_dict(self):
+        return {
+            'dataset_id': self.dataset_id,
+            'state': self.state,
+            'status': self.status,
+            'step': self.STATES.index(self.state),
+            'steps': len(self.STATES) - 1,
+            'attempts': self.attempts,
+            'error': self.error,
+            'next_attempt_at': self.next_attempt_at,
+            'dataset_doi': self.data_set.ds_meta_data.dataset_doi,
+            'updated_at': self.updated_at,
+        }
+
+    def __repr__(self):
+        return f'DSPublication<{self.dataset_id}, {self.state}>'
+
+
 class DSDownloadRecord(db.Model):
     id = db.Column(db.Integer, primary_key=True)
     user_id = db.Column(db.Integer, db.ForeignKey('user.id'), nullable=True)
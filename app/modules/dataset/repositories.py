@@ -3,13 +3,15 @@ import logging
 from flask_login import current_user
 from typing import Optional
 
-from sqlalchemy import desc, func
+from sqlalchemy import desc, func, insert, or_
 
 from app.modules.dataset.models import (
     Author,
     DOIMapping,
     DSDownloadRecord,
     DSMetaData,
+    DSMetrics,
+    DSPublication,
     DSViewRecord,
     DataSet,
     DSRating
@@ -32,6 +34,26 @@ class DSDownloadRecordRepository(BaseRepository):
         max_id = self.model.query.with_entities(func.max(self.model.id)).scalar()
         return max_id if max_id is not None else 0
 
+    def create_missing(self, dataset_ids: list, user_id: Optional[int], download_cookie: str,
+                       download_date: datetime) -> int:
+        """Insert, in one statement, a record for every dataset not yet downloaded with this user and cookie."""
+        recorded = {
+            dataset_id for (dataset_id,) in self.session.query(self.model.dataset_id).filter(
+                self.model.user_id.is_(user_id) if user_id is None else self.model.user_id == user_id,
+                self.model.download_cookie == download_cookie,
+                self.model.dataset_id.in_(dataset_ids),
+            )
+        }
+        rows = [
+            {"user_id": user_id, "dataset_id": dataset_id, "download_date": download_date,
+             "download_cookie": download_cookie}
+            for dataset_id in dict.fromkeys(dataset_ids) if dataset_id not in recorded
+        ]
+        if rows:
+            self.session.execute(insert(self.model), rows)
+            self.session.commit()
+        return len(rows)
+
 
 class DSMetaDataRepository(BaseRepository):
     def __init__(self):
@@ -41,6 +63,11 @@ class DSMetaDataRepository(BaseRepository):
         return self.model.query.filter_by(dataset_doi=doi).first()
 
 
+class DSMetricsRepository(BaseRepository):
+    def __init__(self):
+        super().__init__(DSMetrics)
+
+
 class DSViewRecordRepository(BaseRepository):
     def __init__(self):
         super().__init__(DSViewRecord)
@@ -106,6 +133,22 @@ class DataSetRepository(BaseRepository):
             .count()
         )
 
+    def get_by_ids(self, dataset_ids: list) -> list:
+        by_id = {dataset.id: dataset for dataset in self.model.query.filter(self.model.id.in_(dataset_ids))}
+        return [by_id[dataset_id] for dataset_id in dict.fromkeys(dataset_ids) if dataset_id in by_id]
+
+    def get_batch_after(self, last_id: int, limit: int, missing_metrics_only: bool = False) -> list:
+        """Datasets with an id over ``last_id``, in id order, optionally only those without computed metrics."""
+        query = self.model.query.filter(DataSet.id > last_id)
+        if missing_metrics_only:
+            # Metrics only set by hand (e.g. seeders) have no constraint count
+            query = (
+                query.join(DSMetaData)
+                .outerjoin(DSMetrics, DSMetaData.ds_metrics_id == DSMetrics.id)
+                .filter(or_(DSMetrics.id.is_(None), DSMetrics.number_of_constraints.is_(None)))
+            )
+        return query.order_by(DataSet.id).limit(limit).all()
+
     def latest_synchronized(self):
         return (
             self.model.query.join(DSMetaData)
@@ -124,6 +167,32 @@ class DOIMappingRepository(BaseRepository):
         return self.model.query.filter_by(dataset_doi_old=old_doi).first()
 
 
+class DSPublicationRepository(BaseRepository):
+    def __init__(self):
+        super().__init__(DSPublication)
+
+    def get_by_dataset_id(self, dataset_id: int) -> Optional[DSPublication]:
+        return self.model.query.filter_by(dataset_id=dataset_id).first()
+
+    def claim_next(self, now: datetime) -> Optional[DSPublication]:
+        """
+        Lock the oldest publication with a step due: not finished, not given up, not waiting for a retry and
+        not leased by another worker. The caller must commit to release the lock.
+        """
+        return (
+            self.model.query
+            .filter(
+                self.model.state != DSPublication.DOI_SYNCED,
+                self.model.failed_at.is_(None),
+                or_(self.model.next_attempt_at.is_(None), self.model.next_attempt_at <= now),
+                or_(self.model.locked_until.is_(None), self.model.locked_until < now),
+            )
+            .order_by(self.model.id.asc())
+            .with_for_update(skip_locked=True)
+            .first()
+        )
+
+
 class DSRatingRepository(BaseRepository):
     def __init__(self):
         super().__init__(DSRating)
@@ -1,17 +1,11 @@
-import json
 import logging
 import os
-import shutil
-import tempfile
 import uuid
-import io
-import zipfile
 from datetime import datetime, timezone
-from zipfile import ZipFile
 
 
-from flask import (abort, jsonify, make_response, render_template, send_file,
-                   request, send_from_directory, url_for, flash, redirect)
+from flask import (Response, abort, jsonify, make_response, render_template,
+                   request, url_for, flash, redirect)
 from flask_login import current_user, login_required
 from app.modules.dataset import dataset_bp
 from app.modules.dataset.forms import DataSetForm
@@ -23,24 +17,35 @@ from app.modules.dataset.services import (
     DSViewRecordService,
     DataSetService,
     DOIMappingService,
-    DSRatingService
+    DSRatingService,
+    DSPublicationService,
+    ArchiveTooLarge,
+    UploadError,
+    ChunkedUploadService,
+    ZipUploadService,
+    BULK_DOWNLOAD_MAX_DATASETS,
+    dataset_archive_cache,
 )
-from app.modules.fakenodo.services import FakenodoService
+from app.modules.explore.services import ExploreService
 from app.modules.dataset.forms import EditDatasetForm
 from werkzeug.exceptions import NotFound
 from app.modules.hubfile.services import HubfileService
-from flamapy.metamodels.fm_metamodel.transformations import UVLReader, GlencoeWriter, SPLOTWriter, UVLWriter
-from flamapy.metamodels.pysat_metamodel.transformations import FmToPysat, DimacsWriter
-from app.modules.zenodo.services import ZenodoService
+from app.modules.flamapy.executor import ExecutorSaturated, OperationTimeout
+from app.modules.flamapy.routes import saturated_response
+from app.modules.flamapy.services import CONVERSIONS, FlamapyService
 from core.configuration.configuration import USE_FAKENODE
+from core.streaming.file_response import deliver_file
+from core.streaming.zip_stream import stream_zip
 
 logger = logging.getLogger(__name__)
 
 
 dataset_service = DataSetService()
+chunked_upload_service = ChunkedUploadService()
+zip_upload_service = ZipUploadService(dataset_service)
 author_service = AuthorService()
 dsmetadata_service = DSMetaDataService()
-nodo_service = FakenodoService() if USE_FAKENODE else ZenodoService()
+publication_service = DSPublicationService()
 doi_mapping_service = DOIMappingService()
 ds_view_record_service = DSViewRecordService()
 ds_rating_service = DSRatingService()
@@ -58,58 +63,48 @@ def create_dataset():
             return jsonify({"message": form.errors}), 400
 
         try:
+            # Only the local dataset is created here; the worker publishes it to Zenodo/Fakenodo
             logger.info("Creating dataset...")
             dataset = dataset_service.create_from_form(form=form, current_user=current_user)
             logger.info(f"Created dataset: {dataset}")
             dataset_service.move_feature_models(dataset)
+            publication_service.enqueue(dataset)
         except Exception as exc:
             logger.exception(f"Exception while create dataset data in local {exc}")
             return jsonify({"Exception while create dataset data in local: ": str(exc)}), 400
 
-        # send dataset as deposition to Zenodo/Fakenodo
-        data = {}
-        actualNode = "Fakenodo" if USE_FAKENODE else "Zenodo"
-        try:
-            nodo_response_json = nodo_service.create_new_deposition(dataset.ds_meta_data)
-            response_data = json.dumps(nodo_response_json)
-            data = json.loads(response_data)
-        except Exception as exc:
-            data = {}
-            nodo_response_json = {}
-            logger.exception(f"Exception while create dataset data in {actualNode} {exc}")
-
-        deposition_id = data.get("id")
-        if deposition_id:
-            print("DEPOSITION")
-            print(deposition_id)
+        # Delete the temp files, but not the chunked uploads other tabs may still be sending
+        dataset_service.clear_temp_folder(current_user.temp_folder())
 
-            # update dataset with deposition id in Zenodo/Fakenodo
-            dataset_service.update_dsmetadata(dataset.ds_meta_data_id, deposition_id=deposition_id)
+        return jsonify({
+            "message": "Dataset created, it is being published",
+            "dataset_id": dataset.id,
+            "status_url": url_for("dataset.publication_status", dataset_id=dataset.id),
+        }), 200
 
-            try:
-                # iterate for each feature model (one feature model = one request to Zenodo/Fakenodo)
-                for feature_model in dataset.feature_models:
-                    nodo_service.upload_file(dataset, deposition_id, feature_model)
-
-                # publish deposition
-                nodo_service.publish_deposition(deposition_id)
+    return render_template("dataset/upload_dataset.html", form=form, use_fakenodo=USE_FAKENODE)
 
-                # update DOI
-                deposition_doi = nodo_service.get_doi(deposition_id)
-                dataset_service.update_dsmetadata(dataset.ds_meta_data_id, dataset_doi=deposition_doi)
-            except Exception as e:
-                msg = f"it has not been possible upload feature models in {actualNode} and update the DOI: {e}"
-                return jsonify({"message": msg}), 200
 
-        # Delete temp folder
-        file_path = current_user.temp_folder()
-        if os.path.exists(file_path) and os.path.isdir(file_path):
-            shutil.rmtree(file_path)
+@dataset_bp.route("/dataset/<int:dataset_id>/publication", methods=["GET"])
+@login_required
+def publication_status(dataset_id):
+    """Progress of the dataset's publication to Zenodo/Fakenodo, polled by the upload page."""
+    dataset = dataset_service.get_or_404(dataset_id)
+    if dataset.user_id != current_user.id:
+        abort(404)
+    return jsonify(publication_service.get_status(dataset)), 200
 
-        msg = "Everything works!"
-        return jsonify({"message": msg}), 200
 
-    return render_template("dataset/upload_dataset.html", form=form, use_fakenodo=USE_FAKENODE)
+@dataset_bp.route("/dataset/<int:dataset_id>/publication/retry", methods=["POST"])
+@login_required
+def publication_retry(dataset_id):
+    """Resume a publication that gave up after too many failed attempts."""
+    dataset = dataset_service.get_or_404(dataset_id)
+    if dataset.user_id != current_user.id or dataset.publication is None:
+        abort(404)
+    if dataset.publication.status != "failed":
+        return jsonify({"message": "The publication has not failed"}), 409
+    return jsonify(publication_service.retry(dataset.publication).to_dict()), 200
 
 
 @dataset_bp.route("/dataset/list", methods=["GET", "POST"])
@@ -144,37 +139,148 @@ def upload():
     if not os.path.exists(temp_folder):
         os.makedirs(temp_folder)
 
-    file_path = os.path.join(temp_folder, file.filename)
-
-    if os.path.exists(file_path):
-        # Generate unique filename (by recursion)
-        base_name, extension = os.path.splitext(file.filename)
-        i = 1
-        while os.path.exists(
-            os.path.join(temp_folder, f"{base_name} ({i}){extension}")
-        ):
-            i += 1
-        new_filename = f"{base_name} ({i}){extension}"
-        file_path = os.path.join(temp_folder, new_filename)
-    else:
-        new_filename = file.filename
+    file_path, new_filename = dataset_service.unique_upload_path(temp_folder, file.filename)
+
+    try:
+        # Hashed while it is written, the digests go to the upload analysis for the later stages
+        digests = dataset_service.save_upload(file, file_path)
+    except Exception as e:
+        dataset_service.delete_upload(file_path)
+        return jsonify({"message": str(e)}), 500
 
+    return analyzed_upload_response(file_path, new_filename, digests)
+
+
+def analyzed_upload_response(file_path, filename, digests):
+    """Validate and measure an uploaded file; invalid files are removed."""
     try:
-        file.save(file_path)
+        analysis = dataset_service.analyze_upload(file_path, digests)
+    except ExecutorSaturated as e:
+        dataset_service.delete_upload(file_path)
+        return saturated_response(e)
+    except OperationTimeout as e:
+        dataset_service.delete_upload(file_path)
+        return jsonify({"message": f"The file could not be validated: {e}", "filename": filename}), 504
     except Exception as e:
+        dataset_service.delete_upload(file_path)
         return jsonify({"message": str(e)}), 500
 
+    if not analysis["is_valid"]:
+        dataset_service.delete_upload(file_path)
+        return jsonify({"message": "UVL not valid", "filename": filename, "errors": analysis["errors"]}), 400
+
     return (
         jsonify(
             {
                 "message": "UVL uploaded and validated successfully",
-                "filename": new_filename,
+                "filename": filename,
+                "metrics": {
+                    "number_of_features": analysis["number_of_features"],
+                    "number_of_constraints": analysis["number_of_constraints"],
+                    "cross_tree_constraints_ratio": analysis["cross_tree_constraints_ratio"],
+                    "depth": analysis["depth"],
+                },
             }
         ),
         200,
     )
 
 
+@dataset_bp.route("/dataset/file/upload/zip", methods=["POST"])
+@login_required
+def upload_zip():
+    """
+    Upload a zip archive of UVL files. Its UVL entries are extracted to the temp folder and validated; the
+    answer reports every entry, and the valid files can be added to the dataset like single uploads.
+    """
+    file = request.files.get("file")
+    if not file or not file.filename.lower().endswith(".zip"):
+        return jsonify({"message": "No valid file"}), 400
+
+    try:
+        report = zip_upload_service.upload(current_user.temp_folder(), file.stream)
+    except UploadError as e:
+        return jsonify({"message": str(e)}), e.status
+    except ExecutorSaturated as e:
+        return saturated_response(e)
+
+    report["message"] = f"{report['valid']} valid UVL files extracted, {report['invalid']} invalid, " \
+                        f"{report['not_validated']} not validated in time and " \
+                        f"{len(report['rejected'])} other entries rejected"
+    return jsonify(report), 200
+
+
+@dataset_bp.route("/dataset/file/upload/init", methods=["POST"])
+@login_required
+def upload_init():
+    """
+    Start a chunked upload. The JSON body gives the ``filename`` and its ``size`` in bytes; the answer
+    carries the ``upload_id``, the ``chunk_size`` and the number of ``chunks`` to send.
+    """
+    data = request.get_json(silent=True) or {}
+    try:
+        upload = chunked_upload_service.init(current_user.temp_folder(), data.get("filename"), data.get("size"))
+    except UploadError as e:
+        return jsonify({"message": str(e)}), e.status
+    return jsonify(upload), 201
+
+
+@dataset_bp.route("/dataset/file/upload/<upload_id>", methods=["GET"])
+@login_required
+def upload_status(upload_id):
+    """The chunks stored so far and those still missing, to resume an interrupted upload."""
+    try:
+        return jsonify(chunked_upload_service.status(current_user.temp_folder(), upload_id)), 200
+    except UploadError as e:
+        return jsonify({"message": str(e)}), e.status
+
+
+@dataset_bp.route("/dataset/file/upload/<upload_id>/<int:index>", methods=["PUT"])
+@login_required
+def upload_chunk(upload_id, index):
+    """
+    Store chunk ``index``. The body is the raw bytes and ``Content-Range: bytes <start>-<end>/<size>`` gives
+    their offset (``?offset=<start>`` is accepted too). A chunk already stored is not written again.
+    """
+    content_range = request.headers.get("Content-Range")
+    try:
+        if content_range:
+            units, _, spec = content_range.partition(" ")
+            if units != "bytes":
+                raise ValueError(content_range)
+            offset = int(spec.partition("-")[0])
+        else:
+            offset = int(request.args["offset"])
+    except (KeyError, ValueError):
+        return jsonify({"message": "The chunk offset is missing or malformed"}), 400
+
+    try:
+        stored = chunked_upload_service.put_chunk(current_user.temp_folder(), upload_id, index, offset,
+                                                  request.stream)
+    except UploadError as e:
+        return jsonify({"message": str(e)}), e.status
+    return jsonify({"upload_id": upload_id, "index": index, "stored": stored}), 201 if stored else 200
+
+
+@dataset_bp.route("/dataset/file/upload/<upload_id>/finalize", methods=["POST"])
+@login_required
+def upload_finalize(upload_id):
+    """
+    Join the chunks and check the ``checksum`` (MD5 or SHA-256) sent in the JSON body. The file is then
+    validated like a single-request upload, with the same answer.
+    """
+    data = request.get_json(silent=True) or {}
+    temp_folder = current_user.temp_folder()
+    try:
+        filename = chunked_upload_service.status(temp_folder, upload_id)["filename"]
+        file_path, new_filename = dataset_service.unique_upload_path(temp_folder, filename)
+        digests = chunked_upload_service.finalize(temp_folder, upload_id, data.get("checksum"), file_path)
+    except UploadError as e:
+        return jsonify({"message": str(e)}), e.status
+
+    return analyzed_upload_response(file_path, new_filename, digests)
+
+
 @dataset_bp.route("/dataset/file/delete", methods=["POST"])
 def delete():
     data = request.get_json()
@@ -182,8 +288,7 @@ def delete():
     temp_folder = current_user.temp_folder()
     filepath = os.path.join(temp_folder, filename)
 
-    if os.path.exists(filepath):
-        os.remove(filepath)
+    if dataset_service.delete_upload(filepath):
         return jsonify({"message": "File deleted successfully"})
 
     return jsonify({"error": "Error: File not found"})
@@ -193,24 +298,27 @@ def delete():
 def download_dataset(dataset_id):
     dataset = dataset_service.get_or_404(dataset_id)
 
-    file_path = f"uploads/user_{dataset.user_id}/dataset_{dataset.id}/"
-
-    temp_dir = tempfile.mkdtemp()
-    zip_path = os.path.join(temp_dir, f"dataset_{dataset_id}.zip")
-
-    with ZipFile(zip_path, "w") as zipf:
-        for subdir, dirs, files in os.walk(file_path):
-            for file in files:
-                full_path = os.path.join(subdir, file)
-
-                relative_path = os.path.relpath(full_path, file_path)
-
-                zipf.write(
-                    full_path,
-                    arcname=os.path.join(
-                        os.path.basename(zip_path[:-4]), relative_path
-                    ),
-                )
+    # The archive only changes with the checksums of the files, so its cache key is a strong validator
+    archive_key = dataset_archive_cache.key(dataset)
+    if request.if_none_match.contains(archive_key):
+        resp = Response(status=304)
+        resp.set_etag(archive_key)
+        return resp
+
+    archive_path = dataset_archive_cache.get_path(archive_key)
+    if archive_path is not None:
+        resp = deliver_file(archive_path, mimetype="application/zip", download_name=f"dataset_{dataset_id}.zip",
+                            etag=archive_key)
+    else:
+        # Built while it is sent (the first bytes go out right away) and stored for the next downloads. The
+        # entries are listed now: the body is streamed after the request, once its database session is gone
+        entries = list(dataset_service.archive_entries(dataset))
+        resp = Response(
+            dataset_archive_cache.stream(archive_key, entries),
+            mimetype="application/zip",
+            headers={"Content-Disposition": f"attachment; filename=dataset_{dataset_id}.zip"},
+        )
+        resp.set_etag(archive_key)
 
     user_cookie = request.cookies.get("download_cookie")
     if not user_cookie:
@@ -218,22 +326,7 @@ def download_dataset(dataset_id):
             uuid.uuid4()
         )  # Generate a new unique identifier if it does not exist
         # Save the cookie to the user's browser
-        resp = make_response(
-            send_from_directory(
-                temp_dir,
-                f"dataset_{dataset_id}.zip",
-                as_attachment=True,
-                mimetype="application/zip",
-            )
-        )
         resp.set_cookie("download_cookie", user_cookie)
-    else:
-        resp = send_from_directory(
-            temp_dir,
-            f"dataset_{dataset_id}.zip",
-            as_attachment=True,
-            mimetype="application/zip",
-        )
 
     # Check if the download record already exists for this cookie
     existing_record = DSDownloadRecord.query.filter_by(
@@ -254,75 +347,100 @@ def download_dataset(dataset_id):
     return resp
 
 
-def generate_glencoe_file(file_id):
-    temp_file = tempfile.NamedTemporaryFile(suffix='.json', delete=False)
+@dataset_bp.route("/dataset/download/bulk", methods=["POST"])
+def download_bulk():
+    """
+    Download several datasets as one streamed zip, a ``dataset_<id>/`` folder each. The JSON body gives
+    either ``dataset_ids`` or ``explore``, the same criteria the explore page sends.
+    """
+    data = request.get_json(silent=True) or {}
+    dataset_ids = data.get("dataset_ids")
+    criteria = data.get("explore")
+
+    if dataset_ids is not None:
+        if not isinstance(dataset_ids, list) or not all(isinstance(dataset_id, int) for dataset_id in dataset_ids):
+            return jsonify({"error": "'dataset_ids' must be a list of integers"}), 400
+        datasets = dataset_service.get_by_ids(dataset_ids)
+        missing = sorted(set(dataset_ids) - {dataset.id for dataset in datasets})
+        if missing:
+            return jsonify({"error": "Datasets not found", "dataset_ids": missing}), 404
+    elif isinstance(criteria, dict):
+        criteria.setdefault("query", "")
+        try:
+            # The joins of the explore query can repeat a dataset
+            datasets = list(dict.fromkeys(ExploreService().filter(**criteria)))
+        except (TypeError, AttributeError, ValueError) as e:
+            return jsonify({"error": f"Invalid explore query: {e}"}), 400
+    else:
+        return jsonify({"error": "Send either 'dataset_ids' or an 'explore' query"}), 400
+
+    if not datasets:
+        return jsonify({"error": "No datasets to download"}), 400
+    if len(datasets) > BULK_DOWNLOAD_MAX_DATASETS:
+        return jsonify({"error": f"At most {BULK_DOWNLOAD_MAX_DATASETS} datasets can be downloaded at once"}), 400
+
     try:
-        hubfile = HubfileService().get_or_404(file_id)
-        file_name = hubfile.name
-        directory_path = "app/modules/dataset/uvl_examples"
-        file_path = os.path.join(directory_path, file_name)
+        entries = dataset_service.bulk_archive_entries(datasets)
+    except ArchiveTooLarge as e:
+        return jsonify({"error": str(e), "size": e.size, "max_bytes": e.max_bytes}), 413
+
+    resp = Response(
+        stream_zip(entries),
+        mimetype="application/zip",
+        headers={"Content-Disposition": f"attachment; filename=datasets_{len(datasets)}.zip"},
+    )
 
-        if not os.path.isfile(file_path):
-            raise NotFound(f"File {file_name} not found")
+    user_cookie = request.cookies.get("download_cookie")
+    if not user_cookie:
+        user_cookie = str(uuid.uuid4())
+        resp.set_cookie("download_cookie", user_cookie)
+
+    DSDownloadRecordService().record_downloads(
+        [dataset.id for dataset in datasets],
+        user_id=current_user.id if current_user.is_authenticated else None,
+        download_cookie=user_cookie,
+    )
+
+    return resp
+
+
+def generate_artifact(file_id, target_format):
+    """Return the path of the converted file, stored in (or served from) the conversion artifact store."""
+    hubfile = HubfileService().get_or_404(file_id)
+    file_name = hubfile.name
+    directory_path = "app/modules/dataset/uvl_examples"
+    file_path = os.path.join(directory_path, file_name)
+
+    if not os.path.isfile(file_path):
+        raise NotFound(f"File {file_name} not found")
 
-        fm1 = UVLReader(file_path).transform()
-        GlencoeWriter(temp_file.name, fm1).transform()
-        return temp_file.name  # Retorna la ruta del archivo generado
+    return FlamapyService().get_artifact(file_path, target_format, hubfile.checksum)
+
+
+def generate_glencoe_file(file_id):
+    try:
+        return generate_artifact(file_id, "glencoe")
     except Exception as e:
         raise RuntimeError(f"Error generating Glencoe file: {e}")
 
 
 def generate_splot_file(file_id):
-    temp_file = tempfile.NamedTemporaryFile(suffix='.splx', delete=False)
     try:
-        hubfile = HubfileService().get_by_id(file_id)
-        file_name = hubfile.name
-        directory_path = "app/modules/dataset/uvl_examples"
-        file_path = os.path.join(directory_path, file_name)
-
-        if not os.path.isfile(file_path):
-            raise NotFound(f"File {file_name} not found")
-
-        fm = UVLReader(file_path).transform()
-        SPLOTWriter(temp_file.name, fm).transform()
-        return temp_file.name  # Retorna la ruta del archivo generado
+        return generate_artifact(file_id, "splot")
     except Exception as e:
         raise RuntimeError(f"Error generating SPLOT file: {e}")
 
 
 def generate_cnf_file(file_id):
-    temp_file = tempfile.NamedTemporaryFile(suffix='.cnf', delete=False)
     try:
-        hubfile = HubfileService().get_by_id(file_id)
-        file_name = hubfile.name
-        directory_path = "app/modules/dataset/uvl_examples"
-        file_path = os.path.join(directory_path, file_name)
-
-        if not os.path.isfile(file_path):
-            raise NotFound(f"File {file_name} not found")
-
-        fm = UVLReader(file_path).transform()
-        sat = FmToPysat(fm).transform()
-        DimacsWriter(temp_file.name, sat).transform()
-        return temp_file.name  # Retorna la ruta del archivo generado
+        return generate_artifact(file_id, "dimacs")
     except Exception as e:
         raise RuntimeError(f"Error generating DIMACS file: {e}")
 
 
 def generate_uvl_file(file_id):
-    temp_file = tempfile.NamedTemporaryFile(suffix='.uvl', delete=False)
     try:
-        hubfile = HubfileService().get_by_id(file_id)
-        file_name = hubfile.name
-        directory_path = "app/modules/dataset/uvl_examples"
-        file_path = os.path.join(directory_path, file_name)
-
-        if not os.path.isfile(file_path):
-            raise NotFound(f"File {file_name} not found")
-
-        fm = UVLReader(file_path).transform()
-        UVLWriter(temp_file.name, fm).transform()
-        return temp_file.name  # Retorna la ruta del archivo generado
+        return generate_artifact(file_id, "uvl")
     except Exception as e:
         raise RuntimeError(f"Error generating UVL file: {e}")
 
@@ -330,38 +448,27 @@ def generate_uvl_file(file_id):
 @dataset_bp.route('/download_all/<int:file_id>')
 def download_all_formats(file_id):
     try:
-        # Generar los archivos
-        uvl_path = generate_uvl_file(file_id)
-        glencoe_path = generate_glencoe_file(file_id)
-        dimacs_path = generate_cnf_file(file_id)
-        splot_path = generate_splot_file(file_id)
-
-        # Crear un archivo ZIP en memoria
-        memory_file = io.BytesIO()
-        with zipfile.ZipFile(memory_file, 'w') as zf:
-            zf.write(uvl_path, os.path.basename(uvl_path))
-            zf.write(glencoe_path, os.path.basename(glencoe_path))
-            zf.write(dimacs_path, os.path.basename(dimacs_path))
-            zf.write(splot_path, os.path.basename(splot_path))
-
-        memory_file.seek(0)
-
-        # Eliminar archivos temporales
-        os.remove(uvl_path)
-        os.remove(glencoe_path)
-        os.remove(dimacs_path)
-        os.remove(splot_path)
-
-        # Devolver archivo ZIP como respuesta
-        return send_file(
-            memory_file,
-            mimetype='application/zip',
-            as_attachment=True,
-            download_name=f"files_{file_id}.zip"
-        )
+        hubfile = HubfileService().get_or_404(file_id)
+        file_path = os.path.join("app/modules/dataset/uvl_examples", hubfile.name)
+        if not os.path.isfile(file_path):
+            raise NotFound(f"File {hubfile.name} not found")
+
+        # Parsed once, converted concurrently; the artifacts are reused, they must not be removed
+        artifacts = FlamapyService().get_artifacts(file_path, ("uvl", "glencoe", "dimacs", "splot"), hubfile.checksum)
+        entries = [
+            (f"{hubfile.name}_{target_format}{CONVERSIONS[target_format][0]}", artifact_path)
+            for target_format, artifact_path in artifacts.items()
+        ]
     except Exception as e:
         return jsonify({'error': str(e)}), 500
 
+    # Zipped while it is sent
+    return Response(
+        stream_zip(entries),
+        mimetype='application/zip',
+        headers={"Content-Disposition": f"attachment; filename=files_{file_id}.zip"},
+    )
+
 
 @dataset_bp.route("/doi/<path:doi>/", methods=["GET"])
 def subdomain_index(doi):
@@ -1,41 +1,250 @@
+import json
 import logging
 import os
 import hashlib
+import re
 import shutil
+import sys
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timedelta, timezone
 from typing import Optional
 import uuid
+import zipfile
+import zlib
 from app import db
 
 from flask import request
 
 from app.modules.auth.services import AuthenticationService
-from app.modules.dataset.models import DSViewRecord, DataSet, DSMetaData, DSRating
+from app.modules.dataset.models import DSPublication, DSViewRecord, DataSet, DSMetaData, DSMetrics, DSRating
 from app.modules.dataset.repositories import (
     AuthorRepository,
     DOIMappingRepository,
     DSDownloadRecordRepository,
     DSMetaDataRepository,
+    DSMetricsRepository,
+    DSPublicationRepository,
     DSViewRecordRepository,
     DataSetRepository,
     DSRatingRepository,
 )
+from app.modules.fakenodo.services import FakenodoService
 from app.modules.featuremodel.repositories import FMMetaDataRepository, FeatureModelRepository
+from app.modules.featuremodel.services import STRUCTURAL_METRICS, FMMetricsService
+from app.modules.flamapy.executor import (ExecutorSaturated, OperationTimeout, get_executor, structural_metrics_task,
+                                          validate_task)
 from app.modules.hubfile.repositories import (
     HubfileDownloadRecordRepository,
     HubfileRepository,
     HubfileViewRecordRepository
 )
+from app.modules.hubfile.services import HubfileBlobService, HubfileService
+from app.modules.zenodo.services import ZenodoService
+from core.cache.lru_cache import DiskLRUCache
+from core.configuration.configuration import USE_FAKENODE, cache_folder_path
 from core.services.BaseService import BaseService
+from core.streaming.zip_stream import stream_zip
 
 logger = logging.getLogger(__name__)
 
+# Upload-time analysis of a file in the temp folder is stored next to it, in "<file>.analysis.json"
+UPLOAD_ANALYSIS_SUFFIX = ".analysis.json"
+# Seconds the upload endpoint may spend on validation and metrics before leaving the metrics for later
+UPLOAD_ANALYSIS_BUDGET = float(os.getenv("UVL_UPLOAD_ANALYSIS_BUDGET", 5))
+# Seconds the grammar check of a file whose metrics did not fit in the budget may take
+UPLOAD_VALIDATION_TIMEOUT = float(os.getenv("UVL_UPLOAD_VALIDATION_TIMEOUT", 10))
+UPLOAD_CHUNK_SIZE = 64 * 1024
+# Limits of a single bulk download
+BULK_DOWNLOAD_MAX_DATASETS = int(os.getenv("BULK_DOWNLOAD_MAX_DATASETS", 100))
+BULK_DOWNLOAD_MAX_BYTES = int(os.getenv("BULK_DOWNLOAD_MAX_BYTES", 1024 * 1024 * 1024))
+
+
+# Publication pipeline: attempts of a step before giving up, first retry delay (doubled on every attempt)
+# and how long a worker may run a step before another one takes the publication over
+PUBLICATION_MAX_ATTEMPTS = int(os.getenv("PUBLICATION_MAX_ATTEMPTS", 6))
+PUBLICATION_RETRY_BACKOFF = float(os.getenv("PUBLICATION_RETRY_BACKOFF", 30))
+PUBLICATION_LEASE_SECONDS = float(os.getenv("PUBLICATION_LEASE_SECONDS", 900))
+
+# Chunked uploads: size of every chunk but the last one, and largest file accepted
+UPLOAD_CHUNK_BYTES = int(os.getenv("UPLOAD_CHUNK_BYTES", 5 * 1024 * 1024))
+UPLOAD_MAX_BYTES = int(os.getenv("UPLOAD_MAX_BYTES", 1024 * 1024 * 1024))
+# Seconds without a new chunk after which a chunked upload is considered abandoned and removed
+UPLOAD_CHUNKED_TTL = float(os.getenv("UPLOAD_CHUNKED_TTL", 24 * 60 * 60))
+UPLOAD_EXTENSIONS = (".uvl",)
+# Zip uploads: most entries and most uncompressed bytes extracted from one archive
+UPLOAD_ZIP_MAX_ENTRIES = int(os.getenv("UPLOAD_ZIP_MAX_ENTRIES", 500))
+UPLOAD_ZIP_MAX_BYTES = int(os.getenv("UPLOAD_ZIP_MAX_BYTES", 256 * 1024 * 1024))
+
+
+class UploadError(Exception):
+    """Raised when an upload request cannot be accepted; ``status`` is the HTTP status to answer."""
+
+    def __init__(self, message: str, status: int = 400):
+        super().__init__(message)
+        self.status = status
+
+
+class ArchiveTooLarge(Exception):
+    """Raised when the files of a bulk download add up to more than the allowed bytes."""
+
+    def __init__(self, size: int, max_bytes: int):
+        super().__init__(f"The selected datasets add up to {size} bytes, the limit is {max_bytes}")
+        self.size = size
+        self.max_bytes = max_bytes
+
 
 def calculate_checksum_and_size(file_path):
-    file_size = os.path.getsize(file_path)
+    digests = calculate_digests(file_path)
+    return digests["checksum"], digests["size"]
+
+
+def calculate_digests(file_path) -> dict:
+    """MD5 (``checksum``), SHA-256 and size of a file, read chunk by chunk."""
     with open(file_path, "rb") as file:
-        content = file.read()
-        hash_md5 = hashlib.md5(content).hexdigest()
-        return hash_md5, file_size
+        return copy_with_digests(file, None)
+
+
+def copy_with_digests(source, target, chunk_size: int = UPLOAD_CHUNK_SIZE) -> dict:
+    """
+    Copy ``source`` to ``target`` (when given) chunk by chunk, hashing on the way, so the contents are read
+    once and never held in memory as a whole.
+
+    Returns:
+        dict: ``checksum`` (MD5, the checksum hubfiles store), ``sha256`` and ``size``.
+    """
+    md5, sha256, size = hashlib.md5(), hashlib.sha256(), 0
+    for chunk in iter(lambda: source.read(chunk_size), b""):
+        md5.update(chunk)
+        sha256.update(chunk)
+        size += len(chunk)
+        if target is not None:
+            target.write(chunk)
+    return {"checksum": md5.hexdigest(), "sha256": sha256.hexdigest(), "size": size}
+
+
+class _LimitedReader:
+    """Reads at most ``limit`` bytes of ``stream``."""
+
+    def __init__(self, stream, limit: int):
+        self.stream = stream
+        self.remaining = limit
+
+    def read(self, size: int) -> bytes:
+        data = self.stream.read(min(size, self.remaining)) if self.remaining > 0 else b""
+        self.remaining -= len(data)
+        return data
+
+
+class _JoinedFiles:
+    """Reads several files one after the other, as if they were one. Use it as a context manager."""
+
+    def __init__(self, paths: list):
+        self.paths = list(paths)
+        self.current = None
+
+    def read(self, size: int) -> bytes:
+        while True:
+            if self.current is None:
+                if not self.paths:
+                    return b""
+                self.current = open(self.paths.pop(0), "rb")
+            data = self.current.read(size)
+            if data:
+                return data
+            self.close()
+
+    def close(self):
+        if self.current is not None:
+            self.current.close()
+            self.current = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+
+class DatasetArchiveCache:
+    """
+    Zip archives of datasets on disk, keyed by the dataset id plus a digest of the checksums of its files:
+    an archive is built once and a change in the files yields a new key (and a rebuild). The key doubles as
+    the strong ETag of the archive. The directory is trimmed by least recent use over its byte budget.
+    """
+
+    def __init__(self, directory: str, max_bytes: int):
+        self.disk = DiskLRUCache(directory, max_bytes, suffix='.zip')
+        self._building = set()
+        self._lock = threading.Lock()
+
+    def key(self, dataset: DataSet) -> str:
+        digest = hashlib.sha256()
+        for hubfile in sorted(dataset.files(), key=lambda hubfile: (hubfile.name, hubfile.id)):
+            digest.update(f"{hubfile.name}\0{hubfile.checksum}\n".encode("utf-8"))
+        return f"dataset_{dataset.id}-{digest.hexdigest()[:32]}"
+
+    def get_path(self, key: str) -> Optional[str]:
+        return self.disk.get_path(key)
+
+    def stream(self, key: str, entries):
+        """
+        Yield the archive of ``entries`` while storing it under ``key``. When the same archive is already
+        being built by another request it is only streamed, and a download interrupted halfway is not kept.
+        """
+        with self._lock:
+            owner = key not in self._building
+            self._building.add(key)
+        if not owner:
+            yield from stream_zip(entries)
+            return
+
+        tmp_path = self.disk.reserve(key)
+        try:
+            with open(tmp_path, "wb") as archive:
+                for chunk in stream_zip(entries):
+                    archive.write(chunk)
+                    yield chunk
+        except BaseException:
+            self.disk.discard(tmp_path)
+            raise
+        else:
+            self.disk.commit(key, tmp_path)
+        finally:
+            with self._lock:
+                self._building.discard(key)
+
+    def build(self, key: str, entries) -> Optional[str]:
+        """Store the archive of ``entries`` unless it is already stored. Returns its path."""
+        path = self.disk.get_path(key)
+        if path is None:
+            for _ in self.stream(key, entries):
+                pass
+            path = self.disk.get_path(key)
+        return path
+
+    def build_in_background(self, key: str, entries) -> threading.Thread:
+        entries = list(entries)
+
+        def build():
+            try:
+                self.build(key, entries)
+            except Exception as exc:
+                logger.warning(f"Could not build archive {key}: {exc}")
+
+        thread = threading.Thread(target=build, name=f"archive-{key}", daemon=True)
+        thread.start()
+        return thread
+
+    def to_dict(self):
+        return self.disk.to_dict()
+
+
+dataset_archive_cache = DatasetArchiveCache(
+    directory=cache_folder_path("archives"),
+    max_bytes=int(os.getenv("DATASET_ARCHIVE_CACHE_BYTES", 2 * 1024 * 1024 * 1024)),
+)
 
 
 class DataSetService(BaseService):
@@ -45,12 +254,16 @@ class DataSetService(BaseService):
         self.author_repository = AuthorRepository()
         self.dsmetadata_repository = DSMetaDataRepository()
         self.fmmetadata_repository = FMMetaDataRepository()
+        self.fmmetrics_service = FMMetricsService()
+        self.dsmetrics_service = DSMetricsService()
         self.dsdownloadrecord_repository = DSDownloadRecordRepository()
         self.hubfiledownloadrecord_repository = HubfileDownloadRecordRepository()
         self.hubfilerepository = HubfileRepository()
         self.dsviewrecord_repostory = DSViewRecordRepository()
         self.dsrating_repository = DSRatingRepository()
         self.hubfileviewrecord_repository = HubfileViewRecordRepository()
+        self.hubfile_service = HubfileService()
+        self.blob_service = HubfileBlobService()
 
     # Método de actualización para el dataset
     def update(self, dataset):
@@ -65,14 +278,189 @@ class DataSetService(BaseService):
         current_user = AuthenticationService().get_authenticated_user()
         source_dir = current_user.temp_folder()
 
-        working_dir = os.getenv("WORKING_DIR", "")
-        dest_dir = os.path.join(working_dir, "uploads", f"user_{current_user.id}", f"dataset_{dataset.id}")
-
-        os.makedirs(dest_dir, exist_ok=True)
+        dest_dir = self.get_upload_folder(dataset)
 
+        # Files go to the blob store; only those it cannot take (see HubfileBlobService.store) keep a copy of
+        # their own in the dataset folder
         for feature_model in dataset.feature_models:
             uvl_filename = feature_model.fm_meta_data.uvl_filename
-            shutil.move(os.path.join(source_dir, uvl_filename), dest_dir)
+            source_path = os.path.join(source_dir, uvl_filename)
+            hubfiles = [file for file in feature_model.files if file.name == uvl_filename]
+            # The checksum was computed from this very file by create_from_form
+            if hubfiles and self.blob_service.store(source_path, hubfiles[0].checksum, commit=False, verify=False,
+                                                    hubfile=hubfiles[0]) is not None:
+                continue
+            os.makedirs(dest_dir, exist_ok=True)
+            shutil.move(source_path, dest_dir)
+        self.repository.session.commit()
+
+    def unique_upload_path(self, temp_folder: str, filename: str) -> tuple:
+        """
+        Path for an upload in the temp folder, numbering the name (``name (1).uvl``...) when it is taken.
+
+        Returns:
+            tuple: The path and the file name finally used.
+        """
+        file_path = os.path.join(temp_folder, filename)
+        if not os.path.exists(file_path):
+            return file_path, filename
+
+        base_name, extension = os.path.splitext(filename)
+        i = 1
+        while os.path.exists(os.path.join(temp_folder, f"{base_name} ({i}){extension}")):
+            i += 1
+        new_filename = f"{base_name} ({i}){extension}"
+        return os.path.join(temp_folder, new_filename), new_filename
+
+    def save_upload(self, file, file_path: str) -> dict:
+        """
+        Write an uploaded file (a werkzeug ``FileStorage``) to ``file_path``, computing its digests and size
+        as it is written.
+
+        Returns:
+            dict: ``checksum`` (MD5), ``sha256`` and ``size``, as ``copy_with_digests``.
+        """
+        with open(file_path, "wb") as target:
+            return copy_with_digests(file.stream, target)
+
+    def analyze_upload(self, file_path: str, digests: Optional[dict] = None) -> dict:
+        """
+        Validate a freshly uploaded UVL file and compute its structural metrics (features, constraints,
+        depth) within ``UVL_UPLOAD_ANALYSIS_BUDGET`` seconds, storing the result next to the file so that
+        ``create_from_form`` can persist it without reading or parsing the file again.
+
+        The metrics run in the flamapy pool. When they do not fit in the budget only the grammar is checked,
+        also in the pool and within ``UVL_UPLOAD_VALIDATION_TIMEOUT`` seconds, and the metrics are left to
+        the worker (``DSPublicationService.analyze``).
+
+        Args:
+            file_path (str): The uploaded file.
+            digests (dict): Its digests and size as returned by ``save_upload``. Computed when omitted.
+
+        Returns:
+            dict: ``checksum``, ``sha256``, ``size``, ``is_valid``, ``errors``, ``analysis_ms`` and the
+            metrics of ``FlamapyService.structural_metrics``.
+
+        Raises:
+            ExecutorSaturated: When the flamapy pool cannot take the file, so the caller can answer 503.
+            OperationTimeout: When not even the grammar check finishes in time.
+        """
+        started = time.perf_counter()
+        digests = digests or calculate_digests(file_path)
+        checksum = digests["checksum"]
+        try:
+            analysis = get_executor().run(structural_metrics_task, file_path, checksum,
+                                          timeout=UPLOAD_ANALYSIS_BUDGET)
+        except ExecutorSaturated:
+            raise
+        except Exception as exc:
+            if not isinstance(exc, OperationTimeout):
+                logger.warning(f"Could not compute the metrics of {file_path}: {exc}")
+            errors = get_executor().run(validate_task, file_path, timeout=UPLOAD_VALIDATION_TIMEOUT)
+            analysis = {
+                "is_valid": not errors,
+                "errors": errors,
+                "number_of_features": None,
+                "number_of_constraints": None,
+                "cross_tree_constraints_ratio": None,
+                "depth": None,
+            }
+
+        analysis.update(digests)
+        # The digests hold as long as the file is not modified
+        analysis["mtime_ns"] = os.stat(file_path).st_mtime_ns
+        analysis["analysis_ms"] = round((time.perf_counter() - started) * 1000, 3)
+        with open(file_path + UPLOAD_ANALYSIS_SUFFIX, "w") as sidecar:
+            json.dump(analysis, sidecar)
+        return analysis
+
+    def get_upload_analysis(self, file_path: str, checksum: str) -> Optional[dict]:
+        """The analysis stored at upload for this file, or None when missing or made for other contents."""
+        try:
+            with open(file_path + UPLOAD_ANALYSIS_SUFFIX) as sidecar:
+                analysis = json.load(sidecar)
+        except (OSError, ValueError):
+            return None
+        return analysis if analysis.get("checksum") == checksum else None
+
+    def get_upload_digests(self, file_path: str) -> dict:
+        """
+        The digests of an uploaded file: those recorded in its upload analysis while the file is unchanged
+        since, otherwise computed from the file.
+        """
+        try:
+            with open(file_path + UPLOAD_ANALYSIS_SUFFIX) as sidecar:
+                analysis = json.load(sidecar)
+            stat = os.stat(file_path)
+            if analysis.get("size") == stat.st_size and analysis.get("mtime_ns") == stat.st_mtime_ns:
+                return {key: analysis[key] for key in ("checksum", "sha256", "size")}
+        except (OSError, ValueError, KeyError):
+            pass
+        return calculate_digests(file_path)
+
+    def delete_upload(self, file_path: str) -> bool:
+        """Remove an uploaded file from the temp folder together with its upload analysis."""
+        if os.path.exists(file_path + UPLOAD_ANALYSIS_SUFFIX):
+            os.remove(file_path + UPLOAD_ANALYSIS_SUFFIX)
+        if not os.path.exists(file_path):
+            return False
+        os.remove(file_path)
+        return True
+
+    def clear_temp_folder(self, temp_folder: str):
+        """Empty a user's temp folder, keeping the chunked uploads still in progress (e.g. in other tabs)."""
+        if not os.path.isdir(temp_folder):
+            return
+        for entry in os.scandir(temp_folder):
+            if entry.name == ChunkedUploadService.FOLDER:
+                continue
+            if entry.is_dir(follow_symlinks=False):
+                shutil.rmtree(entry.path, ignore_errors=True)
+            else:
+                os.remove(entry.path)
+
+    def get_upload_folder(self, dataset: DataSet) -> str:
+        working_dir = os.getenv("WORKING_DIR", "")
+        return os.path.join(working_dir, "uploads", f"user_{dataset.user_id}", f"dataset_{dataset.id}")
+
+    def archive_entries(self, dataset: DataSet):
+        """
+        Yield the ``(arcname, path)`` pairs of the dataset's zip archive: every file of the dataset, by name,
+        under a ``dataset_<id>/`` folder. It reads the dataset as it goes: list it before the request (and
+        its database session) ends.
+        """
+        folder = self.get_upload_folder(dataset)
+        for file in sorted(dataset.files(), key=lambda file: file.name):
+            path = self.blob_service.resolve(file.checksum, os.path.join(folder, file.name))
+            yield f"dataset_{dataset.id}/{file.name}", path
+
+    def bulk_archive_entries(self, datasets: list, max_bytes: int = BULK_DOWNLOAD_MAX_BYTES) -> list:
+        """
+        List the ``(arcname, path)`` pairs of a single archive holding several datasets, one ``dataset_<id>/``
+        folder each. The list is built up front so that the archive can be streamed once the request (and
+        its database session) is over.
+
+        Raises:
+            ArchiveTooLarge: When the files add up to more than ``max_bytes``.
+        """
+        entries = []
+        size = 0
+        for dataset in datasets:
+            for arcname, path in self.archive_entries(dataset):
+                size += os.path.getsize(path)
+                entries.append((arcname, path))
+        if size > max_bytes:
+            raise ArchiveTooLarge(size, max_bytes)
+        return entries
+
+    def get_by_ids(self, dataset_ids: list) -> list:
+        """The datasets with the given ids, in that order, skipping ids that do not exist."""
+        return self.repository.get_by_ids(dataset_ids)
+
+    def build_archive_in_background(self, dataset: DataSet) -> threading.Thread:
+        """Prebuild the download archive of a dataset, e.g. right after it is published."""
+        return dataset_archive_cache.build_in_background(dataset_archive_cache.key(dataset),
+                                                         list(self.archive_entries(dataset)))
 
     def get_synchronized(self, current_user_id: int) -> DataSet:
         return self.repository.get_synchronized(current_user_id)
@@ -119,6 +507,7 @@ class DataSetService(BaseService):
 
             dataset = self.create(commit=False, user_id=current_user.id, ds_meta_data_id=dsmetadata.id)
 
+            fm_metrics = []
             for feature_model in form.feature_models:
                 uvl_filename = feature_model.uvl_filename.data
                 fmmetadata = self.fmmetadata_repository.create(commit=False, **feature_model.get_fmmetadata())
@@ -132,12 +521,23 @@ class DataSetService(BaseService):
 
                 # associated files in feature model
                 file_path = os.path.join(current_user.temp_folder(), uvl_filename)
-                checksum, size = calculate_checksum_and_size(file_path)
+                digests = self.get_upload_digests(file_path)
+                checksum, size = digests["checksum"], digests["size"]
 
                 file = self.hubfilerepository.create(
                     commit=False, name=uvl_filename, checksum=checksum, size=size, feature_model_id=fm.id
                 )
                 fm.files.append(file)
+
+                # Keep the metrics the upload already measured; the analysis and the configuration counts are
+                # left to the worker (DSPublicationService.analyze)
+                upload_analysis = self.get_upload_analysis(file_path, checksum)
+                if upload_analysis is not None and upload_analysis.get("depth") is not None:
+                    metrics = {name: upload_analysis[name] for name in STRUCTURAL_METRICS}
+                    self.fmmetrics_service.store(fmmetadata, dict(metrics, number_of_configurations=None))
+                fm_metrics.append(fmmetadata.fm_metrics)
+
+            self.dsmetrics_service.rollup(dsmetadata, fm_metrics)
             self.repository.session.commit()
         except Exception as exc:
             logger.info(f"Exception creating dataset from form...: {exc}")
@@ -145,6 +545,90 @@ class DataSetService(BaseService):
             raise exc
         return dataset
 
+    def compute_metrics(self, datasets: list, file_paths: Optional[dict] = None,
+                        upload_analyses: Optional[dict] = None, commit: bool = True) -> int:
+        """
+        Compute the metrics of every feature model of ``datasets`` and roll them up to each dataset.
+
+        The files are processed in parallel (one thread per flamapy worker). Stored analyses that are still
+        fresh provide the configuration counts, so only files without one are counted.
+
+        Args:
+            datasets (list): The datasets to update.
+            file_paths (dict): Hubfile id -> path, for files that are not in their final location yet.
+            upload_analyses (dict): Hubfile id -> analysis computed at upload (see ``analyze_upload``).
+            commit (bool): Whether to commit the session at the end.
+
+        Returns:
+            int: The number of feature models whose metrics were computed.
+        """
+        file_paths = file_paths or {}
+        upload_analyses = upload_analyses or {}
+
+        jobs = []
+        for dataset in datasets:
+            for feature_model in dataset.feature_models:
+                if not feature_model.files or feature_model.fm_meta_data is None:
+                    continue
+                hubfile = feature_model.files[0]
+                file_path = file_paths.get(hubfile.id) or self.hubfile_service.get_path_by_hubfile(hubfile)
+                analysis = self.hubfile_service.hubfile_analysis_repository.get_by_file_id(hubfile.id)
+                fresh = analysis is not None and not analysis.is_stale()
+                jobs.append((feature_model, file_path, hubfile.checksum, upload_analyses.get(hubfile.id),
+                             analysis.number_of_configurations if fresh else None, not fresh))
+
+        def compute(job):
+            feature_model, file_path, checksum, structural, configurations, count = job
+            try:
+                return feature_model, self.fmmetrics_service.compute(file_path, checksum, structural,
+                                                                     configurations, count)
+            except Exception as exc:
+                logger.warning(f"Could not compute the metrics of feature model {feature_model.id}: {exc}")
+                return feature_model, None
+
+        computed = 0
+        if jobs:
+            with ThreadPoolExecutor(max_workers=get_executor().workers) as pool:
+                for feature_model, metrics in pool.map(compute, jobs):
+                    if metrics is not None:
+                        self.fmmetrics_service.store(feature_model.fm_meta_data, metrics)
+                        computed += 1
+
+        for dataset in datasets:
+            self.dsmetrics_service.rollup(
+                dataset.ds_meta_data,
+                [feature_model.fm_meta_data.fm_metrics if feature_model.fm_meta_data else None
+                 for feature_model in dataset.feature_models]
+            )
+
+        if commit:
+            self.repository.session.commit()
+        return computed
+
+    def backfill_metrics(self, batch_size: int = 20, only_missing: bool = True):
+        """
+        Compute the metrics of existing datasets in batches, committing after each one.
+
+        Args:
+            batch_size (int): Datasets per batch.
+            only_missing (bool): Skip datasets whose metrics were already computed.
+
+        Yields:
+            tuple: The ids of the datasets of each batch and the number of feature models updated.
+        """
+        last_id = 0
+        while True:
+            batch = self.repository.get_batch_after(last_id, batch_size, missing_metrics_only=only_missing)
+            if not batch:
+                return
+            last_id = batch[-1].id
+            try:
+                computed = self.compute_metrics(batch)
+            except Exception:
+                self.repository.session.rollback()
+                raise
+            yield [dataset.id for dataset in batch], computed
+
     def update_dsmetadata(self, id, **kwargs):
         return self.dsmetadata_repository.update(id, **kwargs)
 
@@ -162,6 +646,14 @@ class DSDownloadRecordService(BaseService):
     def __init__(self):
         super().__init__(DSDownloadRecordRepository())
 
+    def record_downloads(self, dataset_ids: list, user_id: Optional[int], download_cookie: str) -> int:
+        """
+        Record the download of several datasets at once, skipping those already recorded for this user and
+        cookie. Returns the number of records written.
+        """
+        return self.repository.create_missing(dataset_ids, user_id, download_cookie,
+                                              download_date=datetime.now(timezone.utc))
+
 
 class DSMetaDataService(BaseService):
     def __init__(self):
@@ -174,6 +666,38 @@ class DSMetaDataService(BaseService):
         return self.repository.filter_by_doi(doi)
 
 
+class DSMetricsService(BaseService):
+    def __init__(self):
+        super().__init__(DSMetricsRepository())
+
+    def rollup(self, ds_meta_data: DSMetaData, fm_metrics: list, commit: bool = False) -> DSMetrics:
+        """
+        Aggregate the metrics of the models of a dataset: features, constraints and configurations are
+        summed over the models that have them and the depth is the one of the deepest model.
+        """
+        def known(name):
+            return [getattr(metrics, name) for metrics in fm_metrics
+                    if metrics is not None and getattr(metrics, name) is not None]
+
+        configurations = known("number_of_configurations")
+        values = {
+            "number_of_models": len(fm_metrics),
+            "number_of_features": sum(known("number_of_features")),
+            "number_of_constraints": sum(known("number_of_constraints")),
+            "max_depth": max(known("depth"), default=None),
+            "number_of_configurations": min(sum(configurations), sys.float_info.max) if configurations else None,
+        }
+
+        if ds_meta_data.ds_metrics is None:
+            ds_meta_data.ds_metrics = self.repository.create(commit=False, **values)
+        else:
+            for name, value in values.items():
+                setattr(ds_meta_data.ds_metrics, name, value)
+        if commit:
+            self.repository.session.commit()
+        return ds_meta_data.ds_metrics
+
+
 class DSViewRecordService(BaseService):
     def __init__(self):
         super().__init__(DSViewRecordRepository())
@@ -246,6 +770,414 @@ class DSRatingService(BaseService):
         return self.repository.count_ratings(dsmetadata_id)
 
 
+class DSPublicationService(BaseService):
+    """
+    Analyzes datasets and publishes them to Zenodo (Fakenodo in development) outside of the upload request.
+    Every dataset gets a ``DSPublication`` that the worker advances one step per call, through the states of
+    ``DSPublication``. Each step can run again after a crash without repeating its effect: files with a fresh
+    analysis are not analyzed again, the deposition is only created when the dataset has none, files are
+    uploaded to the deposition bucket (replacing the same file), publishing is skipped for a deposition
+    already published and the DOI is read again.
+    """
+
+    def __init__(self, nodo_service=None):
+        super().__init__(DSPublicationRepository())
+        self.nodo_service = nodo_service or (FakenodoService() if USE_FAKENODE else ZenodoService())
+        self.steps = {
+            DSPublication.CREATED: self.analyze,
+            DSPublication.ANALYZED: self.deposit,
+            DSPublication.DEPOSITED: self.upload_files,
+            DSPublication.FILES_UPLOADED: self.publish,
+            DSPublication.PUBLISHED: self.sync_doi,
+        }
+
+    def enqueue(self, dataset: DataSet) -> DSPublication:
+        """Queue the publication of a dataset (once: an existing publication is returned as is)."""
+        return self.repository.get_by_dataset_id(dataset.id) or self.repository.create(
+            dataset_id=dataset.id, state=DSPublication.CREATED)
+
+    def get_status(self, dataset: DataSet) -> dict:
+        publication = self.repository.get_by_dataset_id(dataset.id)
+        if publication is not None:
+            return publication.to_dict()
+        # Datasets published before the pipeline existed, or never sent
+        doi = dataset.ds_meta_data.dataset_doi
+        return {"dataset_id": dataset.id, "state": DSPublication.DOI_SYNCED if doi else None,
+                "status": "done" if doi else "unpublished", "dataset_doi": doi}
+
+    def retry(self, publication: DSPublication) -> DSPublication:
+        """Resume a publication that gave up, from the step that failed."""
+        publication.failed_at = None
+        publication.attempts = 0
+        publication.next_attempt_at = None
+        publication.error = None
+        self.repository.session.commit()
+        return publication
+
+    def advance_next(self) -> Optional[DSPublication]:
+        """
+        Claim the oldest publication with a step due and run that step. A failed step is retried after
+        ``PUBLICATION_RETRY_BACKOFF`` seconds, doubled on every attempt, up to ``PUBLICATION_MAX_ATTEMPTS``.
+
+        Returns:
+            DSPublication: The publication processed, or None when no step is due.
+        """
+        now = datetime.utcnow()
+        publication = self.repository.claim_next(now)
+        if publication is None:
+            self.repository.session.commit()
+            return None
+
+        publication.locked_until = now + timedelta(seconds=PUBLICATION_LEASE_SECONDS)
+        self.repository.session.commit()
+
+        state = publication.state
+        try:
+            self.steps[state](publication.data_set)
+            publication.state = DSPublication.STATES[DSPublication.STATES.index(state) + 1]
+            publication.attempts = 0
+            publication.error = None
+            publication.next_attempt_at = None
+        except Exception as exc:
+            logger.warning(f"Publication of dataset {publication.dataset_id} failed at '{state}': {exc}")
+            self.repository.session.rollback()
+            publication.attempts += 1
+            publication.error = str(exc)
+            if publication.attempts >= PUBLICATION_MAX_ATTEMPTS:
+                publication.failed_at = datetime.utcnow()
+            else:
+                delay = PUBLICATION_RETRY_BACKOFF * 2 ** (publication.attempts - 1)
+                publication.next_attempt_at = datetime.utcnow() + timedelta(seconds=delay)
+
+        publication.locked_until = None
+        self.repository.session.commit()
+        return publication
+
+    def analyze(self, dataset: DataSet):
+        """Validate and count the configurations of the dataset's files, then compute its metrics."""
+        hubfile_service = HubfileService()
+        for feature_model in dataset.feature_models:
+            for hubfile in feature_model.files:
+                analysis = hubfile_service.hubfile_analysis_repository.get_by_file_id(hubfile.id)
+                if analysis is None or analysis.is_stale():
+                    hubfile_service.analyze(hubfile, commit=False)
+        DataSetService().compute_metrics([dataset], commit=False)
+
+    def deposit(self, dataset: DataSet):
+        if dataset.ds_meta_data.deposition_id is None:
+            deposition = self.nodo_service.create_new_deposition(dataset.ds_meta_data)
+            dataset.ds_meta_data.deposition_id = deposition["id"]
+            # Committed at once: if it were lost with a later rollback, the retry would create another deposition
+            self.repository.session.commit()
+
+    def upload_files(self, dataset: DataSet):
+        self.nodo_service.upload_files(dataset, dataset.ds_meta_data.deposition_id, dataset.feature_models,
+                                       user=dataset.user)
+
+    def publish(self, dataset: DataSet):
+        deposition = self.nodo_service.get_deposition(dataset.ds_meta_data.deposition_id)
+        # Zenodo marks published depositions as submitted, Fakenodo through their status
+        if not (deposition.get("submitted") or deposition.get("status") == "published"):
+            self.nodo_service.publish_deposition(dataset.ds_meta_data.deposition_id)
+
+    def sync_doi(self, dataset: DataSet):
+        doi = self.nodo_service.get_doi(dataset.ds_meta_data.deposition_id)
+        if not doi:
+            raise Exception("The deposition has no DOI yet")
+        dataset.ds_meta_data.dataset_doi = doi
+
+        # Published datasets no longer change: have the download archive ready for the first request
+        try:
+            dataset_archive_cache.build(dataset_archive_cache.key(dataset), DataSetService().archive_entries(dataset))
+        except Exception as exc:
+            logger.warning(f"Could not build the archive of dataset {dataset.id}: {exc}")
+
+
+class ChunkedUploadService():
+    """
+    Resumable uploads in numbered chunks. Each upload lives in ``<temp folder>/.chunked/<upload id>/`` with
+    its description (``upload.json``) and one file per stored chunk, so chunks can arrive in any order, in
+    parallel or again after a dropped connection: a chunk already stored is skipped. ``finalize`` joins them
+    into the temp folder, hashing on the way, and checks the checksum announced by the client. Uploads that
+    receive nothing for ``ttl`` seconds are removed by ``cleanup``.
+    """
+
+    FOLDER = ".chunked"
+    UPLOAD_ID = re.compile(r"^[0-9a-f]{32}$")
+
+    def __init__(self, chunk_size: int = UPLOAD_CHUNK_BYTES, max_bytes: int = UPLOAD_MAX_BYTES,
+                 ttl: float = UPLOAD_CHUNKED_TTL):
+        self.chunk_size = chunk_size
+        self.max_bytes = max_bytes
+        self.ttl = ttl
+
+    def init(self, temp_folder: str, filename: str, size: int) -> dict:
+        if not isinstance(filename, str) or not filename.endswith(UPLOAD_EXTENSIONS) \
+                or os.path.basename(filename) != filename:
+            raise UploadError("No valid file")
+        if not isinstance(size, int) or size <= 0:
+            raise UploadError("'size' must be a positive integer")
+        if size > self.max_bytes:
+            raise UploadError(f"Files can be at most {self.max_bytes} bytes", 413)
+
+        self.cleanup(temp_folder)
+        upload_id = uuid.uuid4().hex
+        folder = self._folder(temp_folder, upload_id)
+        os.makedirs(folder)
+        upload = {"upload_id": upload_id, "filename": filename, "size": size, "chunk_size": self.chunk_size,
+                  "chunks": -(-size // self.chunk_size)}
+        with open(os.path.join(folder, "upload.json"), "w") as f:
+            json.dump(upload, f)
+        return upload
+
+    def status(self, temp_folder: str, upload_id: str) -> dict:
+        upload = self._load(temp_folder, upload_id)
+        received = self._received(temp_folder, upload)
+        return dict(upload, received=received,
+                    missing=[index for index in range(upload["chunks"]) if index not in received])
+
+    def put_chunk(self, temp_folder: str, upload_id: str, index: int, offset: int, stream) -> bool:
+        """
+        Store chunk ``index``, which starts at byte ``offset`` of the file.
+
+        Returns:
+            bool: False when the chunk was already stored (and ``stream`` was not read).
+        """
+        upload = self._load(temp_folder, upload_id)
+        if not 0 <= index < upload["chunks"]:
+            raise UploadError(f"Chunk {index} out of range, the upload has {upload['chunks']} chunks")
+        start = index * upload["chunk_size"]
+        if offset != start:
+            raise UploadError(f"Chunk {index} starts at byte {start}, not {offset}")
+        length = min(upload["chunk_size"], upload["size"] - start)
+
+        path = self._chunk_path(temp_folder, upload_id, index)
+        if os.path.exists(path) and os.path.getsize(path) == length:
+            return False
+
+        tmp_path = f"{path}.{uuid.uuid4().hex}.tmp"
+        try:
+            with open(tmp_path, "wb") as target:
+                written = copy_with_digests(_LimitedReader(stream, length + 1), target)["size"]
+            if written != length:
+                raise UploadError(f"Chunk {index} must have {length} bytes, got {written}")
+            os.replace(tmp_path, path)
+        finally:
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+        return True
+
+    def finalize(self, temp_folder: str, upload_id: str, checksum: str, file_path: str) -> dict:
+        """
+        Join the chunks into ``file_path`` and drop the upload. ``checksum`` is the MD5 or the SHA-256 of the
+        whole file.
+
+        Returns:
+            dict: The digests of the file, as ``copy_with_digests``.
+        """
+        upload = self._load(temp_folder, upload_id)
+        missing = self.status(temp_folder, upload_id)["missing"]
+        if missing:
+            raise UploadError(f"Chunks {missing[:10]} are missing", 409)
+        if not isinstance(checksum, str) or not checksum:
+            raise UploadError("The 'checksum' of the file is required")
+
+        chunks = [self._chunk_path(temp_folder, upload_id, index) for index in range(upload["chunks"])]
+        with _JoinedFiles(chunks) as source, open(file_path, "wb") as target:
+            digests = copy_with_digests(source, target)
+
+        if checksum.lower() not in (digests["checksum"], digests["sha256"]):
+            os.remove(file_path)
+            self.abort(temp_folder, upload_id)
+            raise UploadError("The checksum does not match the uploaded file, upload it again")
+        self.abort(temp_folder, upload_id)
+        return digests
+
+    def abort(self, temp_folder: str, upload_id: str):
+        shutil.rmtree(self._folder(temp_folder, upload_id), ignore_errors=True)
+
+    def cleanup(self, temp_folder: str) -> int:
+        """
+        Remove the uploads of a temp folder that received no chunk in the last ``ttl`` seconds (a stored
+        chunk updates the mtime of its upload folder). Returns the number of uploads removed.
+        """
+        root = os.path.join(temp_folder, self.FOLDER)
+        if not os.path.isdir(root):
+            return 0
+        expired_before = time.time() - self.ttl
+        removed = 0
+        for entry in os.scandir(root):
+            try:
+                expired = entry.is_dir() and entry.stat().st_mtime < expired_before
+            except FileNotFoundError:
+                continue
+            if expired:
+                shutil.rmtree(entry.path, ignore_errors=True)
+                removed += 1
+        return removed
+
+    def cleanup_all(self, temp_root: str) -> int:
+        """``cleanup`` every user's temp folder under ``temp_root``, for users who never come back."""
+        if not os.path.isdir(temp_root):
+            return 0
+        return sum(self.cleanup(entry.path) for entry in os.scandir(temp_root) if entry.is_dir())
+
+    def _folder(self, temp_folder, upload_id):
+        if not isinstance(upload_id, str) or not self.UPLOAD_ID.match(upload_id):
+            raise UploadError("Upload not found", 404)
+        return os.path.join(temp_folder, self.FOLDER, upload_id)
+
+    def _chunk_path(self, temp_folder, upload_id, index):
+        return os.path.join(self._folder(temp_folder, upload_id), f"{index:06d}.chunk")
+
+    def _load(self, temp_folder, upload_id) -> dict:
+        try:
+            with open(os.path.join(self._folder(temp_folder, upload_id), "upload.json")) as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            raise UploadError("Upload not found", 404)
+
+    def _received(self, temp_folder, upload) -> list:
+        received = []
+        for index in range(upload["chunks"]):
+            path = self._chunk_path(temp_folder, upload["upload_id"], index)
+            length = min(upload["chunk_size"], upload["size"] - index * upload["chunk_size"])
+            if os.path.exists(path) and os.path.getsize(path) == length:
+                received.append(index)
+        return received
+
+
+class ZipUploadService():
+    """
+    Uploads of several UVL files packed in one zip archive. Entries are extracted one by one into the temp
+    folder, chunk by chunk, under limits on the number of entries and on the uncompressed bytes so that a
+    zip bomb is refused before anything is written. The extracted files are then validated concurrently and
+    the outcome of every entry is returned in one report.
+    """
+
+    IGNORED = ("__MACOSX/",)
+
+    def __init__(self, dataset_service: DataSetService, max_entries: int = UPLOAD_ZIP_MAX_ENTRIES,
+                 max_bytes: int = UPLOAD_ZIP_MAX_BYTES):
+        self.dataset_service = dataset_service
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+
+    def upload(self, temp_folder: str, stream) -> dict:
+        """
+        Extract the archive in ``stream`` (a seekable binary file) and validate its UVL files. Invalid files
+        are removed from the temp folder; valid ones stay there, like single uploads.
+
+        Returns:
+            dict: ``files`` (``filename``, ``entry``, ``valid``, ``errors`` and ``metrics`` of each UVL
+            entry), ``rejected`` (``entry`` and ``reason`` of the entries not extracted) and the ``valid``,
+            ``invalid`` and ``not_validated`` counts. Files whose check timed out are ``not_validated``
+            (``valid`` is None) rather than invalid; they are removed too, as a single upload would be.
+
+        Raises:
+            ExecutorSaturated: When the flamapy pool cannot take the files; nothing is kept.
+        """
+        extracted, rejected = self.extract(temp_folder, stream)
+
+        def analyze(item):
+            try:
+                return self.dataset_service.analyze_upload(item["path"], item["digests"])
+            except ExecutorSaturated:
+                raise
+            except OperationTimeout as exc:
+                return {"is_valid": None, "errors": [f"The file could not be validated: {exc}"]}
+            except Exception as exc:
+                logger.warning(f"Could not analyze {item['path']}: {exc}")
+                return {"is_valid": False, "errors": [str(exc)]}
+
+        # The analysis itself runs in the flamapy pool, so there is no point in more threads than workers
+        try:
+            with ThreadPoolExecutor(max_workers=max(min(get_executor().workers, len(extracted)), 1)) as pool:
+                analyses = list(pool.map(analyze, extracted))
+        except ExecutorSaturated:
+            for item in extracted:
+                self.dataset_service.delete_upload(item["path"])
+            raise
+
+        files = []
+        for item, analysis in zip(extracted, analyses):
+            if not analysis["is_valid"]:
+                self.dataset_service.delete_upload(item["path"])
+            files.append({
+                "filename": item["filename"] if analysis["is_valid"] else None,
+                "entry": item["entry"],
+                "valid": analysis["is_valid"],
+                "errors": analysis["errors"],
+                "metrics": {name: analysis.get(name) for name in (
+                    "number_of_features", "number_of_constraints", "cross_tree_constraints_ratio", "depth")},
+            })
+
+        valid = sum(1 for file in files if file["valid"])
+        not_validated = sum(1 for file in files if file["valid"] is None)
+        return {"files": files, "rejected": rejected, "valid": valid, "not_validated": not_validated,
+                "invalid": len(files) - valid - not_validated}
+
+    def extract(self, temp_folder: str, stream) -> tuple:
+        """
+        Write the UVL entries of the archive to the temp folder, flattened to their base names (numbered
+        when taken, as single uploads), hashing them on the way.
+
+        Returns:
+            tuple: The extracted entries (``entry``, ``filename``, ``path`` and ``digests``) and the
+            rejected ones (``entry`` and ``reason``).
+        """
+        try:
+            archive = zipfile.ZipFile(stream)
+        except (zipfile.BadZipFile, OSError):
+            raise UploadError("The file is not a valid zip archive")
+
+        with archive:
+            entries = [info for info in archive.infolist()
+                       if not info.is_dir() and not info.filename.startswith(self.IGNORED)]
+            if len(entries) > self.max_entries:
+                raise UploadError(f"Archives can have at most {self.max_entries} files, this one has "
+                                  f"{len(entries)}", 413)
+            declared = sum(info.file_size for info in entries)
+            if declared > self.max_bytes:
+                raise UploadError(f"Archives can hold at most {self.max_bytes} bytes uncompressed, this one "
+                                  f"holds {declared}", 413)
+
+            os.makedirs(temp_folder, exist_ok=True)
+            extracted, rejected = [], []
+            budget = self.max_bytes
+            try:
+                for info in entries:
+                    filename = os.path.basename(info.filename.replace("\\", "/"))
+                    if not filename.endswith(UPLOAD_EXTENSIONS) or filename.startswith("."):
+                        rejected.append({"entry": info.filename, "reason": "Not a UVL file"})
+                        continue
+                    if info.flag_bits & 0x1:
+                        rejected.append({"entry": info.filename, "reason": "Encrypted entries are not supported"})
+                        continue
+
+                    file_path, filename = self.dataset_service.unique_upload_path(temp_folder, filename)
+                    extracted.append({"entry": info.filename, "filename": filename, "path": file_path})
+                    # The declared sizes are not trusted: never write more than what is left of the budget
+                    with archive.open(info) as source, open(file_path, "wb") as target:
+                        digests = copy_with_digests(_LimitedReader(source, min(info.file_size, budget) + 1),
+                                                    target)
+                    if digests["size"] != info.file_size:
+                        raise UploadError(f"The entry {info.filename} does not match its declared size")
+                    budget -= digests["size"]
+                    extracted[-1]["digests"] = digests
+            except (zipfile.BadZipFile, zlib.error, NotImplementedError, EOFError) as exc:
+                self._discard(extracted)
+                raise UploadError(f"The archive could not be extracted: {exc}")
+            except Exception:
+                self._discard(extracted)
+                raise
+        return extracted, rejected
+
+    def _discard(self, extracted):
+        for item in extracted:
+            self.dataset_service.delete_upload(item["path"])
+
+
 class SizeService():
 
     def __init__(self):
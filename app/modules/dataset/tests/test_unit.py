@@ -1,10 +1,27 @@
-from datetime import datetime
+from datetime import datetime, timedelta
+import hashlib
+import io
+import os
+import shutil
+import zipfile
+from types import SimpleNamespace
+from unittest.mock import patch
 import pytest
 from flask.testing import FlaskClient
+from werkzeug.datastructures import FileStorage
 from app import create_app, db
 from app.modules.auth.models import User
+from app.modules.common.dbutils import create_dataset_db
 from app.modules.dataset.models import DataSet, DSMetaData, PublicationType
+from app.modules.dataset.services import (UPLOAD_ANALYSIS_SUFFIX, UPLOAD_VALIDATION_TIMEOUT, ArchiveTooLarge,
+                                          DatasetArchiveCache, DataSetService, DSMetricsService, DSPublicationService,
+                                          UploadError, ChunkedUploadService, ZipUploadService, _JoinedFiles,
+                                          calculate_checksum_and_size, calculate_digests)
+from app.modules.fakenodo.services import FakenodoService
+from app.modules.flamapy.executor import ExecutorSaturated, OperationTimeout, structural_metrics_task, validate_task
+from app.modules.hubfile.services import HubfileService
 from app.modules.profile.models import UserProfile
+from core.streaming.zip_stream import stream_zip
 from app.modules.conftest import login
 
 
@@ -114,3 +131,336 @@ def test_edit_dataset_not_found(client: FlaskClient):
     # Intentar acceder a un dataset inexistente
     response = client.get('/dataset/999/edit')
     assert response.status_code == 404, "El código de estado debería ser 404 para un dataset inexistente."
+
+
+def test_upload_analysis_sidecar(tmp_path):
+    file_path = str(tmp_path / "file1.uvl")
+    shutil.copy("app/modules/dataset/uvl_examples/file1.uvl", file_path)
+    service = DataSetService()
+
+    analysis = service.analyze_upload(file_path)
+    assert analysis["is_valid"]
+    assert os.path.exists(file_path + UPLOAD_ANALYSIS_SUFFIX)
+    assert service.get_upload_analysis(file_path, analysis["checksum"]) == analysis
+    # An analysis made for other contents is ignored
+    assert service.get_upload_analysis(file_path, "another-checksum") is None
+
+    assert service.delete_upload(file_path)
+    assert not os.path.exists(file_path)
+    assert not os.path.exists(file_path + UPLOAD_ANALYSIS_SUFFIX)
+
+
+def test_upload_digests_computed_while_saving(tmp_path):
+    source = "app/modules/dataset/uvl_examples/file1.uvl"
+    with open(source, "rb") as f:
+        content = f.read()
+    file_path = str(tmp_path / "file1.uvl")
+    service = DataSetService()
+
+    digests = service.save_upload(FileStorage(io.BytesIO(content), filename="file1.uvl"), file_path)
+    assert digests == calculate_digests(source)
+    assert digests["sha256"] == hashlib.sha256(content).hexdigest()
+    assert calculate_checksum_and_size(file_path) == (hashlib.md5(content).hexdigest(), len(content))
+
+    analysis = service.analyze_upload(file_path, digests)
+    assert analysis["sha256"] == digests["sha256"] and analysis["size"] == len(content)
+    assert service.get_upload_digests(file_path) == digests
+
+    # Recorded digests are not trusted once the file changes
+    with open(file_path, "ab") as f:
+        f.write(b"\n")
+    assert service.get_upload_digests(file_path)["size"] == len(content) + 1
+
+
+def test_upload_analysis_rejects_invalid_uvl(tmp_path):
+    file_path = str(tmp_path / "broken.uvl")
+    with open(file_path, "w") as f:
+        f.write("features\n    Root\n        mandatory\n            \"unterminated\n")
+
+    analysis = DataSetService().analyze_upload(file_path)
+    assert not analysis["is_valid"]
+    assert analysis["errors"]
+    assert analysis["number_of_features"] is None
+
+
+def test_upload_analysis_bounds_the_fallback_validation(tmp_path):
+    file_path = str(tmp_path / "model.uvl")
+    shutil.copy("app/modules/dataset/uvl_examples/file1.uvl", file_path)
+
+    def metrics_time_out(func, *args, timeout=None):
+        if func is structural_metrics_task:
+            raise OperationTimeout(timeout)
+        return []
+
+    with patch("app.modules.dataset.services.get_executor") as get_executor:
+        get_executor.return_value.run.side_effect = metrics_time_out
+        analysis = DataSetService().analyze_upload(file_path)
+        assert analysis["is_valid"] and analysis["depth"] is None, "Only the grammar is checked"
+        func, _ = get_executor.return_value.run.call_args.args
+        assert func is validate_task, "The fallback validation must run in the pool, under a time limit"
+        assert get_executor.return_value.run.call_args.kwargs["timeout"] == UPLOAD_VALIDATION_TIMEOUT
+
+        get_executor.return_value.run.side_effect = ExecutorSaturated(5)
+        with pytest.raises(ExecutorSaturated):
+            DataSetService().analyze_upload(file_path)
+
+
+def test_ds_metrics_rollup():
+    ds_meta_data = SimpleNamespace(ds_metrics=SimpleNamespace())
+    fm_metrics = [
+        SimpleNamespace(number_of_features=10, number_of_constraints=2, depth=3, number_of_configurations=24.0),
+        SimpleNamespace(number_of_features=5, number_of_constraints=None, depth=5, number_of_configurations=None),
+        None,
+    ]
+
+    metrics = DSMetricsService().rollup(ds_meta_data, fm_metrics)
+    assert metrics.number_of_models == 3
+    assert metrics.number_of_features == 15
+    assert metrics.number_of_constraints == 2
+    assert metrics.max_depth == 5
+    assert metrics.number_of_configurations == 24.0
+
+
+def test_dataset_archive_is_streamed(tmp_path, monkeypatch):
+    monkeypatch.setenv("WORKING_DIR", str(tmp_path))
+    files = [SimpleNamespace(name="file2.uvl", checksum="b"), SimpleNamespace(name="file1.uvl", checksum="a")]
+    dataset = SimpleNamespace(id=7, user_id=3, files=lambda: files)
+    service = DataSetService()
+    folder = service.get_upload_folder(dataset)
+    os.makedirs(folder)
+    for name in ("file1.uvl", "file2.uvl"):
+        shutil.copy(f"app/modules/dataset/uvl_examples/{name}", folder)
+
+    chunks = list(stream_zip(service.archive_entries(dataset), chunk_size=128))
+    assert len(chunks) > 2, "The archive must be produced in several pieces"
+
+    with zipfile.ZipFile(io.BytesIO(b"".join(chunks))) as archive:
+        assert archive.testzip() is None
+        assert archive.namelist() == ["dataset_7/file1.uvl", "dataset_7/file2.uvl"]
+        with open(os.path.join(folder, "file1.uvl"), "rb") as f:
+            assert archive.read("dataset_7/file1.uvl") == f.read()
+
+
+def test_dataset_archive_cache(tmp_path):
+    cache = DatasetArchiveCache(str(tmp_path / "archives"), 1024 * 1024)
+    files = [SimpleNamespace(id=1, name="file1.uvl", checksum="a"),
+             SimpleNamespace(id=2, name="file2.uvl", checksum="b")]
+    dataset = SimpleNamespace(id=1, files=lambda: files)
+    entries = [("dataset_1/file1.uvl", "app/modules/dataset/uvl_examples/file1.uvl")]
+
+    key = cache.key(dataset)
+    assert cache.key(dataset) == key
+    files[1].checksum = "c"
+    assert cache.key(dataset) != key, "A change in the files must change the key"
+
+    # An interrupted download does not leave a partial archive behind
+    stream = cache.stream(key, entries)
+    next(stream)
+    stream.close()
+    assert cache.get_path(key) is None
+
+    streamed = b"".join(cache.stream(key, entries))
+    with open(cache.get_path(key), "rb") as f:
+        assert f.read() == streamed
+    assert cache.build(key, entries) == cache.get_path(key)
+
+
+def test_bulk_archive_entries(tmp_path, monkeypatch):
+    monkeypatch.setenv("WORKING_DIR", str(tmp_path))
+    service = DataSetService()
+    files = [SimpleNamespace(name="file1.uvl", checksum="a")]
+    datasets = [SimpleNamespace(id=dataset_id, user_id=1, files=lambda: files) for dataset_id in (4, 2)]
+    for dataset in datasets:
+        folder = service.get_upload_folder(dataset)
+        os.makedirs(folder)
+        shutil.copy("app/modules/dataset/uvl_examples/file1.uvl", folder)
+
+    entries = service.bulk_archive_entries(datasets)
+    assert [arcname for arcname, _ in entries] == ["dataset_4/file1.uvl", "dataset_2/file1.uvl"]
+
+    size = 2 * os.path.getsize("app/modules/dataset/uvl_examples/file1.uvl")
+    assert len(service.bulk_archive_entries(datasets, max_bytes=size)) == 2
+    with pytest.raises(ArchiveTooLarge) as exc_info:
+        service.bulk_archive_entries(datasets, max_bytes=size - 1)
+    assert exc_info.value.size == size
+
+
+def test_chunked_upload_resumes_and_verifies(tmp_path):
+    with open("app/modules/dataset/uvl_examples/file1.uvl", "rb") as f:
+        content = f.read()
+    service = ChunkedUploadService(chunk_size=100)
+    temp_folder = str(tmp_path)
+
+    upload = service.init(temp_folder, "model.uvl", len(content))
+    upload_id = upload["upload_id"]
+    assert upload["chunks"] == 5
+
+    def put(index):
+        return service.put_chunk(temp_folder, upload_id, index, index * 100, io.BytesIO(content[index * 100:][:100]))
+
+    assert put(3) and put(0)
+    assert not put(0), "A stored chunk is skipped"
+    assert service.status(temp_folder, upload_id)["missing"] == [1, 2, 4]
+    with pytest.raises(UploadError):
+        service.put_chunk(temp_folder, upload_id, 1, 7, io.BytesIO(content[100:200]))
+    with pytest.raises(UploadError) as exc_info:
+        service.finalize(temp_folder, upload_id, "any", str(tmp_path / "model.uvl"))
+    assert exc_info.value.status == 409
+
+    for index in (1, 2, 4):
+        put(index)
+    digests = service.finalize(temp_folder, upload_id, hashlib.md5(content).hexdigest(), str(tmp_path / "model.uvl"))
+    assert digests["size"] == len(content)
+    assert (tmp_path / "model.uvl").read_bytes() == content
+    with pytest.raises(UploadError) as exc_info:
+        service.status(temp_folder, upload_id)
+    assert exc_info.value.status == 404
+
+
+def test_chunked_uploads_expire_and_survive_temp_cleanup(tmp_path):
+    service = ChunkedUploadService(chunk_size=100, ttl=3600)
+    temp_folder = str(tmp_path)
+    old_id = service.init(temp_folder, "old.uvl", 150)["upload_id"]
+    old_folder = os.path.join(temp_folder, ChunkedUploadService.FOLDER, old_id)
+    two_hours_ago = datetime.now().timestamp() - 7200
+    os.utime(old_folder, (two_hours_ago, two_hours_ago))
+
+    new_id = service.init(temp_folder, "new.uvl", 150)["upload_id"]
+    assert not os.path.exists(old_folder), "Starting an upload removes the abandoned ones"
+    assert service.status(temp_folder, new_id)["missing"] == [0, 1]
+
+    (tmp_path / "model.uvl").write_text("features")
+    DataSetService().clear_temp_folder(temp_folder)
+    assert not (tmp_path / "model.uvl").exists()
+    assert service.status(temp_folder, new_id)["missing"] == [0, 1], "Uploads in progress are kept"
+
+    os.utime(os.path.join(temp_folder, ChunkedUploadService.FOLDER, new_id), (two_hours_ago, two_hours_ago))
+    assert service.cleanup_all(str(tmp_path.parent)) == 1
+
+
+def test_joined_files_close_on_error(tmp_path):
+    (tmp_path / "a").write_bytes(b"abc")
+    with pytest.raises(RuntimeError):
+        with _JoinedFiles([str(tmp_path / "a"), str(tmp_path / "b")]) as source:
+            assert source.read(2) == b"ab"
+            handle = source.current
+            raise RuntimeError("client went away")
+    assert handle.closed and source.current is None
+
+
+def test_zip_upload_extracts_uvl_entries_within_limits(tmp_path):
+    with open("app/modules/dataset/uvl_examples/file1.uvl", "rb") as f:
+        content = f.read()
+    archive = io.BytesIO()
+    with zipfile.ZipFile(archive, "w", zipfile.ZIP_DEFLATED) as zip_file:
+        zip_file.writestr("a/model.uvl", content)
+        zip_file.writestr("../b/model.uvl", content)
+        zip_file.writestr("notes.txt", b"not a model")
+
+    service = ZipUploadService(DataSetService())
+    extracted, rejected = service.extract(str(tmp_path), archive)
+    assert [item["filename"] for item in extracted] == ["model.uvl", "model (1).uvl"]
+    assert all(item["digests"]["checksum"] == hashlib.md5(content).hexdigest() for item in extracted)
+    assert rejected == [{"entry": "notes.txt", "reason": "Not a UVL file"}]
+    assert sorted(os.listdir(tmp_path)) == ["model (1).uvl", "model.uvl"], "Entries are flattened into the folder"
+
+    for limited in (ZipUploadService(DataSetService(), max_entries=2),
+                    ZipUploadService(DataSetService(), max_bytes=len(content))):
+        with pytest.raises(UploadError) as exc_info:
+            limited.extract(str(tmp_path / "limited"), archive)
+        assert exc_info.value.status == 413
+    assert not os.path.exists(tmp_path / "limited"), "Nothing is written when a limit is exceeded"
+
+
+def test_zip_upload_reports_timed_out_files_as_not_validated(tmp_path):
+    with open("app/modules/dataset/uvl_examples/file1.uvl", "rb") as f:
+        content = f.read()
+    archive = io.BytesIO()
+    with zipfile.ZipFile(archive, "w") as zip_file:
+        zip_file.writestr("fast.uvl", content)
+        zip_file.writestr("slow.uvl", content + b"\n")
+
+    dataset_service = DataSetService()
+    analyze_upload = dataset_service.analyze_upload
+
+    def analyze(file_path, digests=None):
+        if file_path.endswith("slow.uvl"):
+            raise OperationTimeout(10)
+        return analyze_upload(file_path, digests)
+
+    with patch.object(dataset_service, "analyze_upload", side_effect=analyze):
+        report = ZipUploadService(dataset_service).upload(str(tmp_path), archive)
+
+    assert (report["valid"], report["invalid"], report["not_validated"]) == (1, 0, 1)
+    slow = next(file for file in report["files"] if file["entry"] == "slow.uvl")
+    assert slow["valid"] is None and "could not be validated" in slow["errors"][0]
+    assert not (tmp_path / "slow.uvl").exists()
+
+
+def test_publication_advances_and_resumes(client: FlaskClient):
+    publication_service = DSPublicationService(FakenodoService())
+    dataset = db.session.get(DataSet, 1)
+    publication = publication_service.enqueue(dataset)
+    assert publication_service.enqueue(dataset).id == publication.id, "A dataset is queued once"
+
+    # A worker died while running the first step: its lease has not expired yet
+    publication.locked_until = datetime.utcnow() + timedelta(minutes=5)
+    db.session.commit()
+    assert publication_service.advance_next() is None
+    publication.locked_until = datetime.utcnow() - timedelta(seconds=1)
+    db.session.commit()
+
+    states = []
+    while (advanced := publication_service.advance_next()) is not None:
+        states.append(advanced.state)
+    assert states == ["analyzed", "deposited", "files_uploaded", "published", "doi_synced"]
+    assert dataset.ds_meta_data.dataset_doi == f"fakenodo.doi.{dataset.ds_meta_data.deposition_id}"
+
+    login(client, "user1@example.com", "1234")
+    response = client.get("/dataset/1/publication")
+    assert response.status_code == 200
+    assert response.json["status"] == "done"
+
+
+def test_publication_deposit_commits_the_deposition_at_once(client: FlaskClient):
+    nodo_service = SimpleNamespace(create_new_deposition=lambda ds_meta_data: {"id": 77})
+    dataset = db.session.get(DataSet, 1)
+    dataset.ds_meta_data.deposition_id = None
+    db.session.commit()
+
+    DSPublicationService(nodo_service).deposit(dataset)
+    db.session.rollback()
+    assert dataset.ds_meta_data.deposition_id == 77, "A rollback after the remote call keeps the deposition"
+
+
+def test_publication_analyze_step_counts_and_rolls_up(client: FlaskClient):
+    create_dataset_db(61, num_files=2)
+    dataset = User.query.filter_by(email="user61@example.com").first().data_sets[0]
+    analyses = HubfileService().hubfile_analysis_repository
+    assert not any(analyses.get_by_file_id(file.id) for file in dataset.files())
+
+    DSPublicationService(FakenodoService()).analyze(dataset)
+    assert all(analyses.get_by_file_id(file.id).number_of_configurations for file in dataset.files())
+    assert dataset.ds_meta_data.ds_metrics.number_of_models == len(dataset.feature_models)
+    assert dataset.ds_meta_data.ds_metrics.number_of_configurations is not None
+
+
+def test_download_streams_an_uncached_dataset_after_the_request(tmp_path, monkeypatch):
+    # An app of its own: the request must run (and tear down its session) outside of any outer app context
+    app = create_app('testing')
+    with app.app_context():
+        db.drop_all()
+        db.create_all()
+        create_dataset_db(61, num_files=2)
+        dataset = User.query.filter_by(email="user61@example.com").first().data_sets[0]
+        dataset_id = dataset.id
+        names = sorted(f"dataset_{dataset_id}/{file.name}" for file in dataset.files())
+        db.session.remove()
+
+    monkeypatch.setattr("app.modules.dataset.routes.dataset_archive_cache",
+                        DatasetArchiveCache(str(tmp_path / "archives"), 1024 * 1024))
+    response = app.test_client().get(f"/dataset/download/{dataset_id}")
+    assert response.status_code == 200
+    with zipfile.ZipFile(io.BytesIO(response.get_data())) as archive:
+        assert archive.testzip() is None
+        assert archive.namelist() == names
@@ -1,10 +1,9 @@
-from sqlalchemy import or_, func
+from sqlalchemy import or_, func, select
 from sqlalchemy.orm import aliased
 from app import db
 from app.modules.dataset.models import Author, DSMetaData, DataSet, PublicationType
 from app.modules.featuremodel.models import FeatureModel
-from app.modules.hubfile.models import Hubfile
-from app.modules.flamapy.routes import check_uvl, get_num_configurations
+from app.modules.hubfile.models import Hubfile, HubfileAnalysis
 from core.repositories.BaseRepository import BaseRepository
 from datetime import datetime
 
@@ -117,6 +116,26 @@ class ExploreRepository(BaseRepository):
         query = query.join(FeatureModel, FeatureModel.data_set_id == DataSet.id)  # Unión con FeatureModel
         query = query.join(Hubfile, Hubfile.feature_model_id == FeatureModel.id)  # Unión con Hubfile
 
+        min_configs = int(min_num_configurations) if min_num_configurations.isdigit() else None
+        max_configs = int(max_num_configurations) if max_num_configurations.isdigit() else None
+
+        # Un dataset se descarta si alguno de sus ficheros no cumple el filtro. Los ficheros aún sin análisis
+        # (se analizan al publicar o con `rosemary hubfile:analyze`) cuentan como desconocidos y no descartan
+        if by_valid_uvls == "on":
+            query = query.filter(DataSet.id.notin_(
+                files_analysis_query(HubfileAnalysis.is_valid.is_(False))
+            ))
+
+        if min_configs is not None or max_configs is not None:
+            out_of_range = []
+            if min_configs is not None:
+                out_of_range.append(HubfileAnalysis.number_of_configurations < min_configs)
+            if max_configs is not None:
+                out_of_range.append(HubfileAnalysis.number_of_configurations > max_configs)
+            query = query.filter(DataSet.id.notin_(
+                files_analysis_query(HubfileAnalysis.number_of_configurations.isnot(None), or_(*out_of_range))
+            ))
+
         # Ordenar resultados
         if sorting == "oldest":
             query = query.order_by(DataSet.created_at.asc())
@@ -134,36 +153,12 @@ class ExploreRepository(BaseRepository):
         if max_size_filter is not None:
             results = [ds for ds in results if ds.get_file_total_size() <= max_size_filter]
 
-        if by_valid_uvls == "on":
-            results = [
-                ds for ds in results
-                if all(
-                    all(
-                        check_uvl(file.id)[1] == 200
-                        for file in fm.files
-                    )
-                    for fm in ds.feature_models
-                )
-            ]
-
         if min_uvl.isdigit() or max_uvl.isdigit():
             results = [
                 ds for ds in results
                 if num_uvls_between(ds, min_uvl, max_uvl)
             ]
 
-        if min_num_configurations.isdigit() or max_num_configurations.isdigit():
-            results = [
-                ds for ds in results
-                if all(
-                    all(
-                        num_configurations_between(file.id, min_num_configurations, max_num_configurations)
-                        for file in fm.files
-                    )
-                    for fm in ds.feature_models
-                )
-            ]
-
         return results
 
 
@@ -178,17 +173,10 @@ def num_uvls_between(dataset, min_num, max_num):
                 or valid_max and num <= int(max_num))
 
 
-def num_configurations_between(file_id, min_num_configurations, max_num_configurations):
-    result, status_code = get_num_configurations(file_id)
-
-    if status_code == 200:
-        num = int(result.json["result"])
-        valid_min = min_num_configurations.isdigit()
-        valid_max = max_num_configurations.isdigit()
-        if valid_min and valid_max:
-            return num >= int(min_num_configurations) and num <= int(max_num_configurations)
-        else:
-            return (valid_min and num >= int(min_num_configurations)
-                    or valid_max and num <= int(max_num_configurations))
-
-    return True
+def files_analysis_query(*conditions):
+    return (
+        select(FeatureModel.data_set_id)
+        .join(Hubfile, Hubfile.feature_model_id == FeatureModel.id)
+        .join(HubfileAnalysis, HubfileAnalysis.file_id == Hubfile.id)
+        .where(*conditions)
+    )
@@ -1,5 +1,8 @@
 import pytest
+from app import db
 from app.modules.dataset.models import PublicationType
+from app.modules.hubfile.models import Hubfile, HubfileAnalysis
+from app.modules.hubfile.services import HubfileService
 from app.modules.common.dbutils import create_dataset_db
 
 
@@ -16,7 +19,8 @@ def test_client(test_client):
         create_dataset_db(4, valid=False)
         create_dataset_db(5, authors=authors, total_file_size=5000, num_files=5)
         create_dataset_db(6, authors=authors, total_file_size=10000, num_files=1, tags="tag1")
-        pass
+        # Searches do not analyze files: the analyses are computed beforehand, as on publication
+        list(HubfileService().backfill_analyses())
 
     yield test_client
 
@@ -296,6 +300,29 @@ def test_explore_combined_query_filters_post(test_client):
     assert num == 1, f"Wrong number of datasets for combined query filters: {num}"
 
 
+def test_explore_filters_use_persisted_file_analysis(test_client):
+    with test_client.application.app_context():
+        num_files = Hubfile.query.count()
+        num_analyses = HubfileAnalysis.query.count()
+        assert num_analyses == num_files, f"Every file should have an analysis: {num_analyses}/{num_files}"
+        assert HubfileAnalysis.query.filter_by(is_valid=False).count() == 1, "Only one file is invalid"
+
+        # A file without analysis is unknown: it neither runs an analysis nor excludes its dataset
+        invalid = HubfileAnalysis.query.filter_by(is_valid=False).one()
+        HubfileAnalysis.query.filter_by(id=invalid.id).delete()
+        db.session.commit()
+
+    search_criteria = get_search_criteria(by_valid_uvls="on")
+    response = test_client.post("/explore", json=search_criteria)
+    assert response.status_code == 200, "The explore page could not be accessed."
+    assert len(response.get_json()) == 6, "The dataset of the file without analysis must not be excluded"
+
+    with test_client.application.app_context():
+        assert HubfileAnalysis.query.count() == num_files - 1, "Searches must not analyze files"
+        list(HubfileService().backfill_analyses())
+        assert HubfileAnalysis.query.count() == num_files
+
+
 def get_search_criteria(query="", sorting="newest", publication_type="any",
                         start_date="", end_date="", min_uvl="", max_uvl="",
                         by_valid_uvls="off", min_num_configurations="", max_num_configurations=""):
@@ -9,6 +9,7 @@ from app.modules.dataset.models import DataSet, DSMetaData
 from app.modules.fakenodo.models import Deposition
 from app.modules.fakenodo.repositories import DepositionRepo
 from app.modules.featuremodel.models import FeatureModel
+from app.modules.hubfile.services import HubfileBlobService
 from core.configuration.configuration import uploads_folder_name
 from core.services.BaseService import BaseService
 
@@ -79,15 +80,30 @@ class FakenodoService(BaseService):
         uvl_filename = feature_model.fm_meta_data.uvl_filename
         user_id = current_user.id if user is None else user.id
         file_path = os.path.join(uploads_folder_name(), f"user_{str(user_id)}", f"dataset_{dataset.id}/", uvl_filename)
+        hubfile = next((file for file in feature_model.files if file.name == uvl_filename), None)
+        if hubfile is not None:
+            # Size and checksum were recorded at upload, the file does not need to be read again
+            file_path = HubfileBlobService().resolve(hubfile.checksum, file_path)
+            file_size, file_checksum = hubfile.size, hubfile.checksum
+        else:
+            file_size, file_checksum = os.path.getsize(file_path), checksum(file_path)
         request = {
             "id": deposition_id,
             "file": uvl_filename,
-            "fileSize": os.path.getsize(file_path),
-            "checksum": checksum(file_path),
+            "fileSize": file_size,
+            "checksum": file_checksum,
             "message": f"File Uploaded to deposition with id {deposition_id}"
         }
         return request
 
+    def upload_files(self, dataset: DataSet, deposition_id: int, feature_models: list, user=None) -> list:
+        """
+        Upload the files of several feature models to a deposition in Fakenodo, as ZenodoService does.
+        Returns:
+            list: The responses in JSON format, in the order of ``feature_models``.
+        """
+        return [self.upload_file(dataset, deposition_id, feature_model, user) for feature_model in feature_models]
+
     def publish_deposition(self, deposition_id: int) -> dict:
         """
         Publish a deposition in Fakenodo.
@@ -100,9 +116,7 @@ class FakenodoService(BaseService):
         if not deposition:
             raise Exception("Error 404: Deposition not found")
         try:
-            deposition.doi = f"fakenodo.doi.{deposition_id}"
-            deposition.status = "published"
-            self.deposition_repository.update(deposition)
+            self.deposition_repository.update(deposition_id, doi=f"fakenodo.doi.{deposition_id}", status="published")
             response = {
                 "id": deposition_id,
                 "status": "published",
@@ -146,10 +160,11 @@ class FakenodoService(BaseService):
 
 def checksum(fileName):
     try:
+        hash_md5 = hashlib.md5()
         with open(fileName, "rb") as file:
-            file_content = file.read()
-            res = hashlib.md5(file_content).hexdigest()
-        return res
+            for chunk in iter(lambda: file.read(64 * 1024), b""):
+                hash_md5.update(chunk)
+        return hash_md5.hexdigest()
     except FileNotFoundError:
         raise Exception(f"File {fileName} not found for checksum calculation")
     except Exception as e:
@@ -37,6 +37,13 @@ class FMMetrics(db.Model):
     id = db.Column(db.Integer, primary_key=True)
     solver = db.Column(db.Text)
     not_solver = db.Column(db.Text)
+    number_of_features = db.Column(db.Integer, index=True)
+    number_of_constraints = db.Column(db.Integer, index=True)
+    # Share of the features that appear in cross-tree constraints
+    cross_tree_constraints_ratio = db.Column(db.Float, index=True)
+    depth = db.Column(db.Integer, index=True)
+    # Stored as a double so that huge counts can still be range-filtered
+    number_of_configurations = db.Column(db.Float(precision=53), index=True)
 
     def __repr__(self):
         return f'FMMetrics<solver={self.solver}, not_solver={self.not_solver}>'
@@ -1,6 +1,6 @@
 
 from sqlalchemy import func
-from app.modules.featuremodel.models import FMMetaData, FeatureModel
+from app.modules.featuremodel.models import FMMetaData, FMMetrics, FeatureModel
 from core.repositories.BaseRepository import BaseRepository
 
 
@@ -16,3 +16,8 @@ class FeatureModelRepository(BaseRepository):
 class FMMetaDataRepository(BaseRepository):
     def __init__(self):
         super().__init__(FMMetaData)
+
+
+class FMMetricsRepository(BaseRepository):
+    def __init__(self):
+        super().__init__(FMMetrics)
@@ -1,7 +1,18 @@
-from app.modules.featuremodel.repositories import FMMetaDataRepository, FeatureModelRepository
-from app.modules.hubfile.services import HubfileService
+import logging
+from typing import Optional
+
+from app.modules.featuremodel.models import FMMetaData, FMMetrics
+from app.modules.featuremodel.repositories import FMMetaDataRepository, FMMetricsRepository, FeatureModelRepository
+from app.modules.flamapy.executor import ExecutorSaturated, get_executor, structural_metrics_task
+from app.modules.flamapy.services import FlamapyService
+from app.modules.hubfile.services import HubfileService, as_double
 from core.services.BaseService import BaseService
 
+logger = logging.getLogger(__name__)
+
+# Metrics that come from the parsed model alone (see FlamapyService.structural_metrics)
+STRUCTURAL_METRICS = ("number_of_features", "number_of_constraints", "cross_tree_constraints_ratio", "depth")
+
 
 class FeatureModelService(BaseService):
     def __init__(self):
@@ -20,3 +31,48 @@ class FeatureModelService(BaseService):
     class FMMetaDataService(BaseService):
         def __init__(self):
             super().__init__(FMMetaDataRepository())
+
+
+class FMMetricsService(BaseService):
+    def __init__(self):
+        super().__init__(FMMetricsRepository())
+
+    def compute(self, file_path: str, checksum: str, structural: Optional[dict] = None,
+                configurations: Optional[float] = None, count: bool = True) -> dict:
+        """
+        Compute the metrics of one feature model. It does not touch the database, so several files can be
+        processed from threads at once; the parsing and counting run in the flamapy pool.
+
+        Args:
+            file_path (str): Path of the UVL file.
+            checksum (str): Checksum of the file, used to reuse its cached parsed model.
+            structural (dict): Output of ``FlamapyService.structural_metrics``, when already known (e.g. the
+                upload analysis). Computed when missing or incomplete.
+            configurations (float): The configuration count, when already known (e.g. a stored analysis).
+            count (bool): Whether to count the configurations when ``configurations`` is not given.
+
+        Returns:
+            dict: Column values for ``FMMetrics``. Only the structural metrics of invalid models are None.
+        """
+        if structural is None or structural.get("depth") is None:
+            try:
+                structural = get_executor().run(structural_metrics_task, file_path, checksum)
+            except ExecutorSaturated:
+                structural = FlamapyService().structural_metrics(file_path, checksum)
+
+        metrics = {name: structural.get(name) for name in STRUCTURAL_METRICS}
+        if configurations is None and count and structural["is_valid"]:
+            configurations = FlamapyService().count_or_estimate_configurations(file_path, checksum)["value"]
+        metrics["number_of_configurations"] = as_double(configurations)
+        return metrics
+
+    def store(self, fm_meta_data: FMMetaData, metrics: dict, commit: bool = False) -> FMMetrics:
+        """Create or update the metrics of a feature model."""
+        if fm_meta_data.fm_metrics is None:
+            fm_meta_data.fm_metrics = self.repository.create(commit=False, **metrics)
+        else:
+            for name, value in metrics.items():
+                setattr(fm_meta_data.fm_metrics, name, value)
+        if commit:
+            self.repository.session.commit()
+        return fm_meta_data.fm_metrics
@@ -1,5 +1,7 @@
 import pytest
 
+from app.modules.featuremodel.services import FMMetricsService
+
 
 @pytest.fixture(scope='module')
 def test_client(test_client):
@@ -22,3 +24,20 @@ def test_sample_assertion(test_client):
     """
     greeting = "Hello, World!"
     assert greeting == "Hello, World!", "The greeting does not coincide with 'Hello, World!'"
+
+
+def test_fm_metrics_compute():
+    metrics = FMMetricsService().compute("app/modules/dataset/uvl_examples/file1.uvl", None)
+    assert metrics["number_of_features"] == 10
+    assert metrics["number_of_constraints"] == 2
+    assert 0 < metrics["cross_tree_constraints_ratio"] <= 1
+    assert metrics["depth"] >= 1
+    assert metrics["number_of_configurations"] > 0
+
+
+def test_fm_metrics_compute_reuses_known_values():
+    structural = {"is_valid": True, "number_of_features": 3, "number_of_constraints": 1,
+                  "cross_tree_constraints_ratio": 0.5, "depth": 4}
+    metrics = FMMetricsService().compute("missing.uvl", None, structural, configurations=7, count=False)
+    assert metrics == {"number_of_features": 3, "number_of_constraints": 1, "cross_tree_constraints_ratio": 0.5,
+                       "depth": 4, "number_of_configurations": 7.0}
@@ -0,0 +1,196 @@
+import math
+import random
+import statistics
+import threading
+import time
+
+from pysat.solvers import Solver
+
+
+class ApproximationTimeout(Exception):
+    """Raised when not a single estimation round could finish before the deadline."""
+
+    def __init__(self, deadline: float):
+        super().__init__(deadline)
+        self.deadline = deadline
+
+    def __str__(self):
+        return f"No estimate could be computed within {self.deadline} seconds"
+
+
+class ApproximateCounter:
+    """
+    Hashing-based model counter in the style of ApproxMC. Each round adds ``m`` random XOR constraints over
+    the feature variables, which split the configuration space into ``2^m`` cells of about the same size,
+    and counts the solutions of one cell up to a threshold. The count of a small enough cell times ``2^m``
+    estimates the total; the median of the rounds is returned together with the ``(1 + tolerance)`` bounds.
+
+    Rounds run until the requested number is reached or the deadline passes; a SAT call still running at
+    the deadline is interrupted.
+    """
+
+    def __init__(self, tolerance: float = 0.8, confidence: float = 0.8, solver: str = "minisat22", seed=None):
+        self.tolerance = tolerance
+        self.confidence = confidence
+        self.solver = solver
+        self.random = random.Random(seed)
+        # Cell size below which the cell is counted exactly (ApproxMC's thresh)
+        self.threshold = int(1 + 9.84 * (1 + tolerance / (1 + tolerance)) * (1 + 1 / tolerance) ** 2)
+        # Rounds needed for the requested confidence
+        self.rounds = max(int(math.ceil(17 * math.log2(3 / (1 - confidence)))), 1)
+
+    def count(self, clauses: list, variables: list, deadline: float) -> dict:
+        """
+        Estimate the number of assignments of ``variables`` that satisfy ``clauses``.
+
+        Args:
+            clauses (list): CNF clauses (lists of non-zero ints).
+            variables (list): Variables the solutions are projected on (the features).
+            deadline (float): Seconds available.
+
+        Returns:
+            dict: ``estimate``, ``lower_bound``, ``upper_bound``, ``exact``, ``rounds``, ``tolerance``
+            and ``confidence`` (the confidence the completed rounds actually guarantee).
+
+        Raises:
+            ApproximationTimeout: When the deadline passes before the first estimate.
+        """
+        end = time.monotonic() + deadline
+        top = max((abs(literal) for clause in clauses for literal in clause), default=0)
+        top = max([top] + list(variables))
+
+        solutions = self._bounded_count(clauses, variables, self.threshold, end)
+        if solutions is None:
+            raise ApproximationTimeout(deadline)
+        if solutions < self.threshold:
+            return self._result(solutions, solutions, solutions, exact=True, rounds=0)
+
+        estimates = []
+        hashes = 1
+        while len(estimates) < self.rounds and time.monotonic() < end:
+            estimate, hashes = self._round(clauses, variables, top, hashes, end)
+            if estimate is None:
+                break
+            estimates.append(estimate)
+
+        if not estimates:
+            raise ApproximationTimeout(deadline)
+
+        estimate = int(statistics.median_low(estimates))
+        return self._result(estimate, int(estimate / (1 + self.tolerance)),
+                            int(math.ceil(estimate * (1 + self.tolerance))), exact=False, rounds=len(estimates))
+
+    def _round(self, clauses, variables, top, hashes, end):
+        """One estimate: search the fewest nested XORs that leave a cell under the threshold."""
+        xors = []
+        cells = {}
+        # Largest number of hashes known to leave too many solutions and smallest known to leave few enough.
+        # Without hashes the model is over the threshold (otherwise it was counted exactly).
+        low, high = 0, None
+        # Start from the number of hashes that worked last round, it is usually right or close
+        hashes = max(min(hashes, len(variables)), 1)
+        while high is None or high - low > 1:
+            while len(xors) < hashes:
+                xors.append(self._random_xor(variables))
+            xor_clauses = self._encode_xors(xors[:hashes], top)
+            solutions = self._bounded_count(clauses + xor_clauses, variables, self.threshold, end)
+            if solutions is None:
+                return None, hashes
+            cells[hashes] = solutions
+            if solutions >= self.threshold:
+                low = hashes
+                if low == len(variables):
+                    return solutions * 2 ** low, low
+                # Gallop up until a small enough cell is found, then bisect
+                hashes = min(hashes * 2, len(variables)) if high is None else (low + high) // 2
+            else:
+                high = hashes
+                hashes = (low + high) // 2
+                if hashes == low:
+                    break
+        return cells[high] * 2 ** high, high
+
+    def _random_xor(self, variables):
+        return [variable for variable in variables if self.random.random() < 0.5], self.random.random() < 0.5
+
+    def _encode_xors(self, xors, top):
+        """
+        CNF encoding of XOR constraints, chained through auxiliary variables numbered above ``top``.
+
+        The system is first put in reduced row echelon form so that every constraint defines its own pivot
+        variable: plain CDCL solvers are very slow on raw random XORs but propagate definitions for free.
+        """
+        rows = []
+        for chosen, parity in xors:
+            row = set(chosen)
+            for pivot, other, other_parity in rows:
+                if pivot in row:
+                    row ^= other
+                    parity ^= other_parity
+            if not row:
+                if parity:
+                    # 0 == 1: the cell is empty
+                    return [[]]
+                continue
+            pivot = max(row)
+            for index, (other_pivot, other, other_parity) in enumerate(rows):
+                if pivot in other:
+                    rows[index] = (other_pivot, other ^ row, other_parity ^ parity)
+            rows.append((pivot, row, parity))
+
+        clauses = []
+        for pivot, row, parity in rows:
+            # Chain the free variables first and the pivot last, so the pivot is propagated
+            chain = sorted(row - {pivot}) + [pivot]
+            current = chain[0]
+            for variable in chain[1:]:
+                top += 1
+                # top <-> current XOR variable
+                clauses += [[-top, current, variable], [-top, -current, -variable],
+                            [top, -current, variable], [top, current, -variable]]
+                current = top
+            clauses.append([current] if parity else [-current])
+        return clauses
+
+    def _bounded_count(self, clauses, variables, limit, end):
+        """Count projected solutions up to ``limit``; None when the deadline interrupts the solver."""
+        if any(not clause for clause in clauses):
+            return 0
+        found = 0
+        with Solver(name=self.solver, bootstrap_with=clauses) as solver:
+            while found < limit:
+                remaining = end - time.monotonic()
+                if remaining <= 0:
+                    return None
+                timer = threading.Timer(remaining, solver.interrupt)
+                timer.start()
+                try:
+                    satisfiable = solver.solve_limited(expect_interrupt=True)
+                finally:
+                    timer.cancel()
+                if satisfiable is None:
+                    return None
+                if not satisfiable:
+                    break
+                found += 1
+                model = solver.get_model()
+                values = {abs(literal): literal > 0 for literal in model}
+                # Block this projected solution
+                solver.add_clause([-variable if values.get(variable, False) else variable for variable in variables])
+                solver.clear_interrupt()
+        return found
+
+    def _result(self, estimate, lower_bound, upper_bound, exact, rounds):
+        if exact:
+            confidence = 1.0
+        else:
+            confidence = max(0.0, 1 - 3 * 2 ** (-rounds / 17))
+        return {
+            "estimate": estimate,
+            "lower_bound": lower_bound,
+            "upper_bound": upper_bound,
+            "exact": exact,
+            "rounds": rounds,
+            "tolerance": 0.0 if exact else self.tolerance,
+            "confidence": confidence if exact else min(confidence, self.confidence),
+        }
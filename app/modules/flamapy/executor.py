@@ -0,0 +1,239 @@
+import logging
+import multiprocessing
+import os
+import queue
+import threading
+import time
+
+logger = logging.getLogger(__name__)
+
+
+class ExecutorSaturated(Exception):
+    """Raised when every worker is busy and the waiting queue is full."""
+
+    def __init__(self, retry_after: int):
+        super().__init__("The analysis pool is saturated, try again later")
+        self.retry_after = retry_after
+
+
+class OperationTimeout(Exception):
+    """Raised when an operation runs over its time limit. The worker running it has been killed."""
+
+    def __init__(self, timeout: float):
+        super().__init__(f"The operation did not finish within {timeout} seconds")
+        self.timeout = timeout
+
+
+class WorkerCrashed(Exception):
+    """Raised when the pool process running an operation dies (e.g. killed out of memory). It is replaced."""
+
+    def __init__(self, reason):
+        super().__init__(f"The analysis worker crashed: {reason}")
+
+
+def _worker_main(conn):
+    while True:
+        try:
+            func, args, kwargs = conn.recv()
+        except (EOFError, OSError):
+            return
+        try:
+            conn.send((True, func(*args, **kwargs)))
+        except Exception as exc:
+            try:
+                conn.send((False, exc))
+            except Exception:
+                # The exception itself could not be pickled
+                conn.send((False, RuntimeError(str(exc))))
+
+
+class _Worker:
+    def __init__(self, context):
+        self.conn, child_conn = context.Pipe()
+        self.process = context.Process(target=_worker_main, args=(child_conn,), daemon=True)
+        self.process.start()
+        child_conn.close()
+
+    def kill(self):
+        self.conn.close()
+        self.process.terminate()
+        self.process.join(1)
+        if self.process.is_alive():
+            self.process.kill()
+            self.process.join()
+
+
+class FlamapyExecutor:
+    """
+    Pool of pre-started processes that run heavy flamapy operations (SAT/BDD counting, conversions) outside
+    of the web worker. Every call has its own time limit: a worker that runs over it is killed and replaced.
+    Callers beyond the pool size wait in a bounded queue; once it is full ``ExecutorSaturated`` is raised so
+    the route can answer 503 instead of piling up requests.
+    """
+
+    def __init__(self, workers: int, max_queue: int, default_timeout: float, retry_after: int = 5):
+        self.workers = workers
+        self.max_queue = max_queue
+        self.default_timeout = default_timeout
+        self.retry_after = retry_after
+        self.pid = os.getpid()
+        self._context = multiprocessing.get_context("fork")
+        self._idle = queue.Queue()
+        self._lock = threading.Lock()
+        self._in_flight = 0
+        for _ in range(workers):
+            self._idle.put(_Worker(self._context))
+
+    def run(self, func, *args, timeout: float = None, **kwargs):
+        """
+        Run ``func(*args, **kwargs)`` in a pool process and return its result.
+
+        Args:
+            func: A module-level (picklable) function.
+            timeout (float): Seconds allowed for waiting a free worker plus running the operation.
+
+        Raises:
+            ExecutorSaturated: When all workers are busy and the queue is full.
+            OperationTimeout: When the operation does not finish in time.
+            WorkerCrashed: When the worker process dies while running the operation.
+        """
+        timeout = self.default_timeout if timeout is None else timeout
+        deadline = time.monotonic() + timeout
+
+        with self._lock:
+            if self._in_flight >= self.workers + self.max_queue:
+                raise ExecutorSaturated(self.retry_after)
+            self._in_flight += 1
+
+        try:
+            try:
+                worker = self._idle.get(timeout=timeout)
+            except queue.Empty:
+                raise OperationTimeout(timeout)
+
+            try:
+                worker.conn.send((func, args, kwargs))
+                if not worker.conn.poll(max(deadline - time.monotonic(), 0)):
+                    logger.warning(f"Killing flamapy worker {worker.process.pid} after {timeout}s")
+                    worker.kill()
+                    worker = _Worker(self._context)
+                    raise OperationTimeout(timeout)
+                success, value = worker.conn.recv()
+            except (EOFError, OSError) as exc:
+                # The worker died (e.g. out of memory); replace it
+                worker.kill()
+                worker = _Worker(self._context)
+                raise WorkerCrashed(exc)
+            finally:
+                self._idle.put(worker)
+        finally:
+            with self._lock:
+                self._in_flight -= 1
+
+        if not success:
+            raise value
+        return value
+
+    def shutdown(self):
+        while True:
+            try:
+                self._idle.get_nowait().kill()
+            except queue.Empty:
+                return
+
+    def to_dict(self):
+        return {
+            "workers": self.workers,
+            "idle": self._idle.qsize(),
+            "in_flight": self._in_flight,
+            "max_queue": self.max_queue,
+            "default_timeout": self.default_timeout,
+        }
+
+
+_executor = None
+_executor_lock = threading.Lock()
+
+
+def default_workers() -> int:
+    """
+    Pool size per web process: the host CPUs but one, shared among the gunicorn workers (``WEB_CONCURRENCY``,
+    which gunicorn also reads for its own worker count) so that the pools of a host do not add up past it.
+    """
+    web_workers = max(int(os.getenv("WEB_CONCURRENCY", 1)), 1)
+    return max(((os.cpu_count() or 2) - 1) // web_workers, 1)
+
+
+def get_executor() -> FlamapyExecutor:
+    """
+    Return the pool of the current process, starting it on first use (and again after a fork). Gunicorn
+    workers start it at boot (``post_worker_init`` in gunicorn.conf.py), before serving requests.
+    """
+    global _executor
+    with _executor_lock:
+        if _executor is None or _executor.pid != os.getpid():
+            _executor = FlamapyExecutor(
+                workers=int(os.getenv("FLAMAPY_WORKERS", default_workers())),
+                max_queue=int(os.getenv("FLAMAPY_MAX_QUEUE", 8)),
+                default_timeout=float(os.getenv("FLAMAPY_OPERATION_TIMEOUT", 60)),
+                retry_after=int(os.getenv("FLAMAPY_RETRY_AFTER", 5)),
+            )
+        return _executor
+
+
+def count_configurations_task(file_path: str, checksum: str = None, engine: str = None) -> int:
+    from app.modules.flamapy.services import FlamapyService
+
+    service = FlamapyService()
+    return service.count_configurations(service.get_feature_model(file_path, checksum), checksum, engine)
+
+
+def approximate_count_task(file_path: str, checksum: str = None, deadline: float = None) -> dict:
+    from app.modules.flamapy.services import FlamapyService
+
+    service = FlamapyService()
+    return service.approximate_count(service.get_feature_model(file_path, checksum), deadline)
+
+
+def feature_commonality_task(file_path: str, checksum: str = None) -> dict:
+    from app.modules.flamapy.services import FlamapyService
+
+    service = FlamapyService()
+    return service.feature_commonality(service.get_feature_model(file_path, checksum), checksum)
+
+
+def validate_task(file_path: str) -> list:
+    from app.modules.flamapy.services import FlamapyService
+
+    return FlamapyService().validate_uvl(file_path)
+
+
+def structural_metrics_task(file_path: str, checksum: str = None) -> dict:
+    from app.modules.flamapy.services import FlamapyService
+
+    return FlamapyService().structural_metrics(file_path, checksum)
+
+
+def cache_model_task(file_path: str, checksum: str = None):
+    from app.modules.flamapy.services import FlamapyService
+
+    FlamapyService().get_feature_model(file_path, checksum)
+
+
+def convert_task(file_path: str, checksum: str, target_format: str) -> str:
+    from app.modules.flamapy.services import FlamapyService
+
+    return FlamapyService().get_artifact(file_path, target_format, checksum)
+
+
+def convert_to_path_task(file_path: str, checksum: str, target_format: str, output_path: str) -> str:
+    from app.modules.flamapy.services import FlamapyService
+
+    service = FlamapyService()
+    return service.convert(service.get_feature_model(file_path, checksum), target_format, output_path)
+
+
+def run_operations_task(file_path: str, checksum: str, operations: list, engine: str = None) -> dict:
+    from app.modules.flamapy.services import FlamapyService
+
+    return FlamapyService().run_operations(file_path, checksum, operations, engine)
@@ -0,0 +1,43 @@
+from datetime import datetime, timezone
+
+from app import db
+
+
+class FlamapyJob(db.Model):
+    __tablename__ = 'flamapy_job'
+    id = db.Column(db.Integer, primary_key=True)
+    file_id = db.Column(db.Integer, db.ForeignKey('file.id'), nullable=False)
+    user_id = db.Column(db.Integer, db.ForeignKey('user.id'), nullable=True)
+    operation = db.Column(db.String(50), nullable=False)
+    status = db.Column(db.String(20), nullable=False, default='queued', index=True)
+    result = db.Column(db.JSON)
+    artifact_path = db.Column(db.String(512))
+    error = db.Column(db.Text)
+    created_at = db.Column(db.DateTime, nullable=False, default=lambda: datetime.now(timezone.utc))
+    started_at = db.Column(db.DateTime)
+    finished_at = db.Column(db.DateTime)
+
+    file = db.relationship('Hubfile')
+
+    QUEUED = 'queued'
+    RUNNING = 'running'
+    DONE = 'done'
+    FAILED = 'failed'
+
+    def to_dict(self):
+        from flask import url_for
+        return {
+            'id': self.id,
+            'file_id': self.file_id,
+            'operation': self.operation,
+            'status': self.status,
+            'result': self.result,
+            'artifact': url_for('flamapy.job_artifact', job_id=self.id) if self.artifact_path else None,
+            'error': self.error,
+            'created_at': self.created_at,
+            'started_at': self.started_at,
+            'finished_at': self.finished_at,
+        }
+
+    def __repr__(self):
+        return f'FlamapyJob<{self.id}, {self.operation}, {self.status}>'
@@ -1,7 +1,28 @@
-from app.modules.flamapy.models import Flamapy
+from datetime import datetime
+from typing import Optional
+
+from sqlalchemy import and_, or_
+
+from app.modules.flamapy.models import FlamapyJob
 from core.repositories.BaseRepository import BaseRepository
 
 
-class FlamapyRepository(BaseRepository):
+class FlamapyJobRepository(BaseRepository):
     def __init__(self):
-        super().__init__(Flamapy)
+        super().__init__(FlamapyJob)
+
+    def claim_next(self, stale_before: datetime) -> Optional[FlamapyJob]:
+        """
+        Lock the oldest queued job, or running job started before ``stale_before`` (its worker died), so that
+        concurrent workers never pick the same one. The caller must commit to release the lock.
+        """
+        return (
+            self.model.query
+            .filter(or_(
+                self.model.status == FlamapyJob.QUEUED,
+                and_(self.model.status == FlamapyJob.RUNNING, self.model.started_at < stale_before),
+            ))
+            .order_by(self.model.id.asc())
+            .with_for_update(skip_locked=True)
+            .first()
+        )
@@ -1,72 +1,77 @@
 import logging
+import math
 from app.modules.hubfile.services import HubfileService
-from flask import send_file, jsonify
+from flask import abort, request, jsonify, url_for
+from flask_login import current_user
 from app.modules.flamapy import flamapy_bp
-from flamapy.metamodels.fm_metamodel.transformations import UVLReader, GlencoeWriter, SPLOTWriter
-from flamapy.metamodels.pysat_metamodel.transformations import FmToPysat, DimacsWriter
-from flamapy.core.discover import DiscoverMetamodels
-import tempfile
+import mimetypes
 import os
 
-from antlr4 import CommonTokenStream, FileStream
-from uvl.UVLCustomLexer import UVLCustomLexer
-from uvl.UVLPythonParser import UVLPythonParser
-from antlr4.error.ErrorListener import ErrorListener
+from app.modules.flamapy.approximate import ApproximationTimeout
+from app.modules.flamapy.executor import (ExecutorSaturated, OperationTimeout, WorkerCrashed,
+                                          approximate_count_task, count_configurations_task,
+                                          feature_commonality_task, get_executor, run_operations_task)
+from app.modules.flamapy.runtime import get_runtime
+from app.modules.flamapy.services import (ANALYSIS_OPERATIONS, APPROXIMATE_COUNT_DEADLINE, COUNTING_ENGINES,
+                                          CONVERSIONS, DEFAULT_COUNTING_ENGINE, BDDNodeBudgetExceeded,
+                                          FlamapyJobService, FlamapyService)
 from werkzeug.exceptions import NotFound
+from core.streaming.file_response import deliver_file
 
 
 logger = logging.getLogger(__name__)
 
+MAX_BATCH_SIZE = 500
+
+
+def saturated_response(exc: ExecutorSaturated):
+    response = jsonify({"error": str(exc)})
+    response.status_code = 503
+    response.headers["Retry-After"] = str(exc.retry_after)
+    return response
+
+
+@flamapy_bp.errorhandler(WorkerCrashed)
+def worker_crashed(e):
+    # The crashed worker has been replaced, so the request can be retried
+    logger.error(str(e))
+    response = jsonify({"error": str(e)})
+    response.status_code = 503
+    response.headers["Retry-After"] = str(get_executor().retry_after)
+    return response
+
 
 @flamapy_bp.route('/flamapy/check_uvl/<int:file_id>', methods=['GET'])
 def check_uvl(file_id):
-    class CustomErrorListener(ErrorListener):
-        def __init__(self):
-            self.errors = []
-
-        def syntaxError(self, recognizer, offendingSymbol, line, column, msg, e):
-            if "\\t" in msg:
-                warning_message = (
-                    f"The UVL has the following warning that prevents reading it: "
-                    f"Line {line}:{column} - {msg}"
-                )
-                print(warning_message)
-                self.errors.append(warning_message)
-            else:
-                error_message = (
-                    f"The UVL has the following error that prevents reading it: "
-                    f"Line {line}:{column} - {msg}"
-                )
-                self.errors.append(error_message)
-
     try:
         hubfile = HubfileService().get_by_id(file_id)
-        input_stream = FileStream(hubfile.get_path())
-        lexer = UVLCustomLexer(input_stream)
-
-        error_listener = CustomErrorListener()
+        errors = FlamapyService().validate_uvl(hubfile.get_path())
 
-        lexer.removeErrorListeners()
-        lexer.addErrorListener(error_listener)
+        if errors:
+            return jsonify({"errors": errors}), 400
 
-        stream = CommonTokenStream(lexer)
-        parser = UVLPythonParser(stream)
+        return jsonify({"message": "Valid Model"}), 200
 
-        parser.removeErrorListeners()
-        parser.addErrorListener(error_listener)
+    except Exception as e:
+        return jsonify({"error": str(e)}), 500
 
-        tree = parser.featureModel()
 
-        if error_listener.errors:
-            return jsonify({"errors": error_listener.errors}), 400
+@flamapy_bp.route('/flamapy/check_uvl/batch', methods=['POST'])
+def check_uvl_batch():
+    data = request.get_json(silent=True) or {}
+    file_ids = data.get("file_ids")
 
-        # Optional: Print the parse tree
-        print(tree.toStringTree(recog=parser))
+    if not isinstance(file_ids, list) or not all(isinstance(file_id, int) for file_id in file_ids):
+        return jsonify({"error": "'file_ids' must be a list of integers"}), 400
 
-        return jsonify({"message": "Valid Model"}), 200
+    if len(file_ids) > MAX_BATCH_SIZE:
+        return jsonify({"error": f"At most {MAX_BATCH_SIZE} files can be checked per request"}), 400
 
-    except Exception as e:
-        return jsonify({"error": str(e)}), 500
+    try:
+        results = HubfileService().validate_batch(file_ids)
+    except ExecutorSaturated as e:
+        return saturated_response(e)
+    return jsonify({"results": results}), 200
 
 
 @flamapy_bp.route('/flamapy/valid/<int:file_id>', methods=['GET'])
@@ -76,7 +81,6 @@ def valid(file_id):
 
 @flamapy_bp.route('/flamapy/to_glencoe/<int:file_id>', methods=['GET'])
 def to_glencoe(file_id):
-    temp_file = tempfile.NamedTemporaryFile(suffix='.json', delete=False)
     try:
         hubfile = HubfileService().get_or_404(file_id)
         file_name = hubfile.name
@@ -85,11 +89,9 @@ def to_glencoe(file_id):
         # Agrega un mensaje de depuración
         if not os.path.isfile(file_path):
             raise NotFound(f"File {file_name} not found")
-        fm1 = UVLReader(file_path).transform()
-        GlencoeWriter(temp_file.name, fm1).transform()
+        artifact_path = FlamapyService().get_artifact(file_path, "glencoe", hubfile.checksum)
         # Return the file in the response
-        return send_file(temp_file.name, as_attachment=True, download_name=f'{hubfile.name}_glencoe.txt',
-                         mimetype='text/plain')
+        return deliver_file(artifact_path, mimetype='text/plain', download_name=f'{hubfile.name}_glencoe.txt')
     except NotFound as e:
         # Manejar el caso en que el archivo no se encuentra
         # Solo devolver el mensaje sin el "404 Not Found" al principio
@@ -101,7 +103,6 @@ def to_glencoe(file_id):
 
 @flamapy_bp.route('/flamapy/to_splot/<int:file_id>', methods=['GET'])
 def to_splot(file_id):
-    temp_file = tempfile.NamedTemporaryFile(suffix='.splx', delete=False)
     try:
         hubfile = HubfileService().get_by_id(file_id)
         file_name = hubfile.name
@@ -110,12 +111,10 @@ def to_splot(file_id):
         if not os.path.isfile(file_path):
             raise NotFound(f"File {file_name} not found")
 
-        fm = UVLReader(file_path).transform()
-        SPLOTWriter(temp_file.name, fm).transform()
+        artifact_path = FlamapyService().get_artifact(file_path, "splot", hubfile.checksum)
 
         # Return the file in the response
-        return send_file(temp_file.name, as_attachment=True, download_name=f'{hubfile.name}_splot.txt',
-                         mimetype='text/plain')
+        return deliver_file(artifact_path, mimetype='text/plain', download_name=f'{hubfile.name}_splot.txt')
     except NotFound as e:
         # Manejar el caso en que el archivo no se encuentra
         # Solo devolver el mensaje sin el "404 Not Found" al principio
@@ -127,7 +126,6 @@ def to_splot(file_id):
 
 @flamapy_bp.route('/flamapy/to_cnf/<int:file_id>', methods=['GET'])
 def to_cnf(file_id):
-    temp_file = tempfile.NamedTemporaryFile(suffix='.cnf', delete=False)
     try:
         hubfile = HubfileService().get_by_id(file_id)
         file_name = hubfile.name
@@ -136,13 +134,10 @@ def to_cnf(file_id):
         if not os.path.isfile(file_path):
             raise NotFound(f"File {file_name} not found")
 
-        fm = UVLReader(file_path).transform()
-        sat = FmToPysat(fm).transform()
-        DimacsWriter(temp_file.name, sat).transform()
+        artifact_path = FlamapyService().get_artifact(file_path, "dimacs", hubfile.checksum)
 
         # Return the file in the response
-        return send_file(temp_file.name, as_attachment=True, download_name=f'{hubfile.name}_cnf.txt',
-                         mimetype='text/plain')
+        return deliver_file(artifact_path, mimetype='text/plain', download_name=f'{hubfile.name}_cnf.txt')
     except NotFound as e:
         # Manejar el caso en que el archivo no se encuentra
         # Solo devolver el mensaje sin el "404 Not Found" al principio
@@ -163,8 +158,146 @@ def get_num_configurations(file_id):
     # file_path = os.path.join(directory_path, file_name)
     file_path = hubfile.get_path()
 
-    # Initiallize the dicover metamodel
-    dm = DiscoverMetamodels()
-    result = dm.use_operation_from_file("PySATConfigurationsNumber", file_path)
+    mode = request.args.get("mode", "exact")
+    if mode == "approx":
+        return get_approximate_num_configurations(hubfile)
+    if mode != "exact":
+        return jsonify({"error": f"Unknown mode '{mode}'. Available: exact, approx"}), 400
+
+    engine = request.args.get("engine", DEFAULT_COUNTING_ENGINE)
+    if engine not in COUNTING_ENGINES:
+        return jsonify({"error": f"Unknown engine '{engine}'. Available: {', '.join(COUNTING_ENGINES)}"}), 400
+
+    try:
+        result = get_executor().run(count_configurations_task, file_path, hubfile.checksum, engine)
+    except ExecutorSaturated as e:
+        return saturated_response(e)
+    except OperationTimeout as e:
+        return jsonify({"error": str(e)}), 504
+
+    return jsonify({"result": result, "engine": engine}), 200
+
+
+def get_approximate_num_configurations(hubfile):
+    try:
+        deadline = float(request.args.get("deadline", APPROXIMATE_COUNT_DEADLINE))
+    except ValueError:
+        deadline = math.nan
+    if not math.isfinite(deadline) or deadline <= 0:
+        return jsonify({"error": "The deadline must be a positive number of seconds"}), 400
+    deadline = min(deadline, APPROXIMATE_COUNT_DEADLINE)
+
+    try:
+        # The counter stops itself at the deadline; the executor timeout only guards against a stuck worker
+        estimate = get_executor().run(approximate_count_task, hubfile.get_path(), hubfile.checksum, deadline,
+                                      timeout=deadline * 2 + 5)
+    except ExecutorSaturated as e:
+        return saturated_response(e)
+    except (OperationTimeout, ApproximationTimeout) as e:
+        return jsonify({"error": str(e)}), 504
+
+    return jsonify({"result": estimate["estimate"], "mode": "approx", **estimate}), 200
+
+
+@flamapy_bp.route('/flamapy/commonality/<int:file_id>', methods=['GET'])
+def get_feature_commonality(file_id):
+    (_, status_code) = check_uvl(file_id)
+    if status_code != 200:
+        return jsonify({"error": "Internal error"}), 500
+    hubfile = HubfileService().get_or_404(file_id)
+
+    try:
+        result = get_executor().run(feature_commonality_task, hubfile.get_path(), hubfile.checksum)
+    except ExecutorSaturated as e:
+        return saturated_response(e)
+    except OperationTimeout as e:
+        return jsonify({"error": str(e)}), 504
+    except BDDNodeBudgetExceeded as e:
+        return jsonify({"error": str(e)}), 422
 
     return jsonify({"result": result}), 200
+
+
+@flamapy_bp.route('/flamapy/analyze/<int:file_id>', methods=['GET'])
+def analyze(file_id):
+    hubfile = HubfileService().get_or_404(file_id)
+
+    ops = request.args.get("ops")
+    operations = [op.strip() for op in ops.split(",") if op.strip()] if ops else list(ANALYSIS_OPERATIONS)
+    unknown = [op for op in operations if op not in ANALYSIS_OPERATIONS]
+    if unknown:
+        return jsonify({"error": f"Unknown operations {', '.join(unknown)}. "
+                                 f"Available: {', '.join(ANALYSIS_OPERATIONS)}"}), 400
+
+    engine = request.args.get("engine", DEFAULT_COUNTING_ENGINE)
+    if engine not in COUNTING_ENGINES:
+        return jsonify({"error": f"Unknown engine '{engine}'. Available: {', '.join(COUNTING_ENGINES)}"}), 400
+
+    try:
+        result = get_executor().run(run_operations_task, hubfile.get_path(), hubfile.checksum, operations, engine)
+    except ExecutorSaturated as e:
+        return saturated_response(e)
+    except OperationTimeout as e:
+        return jsonify({"error": str(e)}), 504
+
+    return jsonify({"file_id": file_id, **result}), 200
+
+
+@flamapy_bp.route('/flamapy/cache/stats', methods=['GET'])
+def cache_stats():
+    return jsonify(FlamapyService().get_cache_stats()), 200
+
+
+@flamapy_bp.route('/flamapy/executor/stats', methods=['GET'])
+def executor_stats():
+    return jsonify(get_executor().to_dict()), 200
+
+
+@flamapy_bp.route('/flamapy/runtime/stats', methods=['GET'])
+def runtime_stats():
+    return jsonify(get_runtime().to_dict()), 200
+
+
+@flamapy_bp.route('/flamapy/jobs', methods=['POST'])
+def create_job():
+    data = request.get_json(silent=True) or {}
+    file_id = data.get("file_id")
+    operation = data.get("operation")
+
+    if not isinstance(file_id, int) or not operation:
+        return jsonify({"error": "'file_id' (int) and 'operation' are required"}), 400
+
+    HubfileService().get_or_404(file_id)
+
+    try:
+        job = FlamapyJobService().create_job(
+            file_id, operation, user_id=current_user.id if current_user.is_authenticated else None
+        )
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+
+    response = jsonify(job.to_dict())
+    response.status_code = 202
+    response.headers["Location"] = url_for('flamapy.get_job', job_id=job.id)
+    return response
+
+
+@flamapy_bp.route('/flamapy/jobs/<int:job_id>', methods=['GET'])
+def get_job(job_id):
+    job = FlamapyJobService().get_or_404(job_id)
+    return jsonify(job.to_dict()), 200
+
+
+@flamapy_bp.route('/flamapy/jobs/<int:job_id>/artifact', methods=['GET'])
+def job_artifact(job_id):
+    job_service = FlamapyJobService()
+    job = job_service.get_or_404(job_id)
+    if not job.artifact_path:
+        abort(404)
+
+    target_format = job_service.OPERATIONS[job.operation]
+    extension, _ = CONVERSIONS[target_format]
+    download_name = f'{job.file.name}_{target_format}{extension}'
+    return deliver_file(job_service.get_artifact(job),
+                        mimetype=mimetypes.guess_type(download_name)[0] or 'application/octet-stream',
+                        download_name=download_name)
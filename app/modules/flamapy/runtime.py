@@ -0,0 +1,174 @@
+import logging
+import os
+import time
+
+from antlr4 import CommonTokenStream, InputStream
+from antlr4.PredictionContext import PredictionContextCache
+from antlr4.atn.LexerATNSimulator import LexerATNSimulator
+from antlr4.atn.PredictionMode import PredictionMode
+from antlr4.error.ErrorStrategy import BailErrorStrategy, DefaultErrorStrategy
+from antlr4.error.Errors import ParseCancellationException
+from pysat.solvers import Solver
+from uvl.UVLCustomLexer import UVLCustomLexer
+from uvl.UVLPythonParser import UVLPythonParser
+
+logger = logging.getLogger(__name__)
+
+# Small model touching most of the grammar, parsed at warm-up to fill the ANTLR prediction caches
+WARM_UP_MODEL = """features
+    Root
+        mandatory
+            A
+                alternative
+                    A1
+                    A2
+        optional
+            B
+                or
+                    B1
+                    B2
+        [1..2]
+            C1
+            C2
+            C3
+
+constraints
+    A1 => B
+    !(B1 & C3) | A2
+    B2 <=> C1
+"""
+
+
+class StartStateCachingLexerATNSimulator(LexerATNSimulator):
+    """
+    The UVL lexer has a semantic predicate (``atStartOfInput`` in ``NEWLINE``), so ANTLR never caches the
+    start state of its DFA and recomputes the closure of the whole lexer ATN for every token, which is where
+    most of the validation time went. That predicate only depends on whether the token starts at line 1,
+    column 0, so the start state is cached per mode and per that flag instead.
+    """
+
+    _start_states = {}
+
+    def matchATN(self, input):
+        key = (self.mode, self.line == 1 and self.column == 0)
+        start = self._start_states.get(key)
+        if start is None:
+            closure = self.computeStartState(input, self.atn.modeToStartState[self.mode])
+            closure.hasSemanticContext = False
+            start = self._start_states[key] = self.addDFAState(closure)
+        return self.execATN(input, start)
+
+
+class UVLFastLexer(UVLCustomLexer):
+    """``UVLCustomLexer`` producing the same tokens, with a cached DFA start state."""
+
+    def __init__(self, input_stream):
+        super().__init__(input_stream)
+        self._interp = StartStateCachingLexerATNSimulator(self, self.atn, self.decisionsToDFA,
+                                                          PredictionContextCache())
+
+
+class AnalysisRuntime:
+    """
+    Per-process state of the analysis stack: the UVL lexer/parser and the SAT solver, set up once, ideally
+    at worker boot through ``warm_up``, instead of on the first requests. Executor workers forked afterwards
+    inherit it already warm. Operations call the flamapy metamodels directly, so there is no plugin
+    discovery to warm.
+    """
+
+    def __init__(self):
+        self.timings = {}
+        self.warmed_up = False
+
+    def create_parser(self, input_stream, error_listener=None) -> UVLPythonParser:
+        """
+        Build a UVL parser for ``input_stream``. When ``error_listener`` is given it replaces the default
+        console listeners of both the lexer and the parser.
+        """
+        lexer = UVLFastLexer(input_stream)
+        if error_listener is not None:
+            lexer.removeErrorListeners()
+            lexer.addErrorListener(error_listener)
+
+        parser = UVLPythonParser(CommonTokenStream(lexer))
+        if error_listener is not None:
+            parser.removeErrorListeners()
+            parser.addErrorListener(error_listener)
+        return parser
+
+    def validate(self, input_stream, error_listener, fail_fast: bool = False):
+        """
+        Check a UVL model against the grammar, reporting to ``error_listener`` the same errors a full ANTLR
+        parse would, without building the parse tree.
+
+        The input is lexed first; with ``fail_fast`` a lexer error rejects it right away. The parser then
+        runs in SLL mode and bails out at the first error, which is enough for every valid model. Only
+        when it bails is the input parsed again with full LL prediction and the default error recovery,
+        to report the errors exactly as the full parse does.
+        """
+        lexer = UVLFastLexer(input_stream)
+        lexer.removeErrorListeners()
+        lexer.addErrorListener(error_listener)
+        stream = CommonTokenStream(lexer)
+        stream.fill()
+        if fail_fast and getattr(error_listener, "errors", None):
+            return
+
+        parser = UVLPythonParser(stream)
+        parser.removeErrorListeners()
+        parser.buildParseTrees = False
+        parser._interp.predictionMode = PredictionMode.SLL
+        parser._errHandler = BailErrorStrategy()
+        try:
+            parser.featureModel()
+            return
+        except ParseCancellationException:
+            pass
+
+        stream.seek(0)
+        parser.reset()
+        parser.addErrorListener(error_listener)
+        parser._interp.predictionMode = PredictionMode.LL
+        parser._errHandler = DefaultErrorStrategy()
+        parser.featureModel()
+
+    def warm_up(self, start_executor: bool = True):
+        """
+        Parse a sample model, load the SAT solver and (optionally) start the executor pool, recording how
+        long each step takes.
+        """
+        started = time.perf_counter()
+
+        step = time.perf_counter()
+        self.create_parser(InputStream(WARM_UP_MODEL)).featureModel()
+        self.timings["parser_ms"] = round((time.perf_counter() - step) * 1000, 3)
+
+        step = time.perf_counter()
+        with Solver(name="glucose3", bootstrap_with=[[1, 2], [-1, 2]]) as solver:
+            solver.solve()
+        self.timings["solver_ms"] = round((time.perf_counter() - step) * 1000, 3)
+
+        if start_executor:
+            from app.modules.flamapy.executor import get_executor
+
+            step = time.perf_counter()
+            get_executor()
+            self.timings["executor_ms"] = round((time.perf_counter() - step) * 1000, 3)
+
+        self.timings["warm_up_ms"] = round((time.perf_counter() - started) * 1000, 3)
+        self.warmed_up = True
+        logger.info(f"Analysis runtime of process {os.getpid()} warmed up: {self.timings}")
+
+    def to_dict(self):
+        return {
+            "pid": os.getpid(),
+            "warmed_up": self.warmed_up,
+            "timings": self.timings,
+        }
+
+
+_runtime = AnalysisRuntime()
+
+
+def get_runtime() -> AnalysisRuntime:
+    return _runtime
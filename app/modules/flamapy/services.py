@@ -1,7 +1,839 @@
-from app.modules.flamapy.repositories import FlamapyRepository
+import hashlib
+import logging
+import os
+import pickle
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timedelta, timezone
+from importlib import metadata
+from typing import Optional
+
+from antlr4 import CommonTokenStream, FileStream
+from antlr4.error.ErrorListener import ErrorListener
+from flamapy.core.exceptions import FlamaException
+from flamapy.metamodels.bdd_metamodel.models import BDDModel
+from flamapy.metamodels.bdd_metamodel.operations import BDDConfigurationsNumber, BDDFeatureInclusionProbability
+from flamapy.metamodels.fm_metamodel.operations import FMAtomicSets, FMMaxDepthTree
+from flamapy.metamodels.fm_metamodel.transformations import GlencoeWriter, SPLOTWriter, UVLReader, UVLWriter
+from flamapy.metamodels.pysat_metamodel.operations import (PySATConfigurationsNumber, PySATCoreFeatures,
+                                                           PySATDeadFeatures)
+from flamapy.metamodels.pysat_metamodel.transformations import DimacsWriter, FmToPysat
+from flamapy.metamodels.pysat_metamodel.transformations.dimacs_writer import pysat_to_dimacs
+from uvl.UVLCustomLexer import UVLCustomLexer
+from uvl.UVLPythonParser import UVLPythonParser
+
+from app.modules.flamapy.approximate import ApproximateCounter
+from app.modules.flamapy.executor import (ExecutorSaturated, OperationTimeout, approximate_count_task, cache_model_task,
+                                          convert_task, convert_to_path_task, count_configurations_task, get_executor,
+                                          validate_task)
+from app.modules.flamapy.models import FlamapyJob
+from app.modules.flamapy.repositories import FlamapyJobRepository
+from app.modules.flamapy.runtime import get_runtime
+from core.cache.lru_cache import DiskLRUCache, MemoryLRUCache
+from core.configuration.configuration import cache_folder_path
 from core.services.BaseService import BaseService
 
+logger = logging.getLogger(__name__)
+
+# Output formats: file extension and writer of each one
+CONVERSIONS = {
+    "glencoe": (".json", lambda path, fm: GlencoeWriter(path, fm).transform()),
+    "splot": (".splx", lambda path, fm: SPLOTWriter(path, fm).transform()),
+    "dimacs": (".cnf", lambda path, fm: DimacsWriter(path, FmToPysat(fm).transform()).transform()),
+    "uvl": (".uvl", lambda path, fm: UVLWriter(path, fm).transform()),
+}
+
+
+def file_checksum(file_path: str) -> str:
+    hash_md5 = hashlib.md5()
+    with open(file_path, "rb") as file:
+        for chunk in iter(lambda: file.read(64 * 1024), b""):
+            hash_md5.update(chunk)
+    return hash_md5.hexdigest()
+
+
+class FeatureModelCache:
+    """
+    Parsed feature models keyed by the checksum of their UVL file. Lookups go to an in-process LRU
+    first and then to a pickled copy on disk shared by every worker; only a miss on both parses the file.
+    Cached models are shared between requests and must not be modified by callers.
+    """
+
+    def __init__(self, memory_bytes: int, disk_bytes: int, directory: str):
+        self.memory = MemoryLRUCache(memory_bytes)
+        self.disk = DiskLRUCache(directory, disk_bytes, suffix='.pickle')
+
+    def get(self, file_path: str, checksum: str = None):
+        return self.get_with_errors(file_path, checksum)[0]
+
+    def get_with_errors(self, file_path: str, checksum: str = None):
+        """
+        Like ``get``, also returning the syntax errors found while parsing the file (the same list as
+        ``FlamapyService.validate_uvl``), or None when the model came from the cache and nothing was parsed.
+
+        Raises:
+            UVLSyntaxError: When the parser rejects the file; ``errors`` holds every syntax error.
+        """
+        key = checksum if isinstance(checksum, str) and checksum else file_checksum(file_path)
+
+        fm = self.memory.get(key)
+        if fm is not None:
+            return fm, None
+
+        data = self.disk.get(key)
+        if data is not None:
+            try:
+                fm = pickle.loads(data)
+                self.memory.put(key, fm, len(data))
+                return fm, None
+            except Exception as exc:
+                logger.warning(f"Discarding unreadable cached model {key}: {exc}")
+
+        reader = ValidatingUVLReader(file_path)
+        fm = reader.transform()
+        try:
+            data = pickle.dumps(fm, protocol=pickle.HIGHEST_PROTOCOL)
+            self.disk.put(key, data)
+            self.memory.put(key, fm, len(data))
+        except Exception as exc:
+            # Very deep models can exceed the pickle recursion limit; keep them in memory only
+            logger.warning(f"Could not persist parsed model {key}: {exc}")
+            self.memory.put(key, fm, os.path.getsize(file_path))
+        return fm, reader.error_listener.errors
+
+    def to_dict(self):
+        return {
+            "memory": self.memory.to_dict(),
+            "disk": self.disk.to_dict(),
+        }
+
+
+feature_model_cache = FeatureModelCache(
+    memory_bytes=int(os.getenv("FLAMAPY_MODEL_CACHE_MEMORY_BYTES", 64 * 1024 * 1024)),
+    disk_bytes=int(os.getenv("FLAMAPY_MODEL_CACHE_DISK_BYTES", 512 * 1024 * 1024)),
+    directory=cache_folder_path("models"),
+)
+
+
+def get_flamapy_version() -> str:
+    for distribution in ("flamapy-fw", "flamapy"):
+        try:
+            return metadata.version(distribution)
+        except metadata.PackageNotFoundError:
+            continue
+    return "unknown"
+
+
+FLAMAPY_VERSION = get_flamapy_version()
+
+
+class ConversionArtifactStore:
+    """
+    Converted models (Glencoe, SPLOT, DIMACS, UVL) on disk, keyed by the checksum of the source UVL, the
+    target format and the flamapy version that wrote them. Repeat conversions are served from disk and the
+    store is trimmed by least recent use once it exceeds its byte budget.
+    """
+
+    def __init__(self, directory: str, max_bytes: int):
+        self.disk = DiskLRUCache(directory, max_bytes)
+
+    def key(self, checksum: str, target_format: str) -> str:
+        return f"{checksum}-{target_format}-{FLAMAPY_VERSION}"
+
+    def get_or_create(self, file_path: str, checksum: str, target_format: str) -> str:
+        """
+        Return the path of the converted file, converting the source only when it is not stored yet.
+        """
+        if target_format not in CONVERSIONS:
+            raise ValueError(f"Unknown format '{target_format}'. Available: {', '.join(CONVERSIONS)}")
+        checksum = checksum if isinstance(checksum, str) and checksum else file_checksum(file_path)
+        key = self.key(checksum, target_format)
+
+        path = self.disk.get_path(key)
+        if path is not None:
+            return path
+
+        tmp_path = self.disk.reserve(key)
+        try:
+            service = FlamapyService()
+            service.convert(service.get_feature_model(file_path, checksum), target_format, tmp_path)
+        except Exception:
+            self.disk.discard(tmp_path)
+            raise
+        return self.disk.commit(key, tmp_path)
+
+    def get_or_create_many(self, file_path: str, checksum: str, target_formats) -> dict:
+        """
+        Return the paths of the file converted to several formats. The source is parsed once, into the
+        shared model cache, and the missing conversions then run concurrently on the analysis pool, whose
+        workers load the cached model instead of parsing the file again. When the pool is saturated the
+        conversions run in this process.
+
+        Returns:
+            dict: Path of each converted file, keyed by format and in the order of ``target_formats``.
+        """
+        unknown = [target_format for target_format in target_formats if target_format not in CONVERSIONS]
+        if unknown:
+            raise ValueError(f"Unknown format '{unknown[0]}'. Available: {', '.join(CONVERSIONS)}")
+        checksum = checksum if isinstance(checksum, str) and checksum else file_checksum(file_path)
+
+        paths = {target_format: self.disk.get_path(self.key(checksum, target_format))
+                 for target_format in target_formats}
+        missing = [target_format for target_format, path in paths.items() if path is None]
+        if not missing:
+            return paths
+
+        executor = get_executor()
+        service = FlamapyService()
+        if len(missing) > 1:
+            try:
+                executor.run(cache_model_task, file_path, checksum)
+            except ExecutorSaturated:
+                service.get_feature_model(file_path, checksum)
+
+        def convert(target_format):
+            key = self.key(checksum, target_format)
+            tmp_path = self.disk.reserve(key)
+            try:
+                try:
+                    executor.run(convert_to_path_task, file_path, checksum, target_format, tmp_path)
+                except ExecutorSaturated:
+                    service.convert(service.get_feature_model(file_path, checksum), target_format, tmp_path)
+            except Exception:
+                self.disk.discard(tmp_path)
+                raise
+            return self.disk.commit(key, tmp_path)
+
+        with ThreadPoolExecutor(max_workers=len(missing)) as pool:
+            for target_format, path in zip(missing, pool.map(convert, missing)):
+                paths[target_format] = path
+        return paths
+
+    def to_dict(self):
+        return self.disk.to_dict()
+
+
+conversion_artifact_store = ConversionArtifactStore(
+    directory=cache_folder_path("artifacts"),
+    max_bytes=int(os.getenv("FLAMAPY_ARTIFACT_STORE_BYTES", 1024 * 1024 * 1024)),
+)
+
+# Counting engines: "bdd" compiles the model once and answers from the cached BDD, "sat" enumerates models
+COUNTING_ENGINES = ("bdd", "sat")
+DEFAULT_COUNTING_ENGINE = os.getenv("FLAMAPY_COUNTING_ENGINE", "bdd")
+# Seconds an approximate count may take, and an exact count may take before analysis falls back to an estimate
+APPROXIMATE_COUNT_DEADLINE = float(os.getenv("FLAMAPY_APPROX_DEADLINE", 10))
+EXACT_COUNT_TIMEOUT = float(os.getenv("FLAMAPY_EXACT_COUNT_TIMEOUT", 10))
+
+# Seconds a job may run (FLAMAPY_JOB_TIMEOUT) and after which a running job is considered abandoned by a dead
+# worker and queued again; the lease must outlast the timeout
+JOB_TIMEOUT = float(os.getenv("FLAMAPY_JOB_TIMEOUT", 600))
+JOB_LEASE_SECONDS = float(os.getenv("FLAMAPY_JOB_LEASE", JOB_TIMEOUT + 300))
+
+# Operations of the combined analysis (FlamapyService.run_operations), in the order they run
+ANALYSIS_OPERATIONS = ("validity", "configurations", "core_features", "dead_features", "atomic_sets", "cnf")
+
+
+class BDDNodeBudgetExceeded(Exception):
+    """Raised when the compiled BDD of a model has more nodes than the configured budget."""
+
+    def __init__(self, nodes: int, budget: int):
+        # Keep the raw values in args so the exception survives the trip back from an executor worker
+        super().__init__(nodes, budget)
+        self.nodes = nodes
+        self.budget = budget
+
+    def __str__(self):
+        return f"The BDD of this model needs {self.nodes} nodes, over the budget of {self.budget}"
+
+
+class BDDCache:
+    """
+    Compiled BDDs keyed by the checksum of their UVL file, kept in the memory of the process that compiled
+    them (usually a long-lived executor worker). Models whose BDD goes over ``node_budget`` are remembered
+    so they are not compiled again; callers fall back to SAT for them.
+    """
+
+    # Rough memory footprint of a BDD node, used to weigh entries against the byte budget
+    NODE_BYTES = 100
+    _OVER_BUDGET = object()
+
+    def __init__(self, memory_bytes: int, node_budget: int):
+        self.memory = MemoryLRUCache(memory_bytes)
+        self.node_budget = node_budget
+
+    def get(self, fm, checksum: str = None, sat=None):
+        """
+        Return the compiled BDD of a feature model. ``sat`` is its SAT encoding, when the caller already has it.
+
+        Returns:
+            tuple: The ``BDDModel`` and a dict from its variable names to feature names.
+
+        Raises:
+            BDDNodeBudgetExceeded: When the BDD is (or was found to be) over the node budget.
+        """
+        key = checksum if isinstance(checksum, str) and checksum else None
+
+        compiled = self.memory.get(key) if key else None
+        if compiled is self._OVER_BUDGET:
+            raise BDDNodeBudgetExceeded(self.node_budget + 1, self.node_budget)
+        if compiled is not None:
+            return compiled
+
+        try:
+            compiled = self.compile(fm, sat)
+        except BDDNodeBudgetExceeded:
+            if key:
+                self.memory.put(key, self._OVER_BUDGET, 1)
+            raise
+
+        if key:
+            self.memory.put(key, compiled, compiled[0].nof_nodes() * self.NODE_BYTES)
+        return compiled
+
+    def compile(self, fm, sat=None):
+        """
+        Build the BDD clause by clause from the model's CNF, giving up as soon as it goes over the node budget.
+
+        flamapy's ``FmToBDD`` parses one big textual formula, which cannot be interrupted and breaks on
+        feature names with spaces or quotes, so variables are named after their SAT ids instead.
+        """
+        sat = sat or FmToPysat(fm).transform()
+        clauses = sat.get_all_clauses().clauses
+        ids = sorted(set(sat.features) | {abs(literal) for clause in clauses for literal in clause})
+        feature_names = {f"v{i}": sat.features.get(i, f"v{i}") for i in ids}
+
+        bdd_model = BDDModel()
+        bdd = bdd_model.bdd
+        bdd.declare(*feature_names)
+        root = bdd.true
+        for clause in clauses:
+            root &= bdd.add_expr(" | ".join(f"!v{-literal}" if literal < 0 else f"v{literal}" for literal in clause))
+            if len(bdd) > self.node_budget:
+                raise BDDNodeBudgetExceeded(len(bdd), self.node_budget)
+        bdd_model.root = root
+        return bdd_model, feature_names
+
+    def to_dict(self):
+        return dict(self.memory.to_dict(), node_budget=self.node_budget)
+
+
+bdd_cache = BDDCache(
+    memory_bytes=int(os.getenv("FLAMAPY_BDD_CACHE_BYTES", 256 * 1024 * 1024)),
+    node_budget=int(os.getenv("FLAMAPY_BDD_NODE_BUDGET", 1000000)),
+)
+
+
+def constraint_terms(constraint) -> set:
+    """Names of the terms (features) a constraint refers to."""
+    terms = set()
+    pending = [constraint.ast.root]
+    while pending:
+        node = pending.pop()
+        if node is None:
+            continue
+        if node.is_term():
+            terms.add(node.data)
+        else:
+            pending.extend((node.left, node.right))
+    return terms
+
+
+class UVLErrorListener(ErrorListener):
+    def __init__(self):
+        self.errors = []
+
+    def syntaxError(self, recognizer, offendingSymbol, line, column, msg, e):
+        if "\\t" in msg:
+            warning_message = (
+                f"The UVL has the following warning that prevents reading it: "
+                f"Line {line}:{column} - {msg}"
+            )
+            self.errors.append(warning_message)
+        else:
+            error_message = (
+                f"The UVL has the following error that prevents reading it: "
+                f"Line {line}:{column} - {msg}"
+            )
+            self.errors.append(error_message)
+
+
+class UVLSyntaxError(FlamaException):
+    """Raised when the UVL parser rejects a file. ``errors`` holds every syntax error found."""
+
+    def __init__(self, errors: list):
+        super().__init__("Parsing failed due to syntax errors.")
+        self.errors = errors
+
+
+class ValidatingUVLReader(UVLReader):
+    """
+    ``UVLReader`` parsing with the runtime's lexer and collecting the lexer and parser errors in
+    ``error_listener``, so that one parse yields both the model and its validation. Like ``UVLReader`` it
+    only rejects the file on parser errors.
+    """
+
+    def __init__(self, path: str):
+        super().__init__(path)
+        self.error_listener = UVLErrorListener()
+
+    def set_parse_tree(self):
+        parser_errors = UVLErrorListener()
+        parser = get_runtime().create_parser(FileStream(os.path.abspath(os.path.join(self.path, self.file))),
+                                             self.error_listener)
+        parser.addErrorListener(parser_errors)
+        self.parse_tree = parser.featureModel()
+        if parser_errors.errors:
+            raise UVLSyntaxError(self.error_listener.errors)
+
 
 class FlamapyService(BaseService):
     def __init__(self):
-        super().__init__(FlamapyRepository())
+        super().__init__(FlamapyJobRepository())
+
+    def get_feature_model(self, file_path: str, checksum: str = None):
+        """
+        Return the parsed feature model of a UVL file, reusing the cached copy for its checksum.
+
+        Args:
+            file_path (str): Path of the UVL file on disk.
+            checksum (str): Checksum of the file (``Hubfile.checksum``). Computed from the file when omitted.
+
+        Returns:
+            FeatureModel: The parsed model. It is shared between requests and must not be modified.
+        """
+        return feature_model_cache.get(file_path, checksum)
+
+    def get_bdd_model(self, fm, checksum: str = None, sat=None):
+        """
+        Return the compiled BDD of a feature model, reusing the one cached for its checksum.
+
+        Returns:
+            tuple: The ``BDDModel`` and a dict from its variable names to feature names.
+
+        Raises:
+            BDDNodeBudgetExceeded: When the BDD goes over ``FLAMAPY_BDD_NODE_BUDGET`` nodes.
+        """
+        return bdd_cache.get(fm, checksum, sat)
+
+    def count_configurations(self, fm, checksum: str = None, engine: str = None, sat=None) -> int:
+        """
+        Count the configurations of a feature model.
+
+        Args:
+            fm (FeatureModel): The model to analyze.
+            checksum (str): Checksum of its UVL file, used to reuse the compiled BDD.
+            engine (str): ``bdd`` or ``sat``. Defaults to ``FLAMAPY_COUNTING_ENGINE``. The BDD engine falls
+                back to SAT when the model goes over the node budget.
+            sat (PySATModel): The SAT encoding of the model, when the caller already has it.
+
+        Returns:
+            int: The number of configurations.
+        """
+        engine = engine or DEFAULT_COUNTING_ENGINE
+        if engine not in COUNTING_ENGINES:
+            raise ValueError(f"Unknown engine '{engine}'. Available: {', '.join(COUNTING_ENGINES)}")
+
+        if engine == "bdd":
+            try:
+                bdd_model, _ = self.get_bdd_model(fm, checksum, sat)
+                return BDDConfigurationsNumber().execute(bdd_model).get_result()
+            except BDDNodeBudgetExceeded as exc:
+                logger.info(f"Counting with SAT instead of BDD: {exc}")
+
+        sat = sat or FmToPysat(fm).transform()
+        return PySATConfigurationsNumber().execute(sat).get_result()
+
+    def feature_commonality(self, fm, checksum: str = None) -> dict:
+        """
+        Share of configurations that include each feature, computed on the compiled BDD.
+
+        Returns:
+            dict: Feature name -> probability between 0 and 1.
+
+        Raises:
+            BDDNodeBudgetExceeded: When the model is too large to compile to a BDD.
+        """
+        bdd_model, feature_names = self.get_bdd_model(fm, checksum)
+        probabilities = BDDFeatureInclusionProbability().execute(bdd_model).get_result()
+        return {feature_names[variable]: probability for variable, probability in probabilities.items()}
+
+    def approximate_count(self, fm, deadline: float = None) -> dict:
+        """
+        Estimate the number of configurations with hashing-based approximate counting.
+
+        Args:
+            fm (FeatureModel): The model to analyze.
+            deadline (float): Seconds available. Defaults to ``FLAMAPY_APPROX_DEADLINE``.
+
+        Returns:
+            dict: ``estimate``, ``lower_bound``, ``upper_bound``, ``exact``, ``rounds``, ``tolerance`` and
+            ``confidence`` (see ``ApproximateCounter.count``).
+
+        Raises:
+            ApproximationTimeout: When no estimate could be computed before the deadline.
+        """
+        sat = FmToPysat(fm).transform()
+        deadline = APPROXIMATE_COUNT_DEADLINE if deadline is None else deadline
+        return ApproximateCounter().count(sat.get_all_clauses().clauses, sorted(sat.features), deadline)
+
+    def count_or_estimate_configurations(self, file_path: str, checksum: str = None,
+                                         timeout: float = None) -> dict:
+        """
+        Count the configurations in the executor and fall back to an estimate when the exact count does not
+        finish within ``timeout`` seconds (``FLAMAPY_EXACT_COUNT_TIMEOUT`` by default).
+
+        Returns:
+            dict: ``value``, ``approximate``, ``lower_bound`` and ``upper_bound``.
+        """
+        timeout = EXACT_COUNT_TIMEOUT if timeout is None else timeout
+        executor = get_executor()
+        try:
+            value = executor.run(count_configurations_task, file_path, checksum, timeout=timeout)
+            return {"value": value, "approximate": False, "lower_bound": value, "upper_bound": value}
+        except OperationTimeout:
+            logger.info(f"Exact count of {file_path} timed out after {timeout}s, estimating it")
+            # The counter stops itself at the deadline; the margin covers parsing and the CNF encoding
+            estimate = executor.run(approximate_count_task, file_path, checksum, APPROXIMATE_COUNT_DEADLINE,
+                                    timeout=APPROXIMATE_COUNT_DEADLINE + timeout)
+        except ExecutorSaturated:
+            logger.info(f"Analysis pool saturated, estimating the count of {file_path} inline")
+            estimate = self.approximate_count(self.get_feature_model(file_path, checksum))
+
+        return {
+            "value": estimate["estimate"],
+            "approximate": not estimate["exact"],
+            "lower_bound": estimate["lower_bound"],
+            "upper_bound": estimate["upper_bound"],
+        }
+
+    def convert(self, fm, target_format: str, output_path: str) -> str:
+        """
+        Write a feature model in one of the supported formats (see ``CONVERSIONS``).
+
+        Args:
+            fm (FeatureModel): The model to convert.
+            target_format (str): One of ``glencoe``, ``splot``, ``dimacs`` or ``uvl``.
+            output_path (str): Where to write the result.
+
+        Returns:
+            str: The path of the written file.
+        """
+        _, writer = CONVERSIONS[target_format]
+        writer(output_path, fm)
+        return output_path
+
+    def get_artifact(self, file_path: str, target_format: str, checksum: str = None) -> str:
+        """
+        Return the path of the file converted to ``target_format``, reusing the stored conversion.
+
+        Args:
+            file_path (str): Path of the source UVL file.
+            target_format (str): One of ``glencoe``, ``splot``, ``dimacs`` or ``uvl``.
+            checksum (str): Checksum of the source file. Computed from the file when omitted.
+
+        Returns:
+            str: Path of the converted file inside the artifact store. It must not be modified or removed.
+        """
+        return conversion_artifact_store.get_or_create(file_path, checksum, target_format)
+
+    def get_artifacts(self, file_path: str, target_formats=tuple(CONVERSIONS), checksum: str = None) -> dict:
+        """
+        Return the paths of the file converted to every format in ``target_formats``, parsing it only once
+        and running the missing conversions concurrently (see ``ConversionArtifactStore.get_or_create_many``).
+
+        Returns:
+            dict: Path of each converted file inside the artifact store, keyed by format.
+        """
+        return conversion_artifact_store.get_or_create_many(file_path, checksum, target_formats)
+
+    def get_cache_stats(self) -> dict:
+        return {
+            "models": feature_model_cache.to_dict(),
+            "artifacts": conversion_artifact_store.to_dict(),
+            "bdds": bdd_cache.to_dict(),
+        }
+
+    def validate_uvl(self, file_path: str, fail_fast: bool = False) -> list:
+        """
+        Check a UVL file against the ANTLR grammar and collect its syntax errors, without building the parse
+        tree (see ``AnalysisRuntime.validate``).
+
+        Args:
+            file_path (str): Path of the UVL file on disk.
+            fail_fast (bool): Return the lexer errors as soon as there are any, without parsing.
+
+        Returns:
+            list: The error messages, empty when the model is valid.
+        """
+        error_listener = UVLErrorListener()
+        get_runtime().validate(FileStream(file_path), error_listener, fail_fast)
+        return error_listener.errors
+
+    def validate_uvl_full(self, file_path: str) -> list:
+        """Reference validation with a full ANTLR parse (parse tree included), as ``check_uvl`` used to do."""
+        lexer = UVLCustomLexer(FileStream(file_path))
+        error_listener = UVLErrorListener()
+
+        lexer.removeErrorListeners()
+        lexer.addErrorListener(error_listener)
+
+        parser = UVLPythonParser(CommonTokenStream(lexer))
+
+        parser.removeErrorListeners()
+        parser.addErrorListener(error_listener)
+
+        parser.featureModel()
+
+        return error_listener.errors
+
+    def analyze_uvl(self, file_path: str, checksum: str = None, metrics: dict = None) -> dict:
+        """
+        Validate a UVL file and, when valid, compute its structural metrics and number of configurations.
+
+        Args:
+            file_path (str): Path of the UVL file on disk.
+            checksum (str): Checksum of the file, used to reuse its cached parsed model.
+            metrics (dict): Output of ``structural_metrics`` for this checksum, when already computed (e.g. at
+                upload). Validation and the structural metrics are then taken from it instead of redone.
+
+        Returns:
+            dict: Validity, error list, configuration count (estimated when the exact count times out, see
+            ``count_or_estimate_configurations``), feature count and constraint count.
+        """
+        result = {
+            "is_valid": False,
+            "errors": [],
+            "number_of_configurations": None,
+            "number_of_features": None,
+            "number_of_constraints": None,
+            "configurations_approximate": False,
+            "configurations_lower_bound": None,
+            "configurations_upper_bound": None,
+        }
+
+        if metrics is not None:
+            errors = metrics["errors"]
+        else:
+            try:
+                errors = self.validate_uvl(file_path)
+            except Exception as exc:
+                logger.warning(f"Could not validate UVL file {file_path}: {exc}")
+                result["errors"] = [str(exc)]
+                return result
+
+        if errors:
+            result["errors"] = errors
+            return result
+
+        result["is_valid"] = True
+        try:
+            if metrics is not None and metrics.get("number_of_features") is not None:
+                result["number_of_features"] = metrics["number_of_features"]
+                result["number_of_constraints"] = metrics["number_of_constraints"]
+            else:
+                fm = self.get_feature_model(file_path, checksum)
+                result["number_of_features"] = len(fm.get_features())
+                result["number_of_constraints"] = len(fm.get_constraints())
+            count = self.count_or_estimate_configurations(file_path, checksum)
+            result["number_of_configurations"] = count["value"]
+            result["configurations_approximate"] = count["approximate"]
+            result["configurations_lower_bound"] = count["lower_bound"]
+            result["configurations_upper_bound"] = count["upper_bound"]
+        except Exception as exc:
+            logger.warning(f"Could not analyze UVL file {file_path}: {exc}")
+            result["errors"] = [str(exc)]
+
+        return result
+
+    def structural_metrics(self, file_path: str, checksum: str = None) -> dict:
+        """
+        Validate a UVL file and, when valid, compute the metrics that only need the parsed model: feature
+        count, constraint count, cross-tree constraint ratio and tree depth. Used at upload time, where there
+        is no time for counting.
+
+        Returns:
+            dict: ``is_valid``, ``errors``, ``number_of_features``, ``number_of_constraints``,
+            ``cross_tree_constraints_ratio`` and ``depth``.
+        """
+        result = {
+            "is_valid": False,
+            "errors": self.validate_uvl(file_path),
+            "number_of_features": None,
+            "number_of_constraints": None,
+            "cross_tree_constraints_ratio": None,
+            "depth": None,
+        }
+        if result["errors"]:
+            return result
+
+        result["is_valid"] = True
+        fm = self.get_feature_model(file_path, checksum)
+        features = {feature.name for feature in fm.get_features()}
+        constraints = fm.get_constraints()
+        result["number_of_features"] = len(features)
+        result["number_of_constraints"] = len(constraints)
+        if features:
+            in_constraints = {term for constraint in constraints for term in constraint_terms(constraint)}
+            result["cross_tree_constraints_ratio"] = len(in_constraints & features) / len(features)
+        result["depth"] = FMMaxDepthTree().execute(fm).get_result()
+        return result
+
+    def run_operations(self, file_path: str, checksum: str = None, operations=ANALYSIS_OPERATIONS,
+                       engine: str = None) -> dict:
+        """
+        Run several analysis operations on one model, parsing it and building its SAT encoding only once. The
+        parse that builds the model also answers ``validity``; it is only checked apart when the model comes
+        from the cache or is the only operation.
+
+        Args:
+            file_path (str): Path of the UVL file on disk.
+            checksum (str): Checksum of the file, used to reuse its cached parsed model and BDD.
+            operations (list): Names from ``ANALYSIS_OPERATIONS``.
+            engine (str): Counting engine for ``configurations`` (see ``count_configurations``).
+
+        Returns:
+            dict: ``operations`` maps each name to its ``result`` (or ``error``) and ``time_ms``; ``timings``
+            holds the time of the shared steps (``parse_ms``, ``sat_encoding_ms``) and ``total_ms``.
+        """
+        unknown = [operation for operation in operations if operation not in ANALYSIS_OPERATIONS]
+        if unknown:
+            raise ValueError(f"Unknown operations {', '.join(unknown)}. Available: {', '.join(ANALYSIS_OPERATIONS)}")
+
+        started = time.perf_counter()
+        timings = {}
+        results = {}
+
+        def elapsed_ms(since):
+            return round((time.perf_counter() - since) * 1000, 3)
+
+        def run(name, func):
+            since = time.perf_counter()
+            try:
+                results[name] = {"result": func()}
+            except Exception as exc:
+                results[name] = {"error": str(exc)}
+            results[name]["time_ms"] = elapsed_ms(since)
+
+        def validity():
+            errors = self.validate_uvl(file_path)
+            return {"valid": not errors, "errors": errors}
+
+        # Errors of the parse that built the model, which answer the validity; None when nothing was parsed
+        syntax_errors = None
+        pending = [operation for operation in ANALYSIS_OPERATIONS[1:] if operation in operations]
+        if pending:
+            since = time.perf_counter()
+            try:
+                try:
+                    fm, syntax_errors = feature_model_cache.get_with_errors(file_path, checksum)
+                except UVLSyntaxError as exc:
+                    syntax_errors = exc.errors
+                    raise
+                timings["parse_ms"] = elapsed_ms(since)
+                sat = None
+                if any(operation != "atomic_sets" for operation in pending):
+                    since = time.perf_counter()
+                    sat = FmToPysat(fm).transform()
+                    timings["sat_encoding_ms"] = elapsed_ms(since)
+            except Exception as exc:
+                for operation in pending:
+                    results[operation] = {"error": f"The model could not be read: {exc}", "time_ms": 0}
+                pending = []
+
+        operation_functions = {
+            "configurations": lambda: self.count_configurations(fm, checksum, engine, sat),
+            "core_features": lambda: PySATCoreFeatures().execute(sat).get_result(),
+            "dead_features": lambda: PySATDeadFeatures().execute(sat).get_result(),
+            "atomic_sets": lambda: [sorted(feature.name for feature in atomic_set)
+                                    for atomic_set in FMAtomicSets().execute(fm).get_result()],
+            "cnf": lambda: pysat_to_dimacs(sat),
+        }
+        if "validity" in operations:
+            if syntax_errors is None:
+                run("validity", validity)
+            else:
+                results["validity"] = {"result": {"valid": not syntax_errors, "errors": syntax_errors}, "time_ms": 0}
+
+        for operation in pending:
+            run(operation, operation_functions[operation])
+
+        timings["total_ms"] = elapsed_ms(started)
+        results = {operation: results[operation] for operation in ANALYSIS_OPERATIONS if operation in results}
+        return {"operations": results, "timings": timings}
+
+
+class FlamapyJobService(BaseService):
+    # Operation name -> target format for conversions, None for operations that return a JSON result
+    OPERATIONS = {
+        "validity": None,
+        "configurations_number": None,
+        "to_glencoe": "glencoe",
+        "to_splot": "splot",
+        "to_cnf": "dimacs",
+        "to_uvl": "uvl",
+    }
+
+    def __init__(self):
+        super().__init__(FlamapyJobRepository())
+
+    def create_job(self, file_id: int, operation: str, user_id: Optional[int] = None) -> FlamapyJob:
+        if operation not in self.OPERATIONS:
+            raise ValueError(f"Unknown operation '{operation}'. Available: {', '.join(self.OPERATIONS)}")
+        return self.repository.create(file_id=file_id, operation=operation, user_id=user_id,
+                                      status=FlamapyJob.QUEUED)
+
+    def run_next(self) -> Optional[FlamapyJob]:
+        """
+        Claim the oldest queued job, or a running one whose worker died (started more than
+        ``FLAMAPY_JOB_LEASE`` seconds ago), run it and store its outcome.
+
+        Returns:
+            FlamapyJob: The processed job, or None when the queue is empty.
+        """
+        now = datetime.now(timezone.utc)
+        job = self.repository.claim_next(stale_before=now - timedelta(seconds=JOB_LEASE_SECONDS))
+        if job is None:
+            self.repository.session.commit()
+            return None
+
+        if job.status == FlamapyJob.RUNNING:
+            logger.warning(f"Flamapy job {job.id} was abandoned since {job.started_at}, running it again")
+
+        job.status = FlamapyJob.RUNNING
+        job.started_at = now
+        self.repository.session.commit()
+
+        try:
+            job.result, job.artifact_path = self.execute(job)
+            job.status = FlamapyJob.DONE
+        except Exception as exc:
+            logger.warning(f"Flamapy job {job.id} failed: {exc}")
+            job.status = FlamapyJob.FAILED
+            job.error = str(exc)
+
+        job.finished_at = datetime.now(timezone.utc)
+        self.repository.session.commit()
+        return job
+
+    def execute(self, job: FlamapyJob):
+        file_path = job.file.get_path()
+        checksum = job.file.checksum
+        timeout = JOB_TIMEOUT
+        executor = get_executor()
+
+        if job.operation == "validity":
+            errors = executor.run(validate_task, file_path, timeout=timeout)
+            return {"valid": not errors, "errors": errors}, None
+
+        if job.operation == "configurations_number":
+            return executor.run(count_configurations_task, file_path, checksum, timeout=timeout), None
+
+        target_format = self.OPERATIONS[job.operation]
+        return None, executor.run(convert_task, file_path, checksum, target_format, timeout=timeout)
+
+    def get_artifact(self, job: FlamapyJob) -> str:
+        """Path of the job's converted file, converting again if it was evicted from the artifact store."""
+        if os.path.isfile(job.artifact_path):
+            return job.artifact_path
+        return FlamapyService().get_artifact(job.file.get_path(), self.OPERATIONS[job.operation], job.file.checksum)
@@ -2,7 +2,19 @@ import pytest
 from flask import Flask
 from unittest.mock import patch, MagicMock
 from app.modules.flamapy.routes import flamapy_bp
+from app.modules.flamapy.services import (BDDCache, BDDNodeBudgetExceeded, ConversionArtifactStore, FeatureModelCache,
+                                          JOB_LEASE_SECONDS, FlamapyJobService, FlamapyService)
+from app.modules.flamapy.models import FlamapyJob
+from app.modules.flamapy.executor import (ExecutorSaturated, FlamapyExecutor, OperationTimeout, WorkerCrashed,
+                                          default_workers)
+from app.modules.flamapy.approximate import ApproximateCounter
+from app.modules.flamapy.runtime import AnalysisRuntime
+import os
+import threading
+import time
+from datetime import datetime, timedelta, timezone
 from app.modules.common.dbutils import create_dataset_db
+from core.cache.lru_cache import DiskLRUCache
 
 
 @pytest.fixture(scope='module')
@@ -40,6 +52,39 @@ def test_valid_uvl_get(test_client):
     valid_uvl_test(test_client, file_doesnt_exist, 500)
 
 
+def test_check_uvl_batch(test_client):
+    response = test_client.post("/flamapy/check_uvl/batch", json={"file_ids": [1, 2, 10]})
+    assert response.status_code == 200
+    results = response.get_json()["results"]
+    assert [result["file_id"] for result in results] == [1, 2, 10], "Results must keep the requested order"
+    assert results[0]["valid"] is True
+    assert results[1]["valid"] is False and results[1]["errors"]
+    assert results[2]["errors"] == ["File not found"]
+
+    response = test_client.post("/flamapy/check_uvl/batch", json={"file_ids": [1, 2]})
+    results = response.get_json()["results"]
+    assert all(result["cached"] for result in results), "Repeated checks must be answered from the cache"
+
+    response = test_client.post("/flamapy/check_uvl/batch", json={"file_ids": [2, 1, 2]})
+    assert [result["file_id"] for result in response.get_json()["results"]] == [2, 1], "Ids are answered once"
+
+    response = test_client.post("/flamapy/check_uvl/batch", json={"file_ids": "1,2"})
+    assert response.status_code == 400
+
+
+@patch('app.modules.hubfile.services.get_executor')
+def test_check_uvl_batch_answers_503_when_saturated(mock_get_executor, test_client):
+    from app.modules.hubfile.services import validation_cache
+
+    validation_cache.clear()
+    mock_get_executor.return_value.workers = 2
+    mock_get_executor.return_value.run.side_effect = ExecutorSaturated(3)
+
+    response = test_client.post("/flamapy/check_uvl/batch", json={"file_ids": [1, 2]})
+    assert response.status_code == 503
+    assert response.headers["Retry-After"] == "3"
+
+
 def valid_uvl_test(client, file_id, expected_code):
     response = client.get("/flamapy/check_uvl/" + str(file_id))
     msg = "Get valid uvl of file " + str(file_id) + " responded " \
@@ -48,6 +93,46 @@ def valid_uvl_test(client, file_id, expected_code):
     assert response.status_code == expected_code, msg
 
 
+def test_flamapy_job_lifecycle(test_client):
+    response = test_client.post("/flamapy/jobs", json={"file_id": 1, "operation": "validity"})
+    assert response.status_code == 202, "The job could not be created"
+    job_id = response.get_json()["id"]
+    assert response.get_json()["status"] == "queued"
+
+    with test_client.application.app_context():
+        job = FlamapyJobService().run_next()
+        assert job.id == job_id
+
+    response = test_client.get(f"/flamapy/jobs/{job_id}")
+    assert response.status_code == 200
+    assert response.get_json()["status"] == "done", response.get_json()
+    assert response.get_json()["result"]["valid"] is True
+
+
+def test_flamapy_job_abandoned_by_a_dead_worker_runs_again(test_client):
+    with test_client.application.app_context():
+        service = FlamapyJobService()
+        job = service.create_job(1, "validity")
+        job.status = FlamapyJob.RUNNING
+        job.started_at = datetime.now(timezone.utc) - timedelta(minutes=1)
+        service.repository.session.commit()
+        assert service.run_next() is None, "A job inside its lease belongs to a live worker"
+
+        job.started_at = datetime.now(timezone.utc) - timedelta(seconds=JOB_LEASE_SECONDS + 1)
+        service.repository.session.commit()
+        claimed = service.run_next()
+        assert claimed.id == job.id
+        assert claimed.status == FlamapyJob.DONE
+
+
+def test_flamapy_job_rejects_unknown_operation(test_client):
+    response = test_client.post("/flamapy/jobs", json={"file_id": 1, "operation": "make_coffee"})
+    assert response.status_code == 400
+
+    response = test_client.post("/flamapy/jobs", json={"file_id": 999, "operation": "validity"})
+    assert response.status_code == 404
+
+
 # TEST DE GLENCOE
 @pytest.fixture
 def client():
@@ -245,3 +330,301 @@ def num_configurations_test(client, file_id, expected_code):
     msg = "Get num configurations of file " + str(file_id) + " responded " \
         + str(response.status_code) + " but expected " + str(expected_code)
     assert response.status_code == expected_code, msg
+
+
+def test_feature_model_cache_tiers(tmp_path):
+    file_path = "app/modules/dataset/uvl_examples/file1.uvl"
+    cache = FeatureModelCache(memory_bytes=1024 * 1024, disk_bytes=1024 * 1024, directory=str(tmp_path))
+
+    fm = cache.get(file_path, "a" * 32)
+    assert cache.memory.stats.misses == 1 and cache.disk.stats.misses == 1, "First lookup must parse the file"
+    assert cache.get(file_path, "a" * 32) is fm, "Second lookup must be served from memory"
+    assert cache.memory.stats.hits == 1
+
+    # A fresh process (empty memory tier) reads the model from the shared disk tier
+    other_worker = FeatureModelCache(memory_bytes=1024 * 1024, disk_bytes=1024 * 1024, directory=str(tmp_path))
+    shared = other_worker.get(file_path, "a" * 32)
+    assert other_worker.disk.stats.hits == 1, "The model should come from the disk tier"
+    assert len(shared.get_features()) == len(fm.get_features())
+
+
+def test_feature_model_cache_evicts_by_bytes(tmp_path):
+    file_path = "app/modules/dataset/uvl_examples/file1.uvl"
+    cache = FeatureModelCache(memory_bytes=1024 * 1024, disk_bytes=1, directory=str(tmp_path))
+
+    cache.get(file_path, "b" * 32)
+    assert cache.disk.to_dict()["entries"] == 0, "Entries over the disk budget must be evicted"
+
+
+def test_disk_cache_evict_spares_keep_and_pinned_entries(tmp_path):
+    disk = DiskLRUCache(str(tmp_path), max_bytes=100, pin_seconds=0)
+    for age, key in enumerate(["newest", "middle", "oldest"]):
+        path = disk.put(key, b"x" * 6)
+        os.utime(path, (time.time() - 60 * age, time.time() - 60 * age))
+
+    disk.max_bytes = 6
+    assert disk.evict(keep=disk.path_for("oldest")) == 2
+    assert os.path.exists(disk.path_for("oldest")), "The entry passed as keep must survive"
+    assert not os.path.exists(disk.path_for("middle")) and not os.path.exists(disk.path_for("newest"))
+
+    pinned = DiskLRUCache(str(tmp_path / "pinned"), max_bytes=10)
+    pinned.put("first", b"x" * 6)
+    pinned.put("second", b"y" * 6)
+    assert pinned.get_path("first") is not None, "Entries just accessed must not be evicted under a reader"
+    assert pinned.put("too-big", b"z" * 11) is None
+
+
+def test_disk_cache_scans_only_when_due_and_removes_stale_temp_files(tmp_path):
+    disk = DiskLRUCache(str(tmp_path), max_bytes=100, pin_seconds=0)
+    disk.put("first", b"x" * 10)
+    with patch.object(disk, "entries", wraps=disk.entries) as entries:
+        disk.put("second", b"y" * 10)
+        assert not entries.called, "A write within budget must not scan the directory"
+        disk.put("third", b"z" * 90)
+        assert entries.called, "A write that goes over budget must evict"
+    assert disk.to_dict()["bytes"] <= 100
+
+    abandoned = disk.reserve("crashed")
+    in_progress = disk.reserve("writing")
+    an_hour_ago = time.time() - 3601
+    os.utime(abandoned, (an_hour_ago, an_hour_ago))
+    disk.evict()
+    assert not os.path.exists(abandoned), "Temporary files of dead writers must be removed"
+    assert os.path.exists(in_progress)
+
+
+def test_bdd_and_sat_engines_agree():
+    service = FlamapyService()
+    fm = service.get_feature_model("app/modules/dataset/uvl_examples/file1.uvl")
+
+    assert service.count_configurations(fm, "d" * 32, engine="bdd") == service.count_configurations(fm, engine="sat")
+    assert service.get_bdd_model(fm, "d" * 32) is service.get_bdd_model(fm, "d" * 32), "The BDD must be cached"
+
+    commonality = service.feature_commonality(fm, "d" * 32)
+    assert set(commonality) == {feature.name for feature in fm.get_features()}
+    assert all(0 <= probability <= 1 for probability in commonality.values())
+
+
+def test_bdd_cache_node_budget():
+    fm = FlamapyService().get_feature_model("app/modules/dataset/uvl_examples/file1.uvl")
+    cache = BDDCache(memory_bytes=1024 * 1024, node_budget=1)
+
+    with pytest.raises(BDDNodeBudgetExceeded):
+        cache.get(fm, "e" * 32)
+    with pytest.raises(BDDNodeBudgetExceeded):
+        cache.get(fm, "e" * 32)
+    assert cache.memory.stats.hits == 1, "Models over the budget must not be compiled twice"
+
+
+def test_approximate_count_small_model_is_exact():
+    fm = FlamapyService().get_feature_model("app/modules/dataset/uvl_examples/file1.uvl")
+    result = FlamapyService().approximate_count(fm, deadline=10)
+    assert result["exact"] is True
+    assert result["estimate"] == FlamapyService().count_configurations(fm, engine="sat")
+
+
+def test_approximate_count_estimate_within_bounds():
+    # (x1 or x2) over 40 variables: 3 * 2^38 solutions
+    expected = 3 * 2 ** 38
+    result = ApproximateCounter(seed=1).count([[1, 2]], list(range(1, 41)), deadline=30)
+    assert result["exact"] is False and result["rounds"] > 0
+    assert result["lower_bound"] <= expected <= result["upper_bound"]
+
+
+def test_structural_metrics():
+    metrics = FlamapyService().structural_metrics("app/modules/dataset/uvl_examples/file1.uvl")
+    assert metrics["is_valid"] and not metrics["errors"]
+    assert metrics["number_of_features"] > 0
+    assert metrics["number_of_constraints"] >= 0
+    assert metrics["depth"] >= 1
+
+
+def test_run_operations_single_parse():
+    file_path = "app/modules/dataset/uvl_examples/file1.uvl"
+    service = FlamapyService()
+    result = service.run_operations(file_path)
+
+    operations = result["operations"]
+    assert set(operations) == {"validity", "configurations", "core_features", "dead_features", "atomic_sets", "cnf"}
+    assert all("error" not in operation and "time_ms" in operation for operation in operations.values())
+    assert operations["validity"]["result"]["valid"] is True
+    assert operations["configurations"]["result"] == service.count_configurations(
+        service.get_feature_model(file_path), engine="sat")
+    assert operations["cnf"]["result"].startswith("p cnf")
+    assert "parse_ms" in result["timings"] and "sat_encoding_ms" in result["timings"]
+
+    only_atomic_sets = service.run_operations(file_path, operations=["atomic_sets"])
+    assert set(only_atomic_sets["operations"]) == {"atomic_sets"}
+    assert "sat_encoding_ms" not in only_atomic_sets["timings"], "No SAT encoding is needed for atomic sets"
+
+
+def test_run_operations_validity_reuses_the_model_parse(tmp_path):
+    service = FlamapyService()
+    invalid_path = tmp_path / "invalid.uvl"
+    with open("app/modules/dataset/uvl_examples/file1.uvl") as f:
+        invalid_path.write_text(f.read().replace("mandatory", "mandatroy", 1))
+
+    with patch.object(FlamapyService, "validate_uvl", side_effect=AssertionError("parsed twice")):
+        valid = service.run_operations("app/modules/dataset/uvl_examples/file1.uvl", f"fresh-{time.time()}",
+                                       ["validity", "atomic_sets"])
+        invalid = service.run_operations(str(invalid_path), f"fresh-{time.time()}", ["validity", "core_features"])
+
+    assert list(valid["operations"]) == ["validity", "atomic_sets"]
+    assert valid["operations"]["validity"]["result"] == {"valid": True, "errors": []}
+    assert invalid["operations"]["validity"]["result"]["errors"] == service.validate_uvl(str(invalid_path))
+    assert invalid["operations"]["validity"]["result"]["valid"] is False
+    assert "error" in invalid["operations"]["core_features"]
+
+
+@patch('app.modules.hubfile.services.HubfileService.get_or_404')
+def test_analyze_route(mock_get_or_404, client):
+    mock_hubfile = MagicMock()
+    mock_hubfile.get_path.return_value = "app/modules/dataset/uvl_examples/file1.uvl"
+    mock_hubfile.checksum = None
+    mock_get_or_404.return_value = mock_hubfile
+
+    response = client.get('/flamapy/analyze/1?ops=validity,core_features')
+    assert response.status_code == 200
+    assert set(response.json["operations"]) == {"validity", "core_features"}
+
+    response = client.get('/flamapy/analyze/1?ops=validity,unknown')
+    assert response.status_code == 400
+
+
+def test_runtime_warm_up_records_timings():
+    runtime = AnalysisRuntime()
+    runtime.warm_up(start_executor=False)
+
+    assert runtime.warmed_up
+    assert {"parser_ms", "solver_ms", "warm_up_ms"} <= set(runtime.timings)
+    assert runtime.to_dict()["warmed_up"] is True
+
+
+def uvl_conformance_corpus(tmp_path):
+    """The uvl_examples files plus broken variants of each (bad characters, missing quotes, indentation)."""
+    directory = "app/modules/dataset/uvl_examples"
+    paths = []
+    for name in sorted(os.listdir(directory)):
+        path = os.path.join(directory, name)
+        paths.append(path)
+        with open(path) as f:
+            content = f.read()
+        variants = [
+            content.replace("mandatory", "mandatroy", 1),
+            content.replace("\n", "\n$", 1),
+            content.replace('"', "", 1),
+            content.replace("    ", "   ", 3),
+            content.replace("=>", "=>=>", 1),
+            content[:len(content) // 2],
+        ]
+        for index, variant in enumerate(variants):
+            variant_path = tmp_path / f"{index}-{name}"
+            variant_path.write_text(variant)
+            paths.append(str(variant_path))
+    return paths
+
+
+def test_fast_validation_matches_full_antlr_parse(tmp_path):
+    service = FlamapyService()
+    invalid = 0
+    for path in uvl_conformance_corpus(tmp_path):
+        errors = service.validate_uvl_full(path)
+        assert service.validate_uvl(path) == errors, f"Validation of {path} differs from the full parse"
+        invalid += bool(errors)
+    assert invalid > 0, "The corpus must contain invalid models"
+
+
+def sleep_and_return(seconds, value):
+    time.sleep(seconds)
+    return value
+
+
+def test_executor_runs_and_kills_on_timeout():
+    executor = FlamapyExecutor(workers=1, max_queue=0, default_timeout=5)
+    try:
+        assert executor.run(sleep_and_return, 0, 42) == 42
+
+        stuck_pid = executor._idle.queue[0].process.pid
+        with pytest.raises(OperationTimeout):
+            executor.run(sleep_and_return, 10, None, timeout=0.5)
+        assert executor._idle.queue[0].process.pid != stuck_pid, "The timed out worker must be replaced"
+
+        assert executor.run(sleep_and_return, 0, "still works") == "still works"
+    finally:
+        executor.shutdown()
+
+
+def test_executor_rejects_when_saturated():
+    executor = FlamapyExecutor(workers=1, max_queue=0, default_timeout=5, retry_after=7)
+    try:
+        busy = threading.Thread(target=executor.run, args=(sleep_and_return, 1, None))
+        busy.start()
+        time.sleep(0.2)
+        with pytest.raises(ExecutorSaturated) as exc_info:
+            executor.run(sleep_and_return, 0, None)
+        assert exc_info.value.retry_after == 7
+        busy.join()
+    finally:
+        executor.shutdown()
+
+
+def test_artifact_store_converts_many_formats(tmp_path):
+    store = ConversionArtifactStore(str(tmp_path), max_bytes=10 * 1024 * 1024)
+    file_path = "app/modules/dataset/uvl_examples/file1.uvl"
+
+    paths = store.get_or_create_many(file_path, None, ["uvl", "dimacs", "glencoe", "splot"])
+    assert list(paths) == ["uvl", "dimacs", "glencoe", "splot"]
+    assert all(os.path.isfile(path) for path in paths.values())
+    with open(paths["dimacs"]) as file:
+        assert "p cnf" in file.read()
+
+    assert store.get_or_create_many(file_path, None, ["splot", "uvl"]) == {
+        "splot": paths["splot"], "uvl": paths["uvl"]}, "Stored conversions are reused"
+    with pytest.raises(ValueError):
+        store.get_or_create_many(file_path, None, ["pdf"])
+
+
+def crash():
+    os._exit(1)
+
+
+def test_executor_replaces_crashed_worker():
+    executor = FlamapyExecutor(workers=1, max_queue=0, default_timeout=5)
+    try:
+        with pytest.raises(WorkerCrashed):
+            executor.run(crash)
+        assert executor.run(sleep_and_return, 0, "replaced") == "replaced"
+    finally:
+        executor.shutdown()
+
+
+@patch('app.modules.flamapy.routes.get_executor')
+@patch('app.modules.hubfile.services.HubfileService.get_or_404')
+def test_analyze_route_answers_503_when_worker_crashes(mock_get_or_404, mock_get_executor, client):
+    mock_get_or_404.return_value = MagicMock(checksum=None)
+    mock_get_executor.return_value.run.side_effect = WorkerCrashed("killed")
+    mock_get_executor.return_value.retry_after = 5
+
+    response = client.get('/flamapy/analyze/1?ops=validity')
+    assert response.status_code == 503
+    assert response.headers["Retry-After"] == "5"
+    assert "crashed" in response.json["error"]
+
+
+@patch('app.modules.flamapy.routes.get_executor')
+@patch('app.modules.flamapy.routes.check_uvl', return_value=(None, 200))
+@patch('app.modules.hubfile.services.HubfileService.get_or_404')
+def test_approximate_count_rejects_bad_deadlines(mock_get_or_404, mock_check_uvl, mock_get_executor, client):
+    mock_get_or_404.return_value = MagicMock(checksum=None)
+    for deadline in ("-10", "0", "nan", "inf", "soon"):
+        response = client.get(f'/flamapy/num_configurations/1?mode=approx&deadline={deadline}')
+        assert response.status_code == 400, deadline
+    assert not mock_get_executor.return_value.run.called
+
+
+def test_default_workers_are_shared_among_web_workers(monkeypatch):
+    monkeypatch.setattr(os, "cpu_count", lambda: 9)
+    monkeypatch.setenv("WEB_CONCURRENCY", "4")
+    assert default_workers() == 2
+    monkeypatch.setenv("WEB_CONCURRENCY", "16")
+    assert default_workers() == 1
@@ -12,6 +12,10 @@ class Hubfile(db.Model):
     checksum = db.Column(db.String(120), nullable=False)
     size = db.Column(db.Integer, nullable=False)
     feature_model_id = db.Column(db.Integer, db.ForeignKey('feature_model.id'), nullable=False)
+    # The blob store entry holding the content; None while the file has its own copy in the dataset folder
+    blob_id = db.Column(db.Integer, db.ForeignKey('file_blob.id', ondelete='SET NULL'), nullable=True, index=True)
+
+    blob = db.relationship('HubfileBlob')
 
     def get_formatted_size(self):
         from app.modules.dataset.services import SizeService
@@ -43,6 +47,22 @@ class Hubfile(db.Model):
         return f'File<{self.id}>'
 
 
+class HubfileBlob(db.Model):
+    """
+    A file content stored once in the blob store, under its checksum. ``ref_count`` is the number of hubfiles
+    that point to it; the blob is removed when it drops to zero.
+    """
+    __tablename__ = 'file_blob'
+    id = db.Column(db.Integer, primary_key=True)
+    checksum = db.Column(db.String(120), nullable=False, unique=True, index=True)
+    size = db.Column(db.Integer, nullable=False)
+    ref_count = db.Column(db.Integer, nullable=False, default=0)
+    created_at = db.Column(db.DateTime, nullable=False, default=lambda: datetime.now(timezone.utc))
+
+    def __repr__(self):
+        return f'FileBlob<{self.checksum}, refs={self.ref_count}>'
+
+
 class HubfileViewRecord(db.Model):
     __tablename__ = 'file_view_record'
     id = db.Column(db.Integer, primary_key=True)
@@ -70,3 +90,43 @@ class HubfileDownloadRecord(db.Model):
             f'date={self.download_date} '
             f'cookie={self.download_cookie}>'
         )
+
+
+class HubfileAnalysis(db.Model):
+    __tablename__ = 'hubfile_analysis'
+    id = db.Column(db.Integer, primary_key=True)
+    file_id = db.Column(db.Integer, db.ForeignKey('file.id'), nullable=False, unique=True)
+    checksum = db.Column(db.String(120), nullable=False)
+    is_valid = db.Column(db.Boolean, nullable=False, default=False, index=True)
+    errors = db.Column(db.JSON)
+    number_of_configurations = db.Column(db.Float(precision=53), index=True)
+    # Set when the exact count timed out and number_of_configurations holds an estimate within these bounds
+    configurations_approximate = db.Column(db.Boolean, nullable=False, default=False)
+    configurations_lower_bound = db.Column(db.Float(precision=53))
+    configurations_upper_bound = db.Column(db.Float(precision=53))
+    number_of_features = db.Column(db.Integer)
+    number_of_constraints = db.Column(db.Integer)
+    analyzed_at = db.Column(db.DateTime, nullable=False, default=lambda: datetime.now(timezone.utc))
+
+    file = db.relationship('Hubfile', backref=db.backref('analysis', uselist=False, cascade="all, delete"))
+
+    def is_stale(self) -> bool:
+        return self.checksum != self.file.checksum
+
+    def to_dict(self):
+        return {
+            'file_id': self.file_id,
+            'checksum': self.checksum,
+            'is_valid': self.is_valid,
+            'errors': self.errors or [],
+            'number_of_configurations': self.number_of_configurations,
+            'configurations_approximate': self.configurations_approximate,
+            'configurations_lower_bound': self.configurations_lower_bound,
+            'configurations_upper_bound': self.configurations_upper_bound,
+            'number_of_features': self.number_of_features,
+            'number_of_constraints': self.number_of_constraints,
+            'analyzed_at': self.analyzed_at,
+        }
+
+    def __repr__(self):
+        return f'HubfileAnalysis<file_id={self.file_id}, valid={self.is_valid}>'
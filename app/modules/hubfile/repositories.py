@@ -1,8 +1,11 @@
-from sqlalchemy import func
+from datetime import datetime, timezone
+from typing import List, Optional
+from sqlalchemy import func, or_
+from sqlalchemy.exc import IntegrityError
 from app.modules.auth.models import User
 from app.modules.dataset.models import DataSet
 from app.modules.featuremodel.models import FeatureModel
-from app.modules.hubfile.models import Hubfile, HubfileDownloadRecord, HubfileViewRecord
+from app.modules.hubfile.models import Hubfile, HubfileAnalysis, HubfileBlob, HubfileDownloadRecord, HubfileViewRecord
 from core.repositories.BaseRepository import BaseRepository
 from app import db
 
@@ -11,6 +14,9 @@ class HubfileRepository(BaseRepository):
     def __init__(self):
         super().__init__(Hubfile)
 
+    def get_by_ids(self, ids) -> List[Hubfile]:
+        return self.model.query.filter(self.model.id.in_(ids)).all()
+
     def get_owner_user_by_hubfile(self, hubfile: Hubfile) -> User:
         return (
             db.session.query(User)
@@ -24,6 +30,46 @@ class HubfileRepository(BaseRepository):
     def get_dataset_by_hubfile(self, hubfile: Hubfile) -> DataSet:
         return db.session.query(DataSet).join(FeatureModel).join(Hubfile).filter(Hubfile.id == hubfile.id).first()
 
+    def get_batch_with_dataset_after(self, last_id: int, limit: int) -> list:
+        """``(hubfile, dataset)`` pairs with ids above ``last_id``, in id order."""
+        return (
+            db.session.query(Hubfile, DataSet)
+            .join(FeatureModel, Hubfile.feature_model_id == FeatureModel.id)
+            .join(DataSet, FeatureModel.data_set_id == DataSet.id)
+            .filter(Hubfile.id > last_id)
+            .order_by(Hubfile.id)
+            .limit(limit)
+            .all()
+        )
+
+
+class HubfileBlobRepository(BaseRepository):
+    def __init__(self):
+        super().__init__(HubfileBlob)
+
+    def get_by_checksum(self, checksum: str) -> Optional[HubfileBlob]:
+        return self.model.query.filter_by(checksum=checksum).first()
+
+    def lock(self, checksum: str, size: int) -> HubfileBlob:
+        """
+        Lock the row of a blob (``SELECT ... FOR UPDATE``), creating it without references when missing, so
+        that storing and releasing the same content are serialized until the caller commits.
+        """
+        blob = self.model.query.filter_by(checksum=checksum).with_for_update().first()
+        if blob is None:
+            try:
+                with self.session.begin_nested():
+                    blob = self.model(checksum=checksum, size=size, ref_count=0)
+                    self.session.add(blob)
+            except IntegrityError:
+                # Created by a concurrent upload of the same content; wait for its transaction
+                blob = self.model.query.filter_by(checksum=checksum).with_for_update().first()
+        return blob
+
+    def lock_existing(self, checksum: str) -> Optional[HubfileBlob]:
+        """Lock the row of a blob, or return None when there is none."""
+        return self.model.query.filter_by(checksum=checksum).with_for_update().first()
+
 
 class HubfileViewRecordRepository(BaseRepository):
     def __init__(self):
@@ -41,3 +87,49 @@ class HubfileDownloadRecordRepository(BaseRepository):
     def total_hubfile_downloads(self) -> int:
         max_id = self.model.query.with_entities(func.max(self.model.id)).scalar()
         return max_id if max_id is not None else 0
+
+
+class HubfileAnalysisRepository(BaseRepository):
+    def __init__(self):
+        super().__init__(HubfileAnalysis)
+
+    def get_by_file_id(self, file_id: int) -> Optional[HubfileAnalysis]:
+        return self.model.query.filter_by(file_id=file_id).first()
+
+    def get_fresh_by_checksums(self, checksums) -> List[HubfileAnalysis]:
+        return (
+            db.session.query(HubfileAnalysis)
+            .join(Hubfile, HubfileAnalysis.file_id == Hubfile.id)
+            .filter(HubfileAnalysis.checksum.in_(checksums), HubfileAnalysis.checksum == Hubfile.checksum)
+            .all()
+        )
+
+    def get_files_pending_analysis(self, file_ids=None, after_id: int = 0,
+                                   limit: Optional[int] = None) -> List[Hubfile]:
+        query = (
+            db.session.query(Hubfile)
+            .outerjoin(HubfileAnalysis, HubfileAnalysis.file_id == Hubfile.id)
+            .filter(or_(HubfileAnalysis.id.is_(None), HubfileAnalysis.checksum != Hubfile.checksum))
+            .filter(Hubfile.id > after_id)
+            .order_by(Hubfile.id.asc())
+        )
+        if file_ids is not None:
+            query = query.filter(Hubfile.id.in_(file_ids))
+        if limit is not None:
+            query = query.limit(limit)
+        return query.all()
+
+    def upsert(self, hubfile: Hubfile, commit: bool = True, **kwargs) -> HubfileAnalysis:
+        instance = self.get_by_file_id(hubfile.id)
+        if instance is None:
+            instance = self.model(file_id=hubfile.id)
+            self.session.add(instance)
+        instance.checksum = hubfile.checksum
+        instance.analyzed_at = datetime.now(timezone.utc)
+        for key, value in kwargs.items():
+            setattr(instance, key, value)
+        if commit:
+            self.session.commit()
+        else:
+            self.session.flush()
+        return instance
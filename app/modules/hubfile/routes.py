@@ -1,12 +1,14 @@
 from datetime import datetime, timezone
 import os
 import uuid
-from flask import current_app, jsonify, make_response, request, send_from_directory, abort
+from flask import current_app, jsonify, make_response, request, abort
 from flask_login import current_user
+from werkzeug.exceptions import HTTPException
 from app.modules.hubfile import hubfile_bp
 from app.modules.hubfile.models import HubfileDownloadRecord, HubfileViewRecord
 from app.modules.hubfile.services import HubfileDownloadRecordService, HubfileService
 from app import db
+from core.streaming.file_response import deliver_file
 import traceback
 
 
@@ -15,11 +17,9 @@ def download_file(file_id):
     try:
         # Intentamos obtener el archivo del servicio
         file = HubfileService().get_or_404(file_id)
-        # Configuración de la ruta de descarga
+        # Where the file is stored (its dataset folder or the blob store), which nginx can serve
         filename = file.name
-        directory_path = "app/modules/dataset/uvl_examples/"
-        parent_directory_path = os.path.dirname(current_app.root_path)
-        file_path = os.path.join(parent_directory_path, directory_path)
+        file_path = HubfileService().get_path_by_hubfile(file)
 
         # Verifica si el archivo existe
         if not os.path.exists(file_path):
@@ -41,12 +41,14 @@ def download_file(file_id):
                 download_cookie=user_cookie,
             )
 
-        resp = make_response(
-            send_from_directory(directory=file_path, path=filename, as_attachment=True)
-        )
+        # Ranges and validators let interrupted downloads resume; the checksum is a strong ETag
+        resp = deliver_file(file_path, mimetype="application/octet-stream", download_name=filename,
+                            etag=file.checksum)
         resp.set_cookie("file_download_cookie", user_cookie)
         return resp
 
+    except HTTPException:
+        raise
     except Exception as e:
         # Si ocurre un error, capturamos la excepción y devolvemos 500
         current_app.logger.error(f"Error inesperado al intentar descargar el archivo: {e}")
@@ -60,11 +62,7 @@ def download_file(file_id):
 @hubfile_bp.route('/file/view/<int:file_id>', methods=['GET'])
 def view_file(file_id):
     file = HubfileService().get_or_404(file_id)
-    filename = file.name
-
-    directory_path = f"uploads/user_{file.feature_model.data_set.user_id}/dataset_{file.feature_model.data_set_id}/"
-    parent_directory_path = os.path.dirname(current_app.root_path)
-    file_path = os.path.join(parent_directory_path, directory_path, filename)
+    file_path = HubfileService().get_path_by_hubfile(file)
 
     try:
         if os.path.exists(file_path):
@@ -1,20 +1,48 @@
+import filecmp
+import logging
 import os
+import sys
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from typing import Optional
 from app.modules.auth.models import User
 from app.modules.dataset.models import DataSet
-from app.modules.hubfile.models import Hubfile
+from app.modules.flamapy.executor import ExecutorSaturated, get_executor, validate_task
+from app.modules.flamapy.services import FlamapyService, file_checksum
+from app.modules.hubfile.models import Hubfile, HubfileAnalysis
 from app.modules.hubfile.repositories import (
+    HubfileAnalysisRepository,
+    HubfileBlobRepository,
     HubfileDownloadRecordRepository,
     HubfileRepository,
     HubfileViewRecordRepository
 )
+from core.cache.lru_cache import MemoryLRUCache
+from core.configuration.configuration import uploads_folder_name
 from core.services.BaseService import BaseService
 
+logger = logging.getLogger(__name__)
+
+# Validation results of files that have no stored analysis yet, keyed by checksum
+validation_cache = MemoryLRUCache(int(os.getenv("UVL_VALIDATION_CACHE_BYTES", 4 * 1024 * 1024)))
+
+
+def as_double(count):
+    """Configuration counts are stored as doubles so they can be range-filtered; larger ones are clamped."""
+    if count is None:
+        return None
+    try:
+        return float(count)
+    except OverflowError:
+        return sys.float_info.max
+
 
 class HubfileService(BaseService):
     def __init__(self):
         super().__init__(HubfileRepository())
         self.hubfile_view_record_repository = HubfileViewRecordRepository()
         self.hubfile_download_record_repository = HubfileDownloadRecordRepository()
+        self.hubfile_analysis_repository = HubfileAnalysisRepository()
 
     def get_owner_user_by_hubfile(self, hubfile: Hubfile) -> User:
         return self.repository.get_owner_user_by_hubfile(hubfile)
@@ -34,7 +62,7 @@ class HubfileService(BaseService):
                             f'dataset_{hubfile_dataset.id}',
                             hubfile.name)
 
-        return path
+        return HubfileBlobService().resolve(hubfile.checksum, path)
 
     def total_hubfile_views(self) -> int:
         return self.hubfile_view_record_repository.total_hubfile_views()
@@ -43,7 +71,280 @@ class HubfileService(BaseService):
         hubfile_download_record_repository = HubfileDownloadRecordRepository()
         return hubfile_download_record_repository.total_hubfile_downloads()
 
+    def analyze(self, hubfile: Hubfile, file_path: Optional[str] = None, commit: bool = True,
+                metrics: Optional[dict] = None) -> HubfileAnalysis:
+        """
+        Run the UVL analysis for a hubfile and persist it for the checksum the file currently has.
+
+        Args:
+            hubfile (Hubfile): The file to analyze.
+            file_path (str): Where the file lives, when it is not in its final location yet (e.g. at upload).
+            commit (bool): Whether to commit the session after storing the analysis.
+            metrics (dict): Validation and structural metrics already computed for this checksum at upload
+                (see ``FlamapyService.structural_metrics``).
+
+        Returns:
+            HubfileAnalysis: The stored analysis.
+        """
+        if file_path is None:
+            file_path = self.get_path_by_hubfile(hubfile)
+
+        result = FlamapyService().analyze_uvl(file_path, hubfile.checksum, metrics)
+
+        return self.hubfile_analysis_repository.upsert(
+            hubfile,
+            commit=commit,
+            is_valid=result["is_valid"],
+            errors=result["errors"],
+            number_of_configurations=as_double(result["number_of_configurations"]),
+            configurations_approximate=result["configurations_approximate"],
+            configurations_lower_bound=as_double(result["configurations_lower_bound"]),
+            configurations_upper_bound=as_double(result["configurations_upper_bound"]),
+            number_of_features=result["number_of_features"],
+            number_of_constraints=result["number_of_constraints"],
+        )
+
+    def get_analysis(self, hubfile: Hubfile) -> HubfileAnalysis:
+        analysis = self.hubfile_analysis_repository.get_by_file_id(hubfile.id)
+        if analysis is None or analysis.is_stale():
+            analysis = self.analyze(hubfile)
+        return analysis
+
+    def validate_batch(self, file_ids) -> list:
+        """
+        Validate many files at once. Results already known for a checksum (stored analyses or recent
+        validations) are reused; the remaining files are parsed in parallel in the flamapy pool, once per
+        distinct checksum.
+
+        Args:
+            file_ids (list): Ids of the files to validate. Repeated ids are answered once.
+
+        Returns:
+            list: One ``{"file_id", "valid", "errors", "cached"}`` entry per distinct requested id, in order.
+
+        Raises:
+            ExecutorSaturated: When the flamapy pool cannot take the files, so the caller can answer 503.
+        """
+        file_ids = list(dict.fromkeys(file_ids))
+        hubfiles = {hubfile.id: hubfile for hubfile in self.repository.get_by_ids(file_ids)}
+        checksums = {hubfile.checksum for hubfile in hubfiles.values()}
+        known = {
+            analysis.checksum: (analysis.is_valid, analysis.errors or [])
+            for analysis in self.hubfile_analysis_repository.get_fresh_by_checksums(checksums)
+        } if checksums else {}
+
+        results = {}
+        # Checksum -> (path of one of the files, files with that content): each content is parsed once
+        to_validate = {}
+        for file_id in file_ids:
+            hubfile = hubfiles.get(file_id)
+            if hubfile is None:
+                results[file_id] = {"file_id": file_id, "valid": False, "errors": ["File not found"], "cached": False}
+                continue
+            cached = known.get(hubfile.checksum) or validation_cache.get(hubfile.checksum)
+            if cached is not None:
+                results[file_id] = {"file_id": file_id, "valid": cached[0], "errors": cached[1], "cached": True}
+            else:
+                if hubfile.checksum not in to_validate:
+                    to_validate[hubfile.checksum] = (self.get_path_by_hubfile(hubfile), [])
+                to_validate[hubfile.checksum][1].append(hubfile)
+
+        def validate(item):
+            file_path, same_content = item
+            try:
+                errors = get_executor().run(validate_task, file_path)
+            except ExecutorSaturated:
+                raise
+            except Exception as exc:
+                # Unreadable files are reported but not cached: they may appear later
+                return same_content, [str(exc)], False
+            return same_content, errors, True
+
+        if to_validate:
+            with ThreadPoolExecutor(max_workers=get_executor().workers) as pool:
+                for same_content, errors, cacheable in pool.map(validate, to_validate.values()):
+                    if cacheable:
+                        validation_cache.put(same_content[0].checksum, (not errors, errors),
+                                             64 + sum(len(e) for e in errors))
+                    for hubfile in same_content:
+                        results[hubfile.id] = {
+                            "file_id": hubfile.id, "valid": not errors, "errors": errors, "cached": False
+                        }
+
+        return [results[file_id] for file_id in file_ids]
+
+    def backfill_analyses(self, batch_size: int = 50):
+        """
+        Analyze, batch by batch, every file without an up to date analysis. Meant for the CLI: searches never
+        analyze files themselves and treat the missing analyses as unknown.
+
+        Yields:
+            tuple: The ids of the files of each batch and how many of them were analyzed.
+        """
+        last_id = 0
+        while True:
+            pending = self.hubfile_analysis_repository.get_files_pending_analysis(after_id=last_id, limit=batch_size)
+            if not pending:
+                return
+            analyzed = 0
+            for hubfile in pending:
+                try:
+                    self.analyze(hubfile, commit=False)
+                    analyzed += 1
+                except Exception as exc:
+                    logger.warning(f"Could not analyze file {hubfile.id}: {exc}")
+            self.repository.session.commit()
+            last_id = pending[-1].id
+            yield [hubfile.id for hubfile in pending], analyzed
+
 
 class HubfileDownloadRecordService(BaseService):
     def __init__(self):
         super().__init__(HubfileDownloadRecordRepository())
+
+
+class HubfileBlobService(BaseService):
+    """
+    Content-addressed store of uploaded files: every distinct content is kept once, at
+    ``uploads/blobs/<ab>/<cd>/<checksum>``, and counts the hubfiles that use it. Files uploaded before the
+    store (or whose content does not match their checksum) stay in their dataset folder, which is why paths
+    are resolved with ``resolve``.
+    """
+
+    def __init__(self):
+        super().__init__(HubfileBlobRepository())
+
+    def blob_folder(self) -> str:
+        return os.path.join(os.getenv('WORKING_DIR', ''), uploads_folder_name(), 'blobs')
+
+    def path_for(self, checksum: str) -> str:
+        return os.path.join(self.blob_folder(), checksum[:2], checksum[2:4], checksum)
+
+    def resolve(self, checksum: str, legacy_path: str) -> str:
+        """The path of a file: ``legacy_path`` while the file is still there, its blob otherwise."""
+        if os.path.exists(legacy_path) or not checksum:
+            return legacy_path
+        path = self.path_for(checksum)
+        return path if os.path.exists(path) else legacy_path
+
+    def store(self, file_path: str, checksum: str, commit: bool = True, verify: bool = True,
+              hubfile: Optional[Hubfile] = None) -> Optional[str]:
+        """
+        Move a file into the store and count the reference. When the content is already stored the file is
+        just removed. The blob row stays locked until the transaction ends, so a concurrent ``release``
+        cannot remove the blob between the check and the reference.
+
+        Args:
+            verify (bool): Hash the file to check ``checksum``. Only skip it when the checksum was just
+                computed from the file.
+            hubfile (Hubfile): The file referencing the blob, which is recorded in its ``blob``.
+
+        Returns:
+            str: The blob path, or None when the file was left where it is: its content does not hash to
+            ``checksum``, or differs from the blob stored under it.
+        """
+        if not checksum or (verify and file_checksum(file_path) != checksum):
+            return None
+        blob = self.repository.lock(checksum, os.path.getsize(file_path))
+        path = self.path_for(checksum)
+        if os.path.exists(path):
+            if not filecmp.cmp(file_path, path, shallow=False):
+                logger.warning(f"{file_path} hashes to {checksum} but differs from the stored blob; not deduplicated")
+                if blob.ref_count == 0:
+                    self.repository.session.delete(blob)
+                return None
+            os.remove(file_path)
+        else:
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            os.replace(file_path, path)
+
+        blob.ref_count += 1
+        if hubfile is not None:
+            hubfile.blob = blob
+        if commit:
+            self.repository.session.commit()
+        return path
+
+    def release(self, checksum: str, set_aside: Optional[list] = None) -> bool:
+        """
+        Drop one reference to a blob, removing it with the last one. Returns whether it was removed.
+
+        The file of a removed blob is renamed aside while its row is locked, so no concurrent ``store`` can
+        count on it meanwhile, and only deleted once the removal is committed: a rollback puts it back.
+
+        Args:
+            set_aside (list): When given, the caller commits (e.g. together with other changes): the renamed
+                files are appended to it, to ``discard`` after the commit or ``restore`` after a rollback.
+                Otherwise the release is committed here.
+        """
+        blob = self.repository.lock_existing(checksum)
+        if blob is None:
+            return False
+        blob.ref_count -= 1
+        removed = blob.ref_count <= 0
+        aside = []
+        if removed:
+            self.repository.session.delete(blob)
+            path = self.path_for(checksum)
+            if os.path.exists(path):
+                aside.append(f"{path}.deleting-{uuid.uuid4().hex}")
+                os.replace(path, aside[0])
+
+        if set_aside is not None:
+            set_aside.extend(aside)
+            return removed
+        try:
+            self.repository.session.commit()
+        except Exception:
+            self.repository.session.rollback()
+            self.restore(aside)
+            raise
+        self.discard(aside)
+        return removed
+
+    def discard(self, set_aside: list):
+        """Delete the files set aside by ``release`` once their removal is committed."""
+        for path in set_aside:
+            try:
+                os.remove(path)
+            except FileNotFoundError:
+                pass
+
+    def restore(self, set_aside: list):
+        """Put back the files set aside by ``release`` after the transaction was rolled back."""
+        for path in set_aside:
+            original = path.rsplit(".deleting-", 1)[0]
+            if os.path.exists(original):
+                # Stored again meanwhile, with the same content
+                os.remove(path)
+            else:
+                os.replace(path, original)
+
+    def deduplicate(self, batch_size: int = 200):
+        """
+        Move the files still in dataset folders into the store, a batch of hubfiles at a time.
+
+        Yields:
+            tuple: For every batch, the number of files moved in and the bytes freed by dropping duplicates.
+        """
+        hubfile_repository = HubfileRepository()
+        working_dir = os.getenv('WORKING_DIR', '')
+        last_id = 0
+        while True:
+            batch = hubfile_repository.get_batch_with_dataset_after(last_id, batch_size)
+            if not batch:
+                return
+            moved = freed = 0
+            for hubfile, dataset in batch:
+                legacy_path = os.path.join(working_dir, uploads_folder_name(), f'user_{dataset.user_id}',
+                                           f'dataset_{dataset.id}', hubfile.name)
+                if not os.path.exists(legacy_path):
+                    continue
+                already_stored = os.path.exists(self.path_for(hubfile.checksum))
+                size = os.path.getsize(legacy_path)
+                if self.store(legacy_path, hubfile.checksum, commit=False, hubfile=hubfile) is not None:
+                    moved += 1
+                    freed += size if already_stored else 0
+            self.repository.session.commit()
+            last_id = batch[-1][0].id
+            yield moved, freed
@@ -1,10 +1,16 @@
 import pytest
 from unittest.mock import patch, MagicMock
-from app.modules.hubfile.services import HubfileService
+from app import db
+from app.modules.auth.models import User
+from app.modules.common.dbutils import create_dataset_db
+from app.modules.dataset.models import DataSet
+from app.modules.flamapy.services import file_checksum
+from app.modules.hubfile.services import HubfileBlobService, HubfileService
 from flask import Flask
 from flask_login import UserMixin
 from flask import abort
 import os
+from core.streaming.file_response import deliver_file, file_response, parse_byte_ranges
 
 
 # Crear un usuario simulado para las pruebas
@@ -98,3 +104,176 @@ def test_download_file_not_found(mock_exists, mock_get_or_404, client):
     response = client.get('/file/download/10')
     # Valida el resultado esperado 404
     assert response.status_code == 404
+
+
+@pytest.fixture
+def ranges_client():
+    app = Flask(__name__)
+    app.testing = True
+
+    @app.route('/example')
+    def example():
+        return file_response("app/modules/dataset/uvl_examples/file1.uvl", "text/plain", etag="abc")
+    return app.test_client()
+
+
+def test_parse_byte_ranges():
+    assert parse_byte_ranges("bytes=0-9,20-,-5") == [(0, 10), (20, None), (None, 5)]
+    assert parse_byte_ranges("bytes=20-29,0-9") == [(20, 30), (0, 10)], "Unordered ranges are valid"
+    assert parse_byte_ranges("bytes=9-3") is None
+    assert parse_byte_ranges("items=0-9") is None
+
+
+def test_file_response_ranges(ranges_client):
+    with open("app/modules/dataset/uvl_examples/file1.uvl", "rb") as f:
+        content = f.read()
+
+    full = ranges_client.get('/example')
+    assert full.status_code == 200 and full.data == content
+    assert full.headers["Accept-Ranges"] == "bytes"
+    assert full.headers["ETag"] == '"abc"'
+
+    single = ranges_client.get('/example', headers={"Range": "bytes=10-19"})
+    assert single.status_code == 206
+    assert single.data == content[10:20]
+    assert single.headers["Content-Range"] == f"bytes 10-19/{len(content)}"
+
+    multi = ranges_client.get('/example', headers={"Range": "bytes=50-59,0-4"})
+    assert multi.status_code == 206
+    assert multi.mimetype == "multipart/byteranges"
+    assert int(multi.headers["Content-Length"]) == len(multi.data)
+    assert content[0:5] in multi.data and content[50:60] in multi.data
+
+    assert ranges_client.get('/example', headers={"Range": "bytes=99999-"}).status_code == 416
+    assert ranges_client.get('/example', headers={"If-None-Match": '"abc"'}).status_code == 304
+    # A stale If-Range gets the whole file
+    assert ranges_client.get('/example', headers={"Range": "bytes=0-4", "If-Range": '"old"'}).status_code == 200
+    assert ranges_client.get('/example', headers={"Range": "bytes=0-4", "If-Range": '"abc"'}).status_code == 206
+
+
+def test_deliver_file_x_accel(tmp_path, monkeypatch):
+    monkeypatch.setenv("WORKING_DIR", str(tmp_path))
+    monkeypatch.setenv("FLASK_ENV", "production")
+    monkeypatch.setenv("FILE_DELIVERY_MODE", "x-accel")
+    os.makedirs(tmp_path / "uploads" / "user_1")
+    inside = tmp_path / "uploads" / "user_1" / "my model.uvl"
+    inside.write_text("features")
+    outside = tmp_path / "outside.uvl"
+    outside.write_text("features")
+
+    app = Flask(__name__)
+    with app.test_request_context('/'):
+        response = deliver_file(str(inside), "text/plain", etag="abc")
+        assert response.headers["X-Accel-Redirect"] == "/protected-uploads/user_1/my%20model.uvl"
+        assert response.headers["Content-Disposition"] == 'attachment; filename="my model.uvl"'
+        assert not response.get_data(), "nginx sends the body"
+
+        # Files nginx cannot see are sent directly
+        assert "X-Accel-Redirect" not in deliver_file(str(outside), "text/plain").headers
+
+        monkeypatch.setenv("FLASK_ENV", "development")
+        assert "X-Accel-Redirect" not in deliver_file(str(inside), "text/plain").headers
+
+
+def test_blob_store_deduplicates(test_client, tmp_path, monkeypatch):
+    monkeypatch.setenv("WORKING_DIR", str(tmp_path))
+    service = HubfileBlobService()
+    with open("app/modules/dataset/uvl_examples/file1.uvl", "rb") as f:
+        content = f.read()
+    checksum = file_checksum("app/modules/dataset/uvl_examples/file1.uvl")
+
+    paths = []
+    for name in ("first.uvl", "second.uvl"):
+        upload = tmp_path / name
+        upload.write_bytes(content)
+        paths.append(service.store(str(upload), checksum))
+        assert not upload.exists(), "The upload is moved into the store"
+    assert paths[0] == paths[1] == service.path_for(checksum)
+    assert service.repository.get_by_checksum(checksum).ref_count == 2
+
+    legacy = tmp_path / "legacy.uvl"
+    assert service.resolve(checksum, str(legacy)) == paths[0]
+    legacy.write_bytes(content)
+    assert service.resolve(checksum, str(legacy)) == str(legacy), "Files not moved yet keep their own path"
+
+    mismatched = tmp_path / "mismatched.uvl"
+    mismatched.write_bytes(b"features\n    Other")
+    assert service.store(str(mismatched), checksum) is None
+    assert mismatched.exists()
+
+    assert not service.release(checksum)
+    assert service.release(checksum)
+    assert not os.path.exists(paths[0])
+    assert service.repository.get_by_checksum(checksum) is None
+
+
+def test_dataset_delete_releases_only_recorded_blob_references(test_client, tmp_path, monkeypatch):
+    with test_client.application.app_context():
+        create_dataset_db(61, num_files=2)
+        dataset = User.query.filter_by(email="user61@example.com").first().data_sets[0]
+        stored, own_copy = dataset.files()
+
+        monkeypatch.setenv("WORKING_DIR", str(tmp_path))
+        service = HubfileBlobService()
+        upload = tmp_path / "upload.uvl"
+        upload.write_bytes(b"features\n    Stored")
+        assert service.store(str(upload), stored.checksum, verify=False, hubfile=stored) is not None
+        assert stored.blob.ref_count == 1
+
+        # A blob of the same content as the file with its own copy, referenced by another dataset
+        other = tmp_path / "other.uvl"
+        other.write_bytes(b"features\n    Other")
+        service.store(str(other), own_copy.checksum, verify=False)
+        assert own_copy.blob_id is None
+
+        dataset.delete()
+        assert service.repository.get_by_checksum(stored.checksum) is None
+        assert not os.path.exists(service.path_for(stored.checksum))
+        assert service.repository.get_by_checksum(own_copy.checksum).ref_count == 1, \
+            "Files without a recorded reference must not release the blob of their content"
+
+
+def test_download_file_is_served_from_its_stored_path(test_client, monkeypatch):
+    with test_client.application.app_context():
+        create_dataset_db(62, num_files=1)
+        hubfile = User.query.filter_by(email="user62@example.com").first().data_sets[0].files()[0]
+        file_id, stored_path = hubfile.id, hubfile.get_path()
+        with open(stored_path, "rb") as f:
+            content = f.read()
+
+    response = test_client.get(f"/file/download/{file_id}")
+    assert response.status_code == 200 and response.data == content
+
+    monkeypatch.setenv("FILE_DELIVERY_MODE", "x-accel")
+    monkeypatch.delenv("FLASK_ENV", raising=False)
+    response = test_client.get(f"/file/download/{file_id}")
+    assert response.headers["X-Accel-Redirect"].startswith("/protected-uploads/user_")
+    assert response.data == b"", "nginx sends the bytes"
+
+
+def test_dataset_delete_keeps_blobs_when_the_deletion_fails(test_client, tmp_path, monkeypatch):
+    with test_client.application.app_context():
+        create_dataset_db(63, num_files=1)
+        dataset = User.query.filter_by(email="user63@example.com").first().data_sets[0]
+        hubfile = dataset.files()[0]
+
+        monkeypatch.setenv("WORKING_DIR", str(tmp_path))
+        service = HubfileBlobService()
+        upload = tmp_path / "upload.uvl"
+        upload.write_bytes(b"features\n    Kept")
+        blob_path = service.store(str(upload), hubfile.checksum, verify=False, hubfile=hubfile)
+
+        def fail():
+            raise RuntimeError("database went away")
+        with monkeypatch.context() as patched, pytest.raises(RuntimeError):
+            patched.setattr(db.session, "commit", fail)
+            dataset.delete()
+
+        assert db.session.get(DataSet, dataset.id) is not None
+        assert service.repository.get_by_checksum(hubfile.checksum).ref_count == 1
+        assert os.path.exists(blob_path), "The blob file must be back after the rollback"
+        assert os.listdir(os.path.dirname(blob_path)) == [os.path.basename(blob_path)]
+
+        dataset.delete()
+        assert service.repository.get_by_checksum(hubfile.checksum) is None
+        assert not os.path.exists(blob_path)
@@ -1,12 +1,16 @@
 import logging
 import os
-import requests
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from urllib.parse import quote
 
-from app.modules.dataset.models import DataSet
+from app.modules.dataset.models import DataSet, DSMetaData
 from app.modules.featuremodel.models import FeatureModel
+from app.modules.hubfile.services import HubfileBlobService
 from app.modules.zenodo.repositories import ZenodoRepository
 
 from core.configuration.configuration import uploads_folder_name
+from core.http.session import RetryingSession
 from dotenv import load_dotenv
 from flask import jsonify, Response
 from flask_login import current_user
@@ -18,6 +22,28 @@ logger = logging.getLogger(__name__)
 
 load_dotenv()
 
+# Files of a deposition uploaded at the same time (and connections kept open to Zenodo)
+ZENODO_UPLOAD_WORKERS = int(os.getenv("ZENODO_UPLOAD_WORKERS", 4))
+
+_session = None
+_session_pid = None
+_session_lock = threading.Lock()
+
+
+def get_zenodo_session() -> RetryingSession:
+    """The HTTP session shared by the Zenodo clients of the current process, created on first use."""
+    global _session, _session_pid
+    with _session_lock:
+        if _session is None or _session_pid != os.getpid():
+            _session = RetryingSession(
+                pool_size=ZENODO_UPLOAD_WORKERS,
+                max_retries=int(os.getenv("ZENODO_MAX_RETRIES", 5)),
+                backoff=float(os.getenv("ZENODO_RETRY_BACKOFF", 0.5)),
+                timeout=float(os.getenv("ZENODO_TIMEOUT", 120)),
+            )
+            _session_pid = os.getpid()
+        return _session
+
 
 class ZenodoService(BaseService):
 
@@ -44,6 +70,7 @@ class ZenodoService(BaseService):
         self.ZENODO_API_URL = self.get_zenodo_url()
         self.headers = {"Content-Type": "application/json"}
         self.params = {"access_token": self.ZENODO_ACCESS_TOKEN}
+        self.session = get_zenodo_session()
 
     def test_connection(self) -> bool:
         """
@@ -52,7 +79,7 @@ class ZenodoService(BaseService):
         Returns:
             bool: True if the connection is successful, False otherwise.
         """
-        response = requests.get(self.ZENODO_API_URL, params=self.params, headers=self.headers)
+        response = self.session.get(self.ZENODO_API_URL, params=self.params, headers=self.headers)
         return response.status_code == 200
 
     def test_full_connection(self) -> Response:
@@ -84,7 +111,7 @@ class ZenodoService(BaseService):
             }
         }
 
-        response = requests.post(self.ZENODO_API_URL, json=data, params=self.params, headers=self.headers)
+        response = self.session.post(self.ZENODO_API_URL, json=data, params=self.params, headers=self.headers)
 
         if response.status_code != 201:
             return jsonify(
@@ -98,15 +125,12 @@ class ZenodoService(BaseService):
 
         # Step 2: Upload an empty file to the deposition
         data = {"name": "test_file.txt"}
-        files = {"file": open(file_path, "rb")}
         publish_url = f"{self.ZENODO_API_URL}/{deposition_id}/files"
-        response = requests.post(publish_url, params=self.params, data=data, files=files)
-        files["file"].close()  # Close the file after uploading
+        with open(file_path, "rb") as file:
+            response = self.session.post(publish_url, params=self.params, data=data, files={"file": file})
 
         logger.info(f"Publish URL: {publish_url}")
-        logger.info(f"Params: {self.params}")
         logger.info(f"Data: {data}")
-        logger.info(f"Files: {files}")
         logger.info(f"Response Status Code: {response.status_code}")
         logger.info(f"Response Content: {response.content}")
 
@@ -115,7 +139,7 @@ class ZenodoService(BaseService):
             success = False
 
         # Step 3: Delete the deposition
-        response = requests.delete(f"{self.ZENODO_API_URL}/{deposition_id}", params=self.params)
+        response = self.session.delete(f"{self.ZENODO_API_URL}/{deposition_id}", params=self.params)
 
         if os.path.exists(file_path):
             os.remove(file_path)
@@ -129,44 +153,44 @@ class ZenodoService(BaseService):
         Returns:
             dict: The response in JSON format with the depositions.
         """
-        response = requests.get(self.ZENODO_API_URL, params=self.params, headers=self.headers)
+        response = self.session.get(self.ZENODO_API_URL, params=self.params, headers=self.headers)
         if response.status_code != 200:
             raise Exception("Failed to get depositions")
         return response.json()
 
-    def create_new_deposition(self, dataset: DataSet) -> dict:
+    def create_new_deposition(self, ds_meta_data: DSMetaData) -> dict:
         """
         Create a new deposition in Zenodo.
 
         Args:
-            dataset (DataSet): The DataSet object containing the metadata of the deposition.
+            ds_meta_data (DSMetaData): The metadata of the dataset to deposit.
 
         Returns:
             dict: The response in JSON format with the details of the created deposition.
         """
 
         logger.info("Dataset sending to Zenodo...")
-        logger.info(f"Publication type...{dataset.ds_meta_data.publication_type.value}")
+        logger.info(f"Publication type...{ds_meta_data.publication_type.value}")
 
         metadata = {
-            "title": dataset.ds_meta_data.title,
-            "upload_type": "dataset" if dataset.ds_meta_data.publication_type.value == "none" else "publication",
+            "title": ds_meta_data.title,
+            "upload_type": "dataset" if ds_meta_data.publication_type.value == "none" else "publication",
             "publication_type": (
-                dataset.ds_meta_data.publication_type.value
-                if dataset.ds_meta_data.publication_type.value != "none"
+                ds_meta_data.publication_type.value
+                if ds_meta_data.publication_type.value != "none"
                 else None
             ),
-            "description": dataset.ds_meta_data.description,
+            "description": ds_meta_data.description,
             "creators": [
                 {
                     "name": author.name,
                     **({"affiliation": author.affiliation} if author.affiliation else {}),
                     **({"orcid": author.orcid} if author.orcid else {}),
                 }
-                for author in dataset.ds_meta_data.authors
+                for author in ds_meta_data.authors
             ],
             "keywords": (
-                ["uvlhub"] if not dataset.ds_meta_data.tags else dataset.ds_meta_data.tags.split(", ") + ["uvlhub"]
+                ["uvlhub"] if not ds_meta_data.tags else ds_meta_data.tags.split(", ") + ["uvlhub"]
             ),
             "access_right": "open",
             "license": "CC-BY-4.0",
@@ -174,7 +198,7 @@ class ZenodoService(BaseService):
 
         data = {"metadata": metadata}
 
-        response = requests.post(self.ZENODO_API_URL, params=self.params, json=data, headers=self.headers)
+        response = self.session.post(self.ZENODO_API_URL, params=self.params, json=data, headers=self.headers)
         if response.status_code != 201:
             error_message = f"Failed to create deposition. Error details: {response.json()}"
             raise Exception(error_message)
@@ -192,15 +216,44 @@ class ZenodoService(BaseService):
         Returns:
             dict: The response in JSON format with the details of the uploaded file.
         """
-        uvl_filename = feature_model.fm_meta_data.uvl_filename
-        data = {"name": uvl_filename}
+        return self.upload_files(dataset, deposition_id, [feature_model], user)[0]
+
+    def upload_files(self, dataset: DataSet, deposition_id: int, feature_models: list, user=None) -> list:
+        """
+        Upload the files of several feature models to a deposition, ``ZENODO_UPLOAD_WORKERS`` at a time over
+        the pooled session. They are sent to the deposition's bucket with ``PUT``, which Zenodo treats as
+        idempotent, so a failed upload can be retried safely.
+
+        Returns:
+            list: The responses in JSON format, in the order of ``feature_models``.
+
+        Raises:
+            Exception: When the deposition has no bucket link. Nothing is uploaded then: the older
+                ``POST /files`` endpoint would add the files again on every retry.
+        """
         user_id = current_user.id if user is None else user.id
-        file_path = os.path.join(uploads_folder_name(), f"user_{str(user_id)}", f"dataset_{dataset.id}/", uvl_filename)
-        files = {"file": open(file_path, "rb")}
+        # Paths are resolved here: the database session and current_user are not available to the threads
+        uploads = [self._file_to_upload(dataset, feature_model, user_id) for feature_model in feature_models]
+        bucket_url = self.get_deposition(deposition_id).get("links", {}).get("bucket")
+        if not bucket_url:
+            raise Exception(f"Deposition {deposition_id} has no bucket link to upload files to")
 
-        publish_url = f"{self.ZENODO_API_URL}/{deposition_id}/files"
-        response = requests.post(publish_url, params=self.params, data=data, files=files)
-        if response.status_code != 201:
+        with ThreadPoolExecutor(max_workers=max(min(ZENODO_UPLOAD_WORKERS, len(uploads)), 1)) as pool:
+            return list(pool.map(lambda upload: self._upload(*upload, bucket_url=bucket_url), uploads))
+
+    def _file_to_upload(self, dataset: DataSet, feature_model: FeatureModel, user_id: int) -> tuple:
+        uvl_filename = feature_model.fm_meta_data.uvl_filename
+        file_path = os.path.join(uploads_folder_name(), f"user_{str(user_id)}", f"dataset_{dataset.id}/", uvl_filename)
+        hubfile = next((file for file in feature_model.files if file.name == uvl_filename), None)
+        if hubfile is not None:
+            file_path = HubfileBlobService().resolve(hubfile.checksum, file_path)
+        return uvl_filename, file_path
+
+    def _upload(self, filename: str, file_path: str, bucket_url: str) -> dict:
+        with open(file_path, "rb") as file:
+            response = self.session.put(f"{bucket_url}/{quote(filename)}", params=self.params, data=file,
+                                        headers={"Content-Type": "application/octet-stream"})
+        if response.status_code not in (200, 201):
             error_message = f"Failed to upload files. Error details: {response.json()}"
             raise Exception(error_message)
         return response.json()
@@ -216,7 +269,7 @@ class ZenodoService(BaseService):
             dict: The response in JSON format with the details of the published deposition.
         """
         publish_url = f"{self.ZENODO_API_URL}/{deposition_id}/actions/publish"
-        response = requests.post(publish_url, params=self.params, headers=self.headers)
+        response = self.session.post(publish_url, params=self.params, headers=self.headers)
         if response.status_code != 202:
             raise Exception("Failed to publish deposition")
         return response.json()
@@ -232,7 +285,7 @@ class ZenodoService(BaseService):
             dict: The response in JSON format with the details of the deposition.
         """
         deposition_url = f"{self.ZENODO_API_URL}/{deposition_id}"
-        response = requests.get(deposition_url, params=self.params, headers=self.headers)
+        response = self.session.get(deposition_url, params=self.params, headers=self.headers)
         if response.status_code != 200:
             raise Exception("Failed to get deposition")
         return response.json()
@@ -0,0 +1,99 @@
+import json
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from types import SimpleNamespace
+from urllib.parse import unquote
+
+import pytest
+
+from app.modules.zenodo.services import ZenodoService
+
+
+class FakeZenodo(BaseHTTPRequestHandler):
+    """Answers like the deposition API, refusing the first upload of every file with a 429."""
+
+    uploads = {}
+    lock = threading.Lock()
+
+    def do_GET(self):
+        self.answer(200, {"id": 1, "links": {"bucket": f"http://127.0.0.1:{self.server.server_port}/bucket"}})
+
+    def do_PUT(self):
+        body = self.rfile.read(int(self.headers["Content-Length"]))
+        with self.lock:
+            attempts = self.uploads.setdefault(self.path, [])
+            attempts.append(body)
+        if len(attempts) == 1:
+            self.answer(429, {"message": "Too many requests"}, {"Retry-After": "0"})
+        else:
+            self.answer(201, {"key": unquote(self.path.split("?")[0].rsplit("/", 1)[1]), "size": len(body)})
+
+    def answer(self, status, payload, headers=None):
+        content = json.dumps(payload).encode()
+        self.send_response(status)
+        for name, value in (headers or {}).items():
+            self.send_header(name, value)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(content)))
+        self.end_headers()
+        self.wfile.write(content)
+
+    def log_message(self, *args):
+        pass
+
+
+@pytest.fixture
+def fake_zenodo(monkeypatch):
+    server = ThreadingHTTPServer(("127.0.0.1", 0), FakeZenodo)
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    monkeypatch.setenv("ZENODO_API_URL", f"http://127.0.0.1:{server.server_port}/api/deposit/depositions")
+    FakeZenodo.uploads = {}
+    yield FakeZenodo
+    server.shutdown()
+    server.server_close()
+
+
+def test_upload_files_retries_rate_limited_uploads(fake_zenodo, tmp_path, monkeypatch):
+    monkeypatch.setenv("UPLOADS_DIR", str(tmp_path))
+    folder = tmp_path / "user_1" / "dataset_1"
+    folder.mkdir(parents=True)
+    feature_models = []
+    for i in range(5):
+        (folder / f"model{i}.uvl").write_bytes(b"features\n    Root" + b"x" * i)
+        feature_models.append(SimpleNamespace(fm_meta_data=SimpleNamespace(uvl_filename=f"model{i}.uvl"), files=[]))
+
+    responses = ZenodoService().upload_files(SimpleNamespace(id=1), 1, feature_models, user=SimpleNamespace(id=1))
+
+    assert [response["key"] for response in responses] == [f"model{i}.uvl" for i in range(5)]
+    assert [response["size"] for response in responses] == [17 + i for i in range(5)]
+    for attempts in fake_zenodo.uploads.values():
+        assert len(attempts) == 2 and attempts[0] == attempts[1], "The retry sends the whole file again"
+
+
+def test_upload_files_quotes_filenames_in_the_bucket_url(fake_zenodo, tmp_path, monkeypatch):
+    monkeypatch.setenv("UPLOADS_DIR", str(tmp_path))
+    folder = tmp_path / "user_1" / "dataset_1"
+    folder.mkdir(parents=True)
+    filename = "my model #1?.uvl"
+    (folder / filename).write_bytes(b"features\n    Root")
+    feature_model = SimpleNamespace(fm_meta_data=SimpleNamespace(uvl_filename=filename), files=[])
+
+    responses = ZenodoService().upload_files(SimpleNamespace(id=1), 1, [feature_model], user=SimpleNamespace(id=1))
+
+    assert responses[0]["key"] == filename
+    assert all(path.startswith("/bucket/my%20model%20%231%3F.uvl") for path in fake_zenodo.uploads)
+
+
+def test_upload_files_refuses_depositions_without_bucket(fake_zenodo, tmp_path, monkeypatch):
+    monkeypatch.setenv("UPLOADS_DIR", str(tmp_path))
+    service = ZenodoService()
+    monkeypatch.setattr(service, "get_deposition", lambda deposition_id: {"id": deposition_id, "links": {}})
+    folder = tmp_path / "user_1" / "dataset_1"
+    folder.mkdir(parents=True)
+    (folder / "model.uvl").write_bytes(b"features\n    Root")
+    feature_model = SimpleNamespace(fm_meta_data=SimpleNamespace(uvl_filename="model.uvl"), files=[])
+
+    with pytest.raises(Exception, match="no bucket link"):
+        service.upload_files(SimpleNamespace(id=1), 1, [feature_model], user=SimpleNamespace(id=1))
+    assert fake_zenodo.uploads == {}
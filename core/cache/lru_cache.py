@@ -0,0 +1,234 @@
+import os
+import re
+import hashlib
+import tempfile
+import threading
+import time
+from collections import OrderedDict
+from typing import Optional
+
+
+SAFE_KEY = re.compile(r'^[A-Za-z0-9_.-]+$')
+
+
+class CacheStats:
+    def __init__(self):
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def to_dict(self):
+        return {
+            'hits': self.hits,
+            'misses': self.misses,
+            'evictions': self.evictions,
+        }
+
+
+class MemoryLRUCache:
+    """
+    In-process LRU cache bounded by the total size (in bytes) of the stored values.
+    The caller provides the size of each value when storing it.
+    """
+
+    def __init__(self, max_bytes: int):
+        self.max_bytes = max_bytes
+        self.current_bytes = 0
+        self.stats = CacheStats()
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                self.stats.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.stats.hits += 1
+            return entry[0]
+
+    def put(self, key, value, size: int):
+        if size > self.max_bytes:
+            return
+        with self._lock:
+            previous = self._entries.pop(key, None)
+            if previous is not None:
+                self.current_bytes -= previous[1]
+            self._entries[key] = (value, size)
+            self.current_bytes += size
+            while self.current_bytes > self.max_bytes:
+                _, (_, evicted_size) = self._entries.popitem(last=False)
+                self.current_bytes -= evicted_size
+                self.stats.evictions += 1
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self.current_bytes = 0
+
+    def to_dict(self):
+        return {
+            **self.stats.to_dict(),
+            'entries': len(self._entries),
+            'bytes': self.current_bytes,
+            'max_bytes': self.max_bytes,
+        }
+
+
+class DiskLRUCache:
+    """
+    On-disk cache shared by every process that points at the same directory. Entries live under a two
+    level fan-out (``ab/abcdef...``), are written atomically and are evicted by least recent access (file
+    mtime, refreshed on every hit) once the directory exceeds its byte budget.
+
+    Entries accessed in the last ``pin_seconds`` are never evicted, so a path returned by ``get_path`` or
+    ``commit`` stays valid until the caller (or nginx, through X-Accel-Redirect) has opened it; an open file
+    survives its removal. The directory can go over budget by what was accessed in that window.
+
+    Writes do not scan the directory: each instance keeps the size found by its last scan plus what it has
+    committed since, and scans again (evicting) once that goes over budget or ``scan_interval`` seconds
+    later, to account for the writes of other processes. Scans also remove the temporary files of writers
+    that died, once untouched for ``stale_tmp_seconds``.
+    """
+
+    def __init__(self, directory: str, max_bytes: int, suffix: str = '', pin_seconds: float = 60,
+                 scan_interval: float = 60, stale_tmp_seconds: float = 3600):
+        # Absolute, so returned paths do not depend on the working directory (send_file resolves relative ones)
+        self.directory = os.path.abspath(directory)
+        self.max_bytes = max_bytes
+        self.suffix = suffix
+        self.pin_seconds = pin_seconds
+        self.scan_interval = scan_interval
+        self.stale_tmp_seconds = stale_tmp_seconds
+        self.stats = CacheStats()
+        self._bytes = None
+        self._scanned_at = 0.0
+        self._lock = threading.Lock()
+
+    def path_for(self, key: str) -> str:
+        name = key if SAFE_KEY.match(key) else hashlib.sha256(key.encode('utf-8')).hexdigest()
+        return os.path.join(self.directory, name[:2], f'{name}{self.suffix}')
+
+    def get_path(self, key: str):
+        path = self.path_for(key)
+        try:
+            os.utime(path)
+        except FileNotFoundError:
+            self.stats.misses += 1
+            return None
+        self.stats.hits += 1
+        return path
+
+    def get(self, key: str):
+        path = self.get_path(key)
+        if path is None:
+            return None
+        try:
+            with open(path, 'rb') as f:
+                return f.read()
+        except FileNotFoundError:
+            # Evicted by another worker between the lookup and the read
+            return None
+
+    def put(self, key: str, data: bytes) -> Optional[str]:
+        """Store ``data`` under ``key`` and return its path, or None when it is larger than the whole cache."""
+        if len(data) > self.max_bytes:
+            return None
+        tmp_path = self.reserve(key)
+        with open(tmp_path, 'wb') as f:
+            f.write(data)
+        return self.commit(key, tmp_path)
+
+    def reserve(self, key: str) -> str:
+        """
+        Return a temporary path, on the same filesystem as the entry, where the caller can write the value.
+        The value becomes visible once passed to ``commit``.
+        """
+        path = self.path_for(key)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(path), prefix='.tmp-')
+        os.close(fd)
+        return tmp_path
+
+    def commit(self, key: str, tmp_path: str) -> str:
+        path = self.path_for(key)
+        size = os.path.getsize(tmp_path)
+        try:
+            size -= os.path.getsize(path)
+        except FileNotFoundError:
+            pass
+        os.replace(tmp_path, path)
+        with self._lock:
+            if self._bytes is not None:
+                self._bytes += size
+            due = self._bytes is None or self._bytes > self.max_bytes \
+                or time.monotonic() - self._scanned_at >= self.scan_interval
+        if due:
+            self.evict(keep=path)
+        return path
+
+    def discard(self, tmp_path: str):
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+
+    def entries(self, stale_tmp_before: float = None):
+        """
+        ``(mtime, size, path)`` of every entry. Temporary files are skipped; those last written before
+        ``stale_tmp_before`` (a timestamp) are removed.
+        """
+        if not os.path.isdir(self.directory):
+            return []
+        entries = []
+        for bucket in os.scandir(self.directory):
+            if not bucket.is_dir():
+                continue
+            for entry in os.scandir(bucket.path):
+                try:
+                    if not entry.is_file():
+                        continue
+                    stat = entry.stat()
+                    if not entry.name.startswith('.tmp-'):
+                        entries.append((stat.st_mtime, stat.st_size, entry.path))
+                    elif stale_tmp_before is not None and stat.st_mtime < stale_tmp_before:
+                        os.remove(entry.path)
+                except FileNotFoundError:
+                    # Evicted or committed by another process during the scan
+                    continue
+        return entries
+
+    def evict(self, keep: str = None) -> int:
+        """
+        Remove the least recently used entries until the cache fits its budget, sparing ``keep`` and the
+        entries accessed in the last ``pin_seconds``.
+        """
+        now = time.time()
+        entries = self.entries(stale_tmp_before=now - self.stale_tmp_seconds)
+        total = sum(size for _, size, _ in entries)
+        pinned_since = now - self.pin_seconds
+        evicted = 0
+        for mtime, size, path in sorted(entries):
+            if total <= self.max_bytes or mtime > pinned_since:
+                break
+            if path == keep:
+                continue
+            try:
+                os.remove(path)
+            except FileNotFoundError:
+                pass
+            total -= size
+            evicted += 1
+        self.stats.evictions += evicted
+        with self._lock:
+            self._bytes = total
+            self._scanned_at = time.monotonic()
+        return evicted
+
+    def to_dict(self):
+        entries = self.entries()
+        return {
+            **self.stats.to_dict(),
+            'entries': len(entries),
+            'bytes': sum(size for _, size, _ in entries),
+            'max_bytes': self.max_bytes,
+        }
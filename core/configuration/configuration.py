@@ -11,6 +11,20 @@ def uploads_folder_name():
     return os.getenv('UPLOADS_DIR', "uploads")
 
 
+def cache_folder_path(*paths):
+    return os.path.join(os.getenv('WORKING_DIR', ''), uploads_folder_name(), '.cache', *paths)
+
+
+def file_delivery_mode():
+    """
+    How downloads are sent: ``direct`` streams them from Flask, ``x-accel`` hands them to nginx through
+    X-Accel-Redirect. Development always sends directly, as it has no nginx in front.
+    """
+    if is_develop():
+        return 'direct'
+    return os.getenv('FILE_DELIVERY_MODE', 'direct')
+
+
 def get_app_version():
     version_file_path = os.path.join(os.getenv('WORKING_DIR', ''), '.version')
     try:
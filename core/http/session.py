@@ -0,0 +1,119 @@
+import logging
+import random
+import threading
+import time
+from email.utils import parsedate_to_datetime
+
+import requests
+from requests.adapters import HTTPAdapter
+
+logger = logging.getLogger(__name__)
+
+# Answers worth retrying: rate limited, or a server/gateway error
+RETRY_STATUSES = frozenset({429, 500, 502, 503, 504})
+# Methods that can be sent again without side effects; other methods are only retried on 429
+IDEMPOTENT_METHODS = frozenset({"GET", "HEAD", "OPTIONS", "PUT", "DELETE"})
+
+
+class RetryingSession(requests.Session):
+    """
+    ``requests.Session`` with a connection pool sized for concurrent use, a default timeout and retries with
+    exponential backoff and full jitter on 429 and 5xx answers and on connection errors.
+
+    The server's rate-limit headers are honoured: ``Retry-After`` (seconds or HTTP date) and
+    ``X-RateLimit-Reset`` set the wait before a retry, and once ``X-RateLimit-Remaining`` reaches 0 every
+    request of the session waits for the reset. Non-idempotent requests (POST, PATCH) are only retried on
+    429, which means the server did not process them. File bodies are rewound before a retry.
+    """
+
+    def __init__(self, pool_size: int = 10, max_retries: int = 5, backoff: float = 0.5, max_backoff: float = 30,
+                 timeout=60):
+        super().__init__()
+        self.max_retries = max_retries
+        self.backoff = backoff
+        self.max_backoff = max_backoff
+        self.timeout = timeout
+        self._blocked_until = 0.0
+        self._lock = threading.Lock()
+        adapter = HTTPAdapter(pool_connections=pool_size, pool_maxsize=pool_size, pool_block=True)
+        self.mount("https://", adapter)
+        self.mount("http://", adapter)
+
+    def request(self, method, url, *args, **kwargs):
+        kwargs.setdefault("timeout", self.timeout)
+        retry_errors = method.upper() in IDEMPOTENT_METHODS
+        bodies = _rewindable_bodies(kwargs)
+
+        attempt = 0
+        while True:
+            self._wait_for_rate_limit()
+            try:
+                response = super().request(method, url, *args, **kwargs)
+            except (requests.ConnectionError, requests.Timeout) as exc:
+                if not retry_errors or attempt >= self.max_retries:
+                    raise
+                delay = self._backoff(attempt)
+                logger.warning(f"{method} {url} failed ({exc}), retrying in {delay:.2f}s")
+            else:
+                self._record_rate_limit(response)
+                retryable = response.status_code == 429 or (retry_errors and response.status_code in RETRY_STATUSES)
+                if not retryable or attempt >= self.max_retries:
+                    return response
+                delay = self._retry_after(response)
+                delay = self._backoff(attempt) if delay is None else min(delay, self.max_backoff)
+                logger.warning(f"{method} {url} answered {response.status_code}, retrying in {delay:.2f}s")
+                response.close()
+
+            time.sleep(delay)
+            for body, position in bodies:
+                body.seek(position)
+            attempt += 1
+
+    def _backoff(self, attempt: int) -> float:
+        return random.uniform(0, min(self.max_backoff, self.backoff * 2 ** attempt))
+
+    def _retry_after(self, response):
+        """Seconds the server asks to wait before retrying, or None when it does not say."""
+        value = response.headers.get("Retry-After")
+        if value:
+            try:
+                return max(float(value), 0.0)
+            except ValueError:
+                try:
+                    return max(parsedate_to_datetime(value).timestamp() - time.time(), 0.0)
+                except (TypeError, ValueError):
+                    pass
+        reset = _rate_limit_reset(response)
+        return None if reset is None else max(reset - time.time(), 0.0)
+
+    def _record_rate_limit(self, response):
+        if response.headers.get("X-RateLimit-Remaining") != "0":
+            return
+        reset = _rate_limit_reset(response)
+        if reset is not None:
+            with self._lock:
+                self._blocked_until = max(self._blocked_until, min(reset, time.time() + self.max_backoff))
+
+    def _wait_for_rate_limit(self):
+        delay = self._blocked_until - time.time()
+        if delay > 0:
+            time.sleep(delay)
+
+
+def _rate_limit_reset(response):
+    """``X-RateLimit-Reset`` as a Unix timestamp, or None."""
+    try:
+        return float(response.headers["X-RateLimit-Reset"])
+    except (KeyError, ValueError):
+        return None
+
+
+def _rewindable_bodies(kwargs) -> list:
+    """The file objects sent in ``data`` or ``files``, with their positions, to rewind them before a retry."""
+    candidates = [kwargs.get("data")]
+    files = kwargs.get("files")
+    if isinstance(files, dict):
+        files = list(files.values())
+    for value in files or []:
+        candidates.append(value[1] if isinstance(value, tuple) and len(value) > 1 else value)
+    return [(body, body.tell()) for body in candidates if hasattr(body, "seek") and hasattr(body, "tell")]
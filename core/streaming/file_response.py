@@ -0,0 +1,220 @@
+import os
+import unicodedata
+import uuid
+from datetime import datetime, timezone
+from urllib.parse import quote
+
+from flask import Response, request
+from werkzeug.http import is_resource_modified, parse_date, quote_header_value
+
+from core.configuration.configuration import file_delivery_mode, uploads_folder_name
+from core.streaming.zip_stream import CHUNK_SIZE
+
+# More ranges than this (after merging overlapping ones) are answered with the whole file
+MAX_RANGES = 16
+
+
+def file_response(path: str, mimetype: str, download_name: str = None, etag: str = None,
+                  as_attachment: bool = True, chunk_size: int = CHUNK_SIZE) -> Response:
+    """
+    Send a file honouring the HTTP validators and byte ranges of the current request: ``If-None-Match`` and
+    ``If-Modified-Since`` (304), single and multiple ``Range`` requests (206, ``multipart/byteranges`` for
+    several ranges) and ``If-Range``. The file is read chunk by chunk.
+
+    Args:
+        path (str): The file to send.
+        mimetype (str): Its content type.
+        download_name (str): File name for the ``Content-Disposition`` header. Defaults to the file's name.
+        etag (str): Strong entity tag of the contents (e.g. their checksum). Derived from the file's size
+            and modification time when omitted.
+        as_attachment (bool): Whether the browser should download the file instead of displaying it.
+
+    Returns:
+        Response: A 200, 206, 304 or 416 response.
+    """
+    stat = os.stat(path)
+    size = stat.st_size
+    etag = etag or f"{stat.st_mtime_ns:x}-{size:x}"
+    last_modified = datetime.fromtimestamp(int(stat.st_mtime), timezone.utc)
+
+    def with_validators(response):
+        response.set_etag(etag)
+        response.last_modified = last_modified
+        response.headers["Accept-Ranges"] = "bytes"
+        response.headers["Content-Disposition"] = content_disposition(download_name or os.path.basename(path),
+                                                                      as_attachment)
+        return response
+
+    if not is_resource_modified(request.environ, etag, last_modified=last_modified):
+        return with_validators(Response(status=304))
+
+    ranges = requested_ranges(size, etag, last_modified)
+    if ranges is None:
+        response = Response(_read(path, [(0, size)], chunk_size), mimetype=mimetype, direct_passthrough=True)
+        response.content_length = size
+        return with_validators(response)
+
+    if not ranges:
+        response = Response(status=416)
+        response.headers["Content-Range"] = f"bytes */{size}"
+        return with_validators(response)
+
+    if len(ranges) == 1:
+        start, stop = ranges[0]
+        response = Response(_read(path, ranges, chunk_size), status=206, mimetype=mimetype,
+                            direct_passthrough=True)
+        response.content_length = stop - start
+        response.headers["Content-Range"] = f"bytes {start}-{stop - 1}/{size}"
+        return with_validators(response)
+
+    boundary = uuid.uuid4().hex
+    parts = [
+        (f"--{boundary}\r\nContent-Type: {mimetype}\r\nContent-Range: bytes {start}-{stop - 1}/{size}\r\n\r\n"
+         .encode("latin-1"), start, stop)
+        for start, stop in ranges
+    ]
+    closing = f"--{boundary}--\r\n".encode("latin-1")
+
+    def multipart():
+        for header, start, stop in parts:
+            yield header
+            yield from _read(path, [(start, stop)], chunk_size)
+            yield b"\r\n"
+        yield closing
+
+    response = Response(multipart(), status=206, mimetype=f"multipart/byteranges; boundary={boundary}",
+                        direct_passthrough=True)
+    response.content_length = sum(len(header) + stop - start + 2 for header, start, stop in parts) + len(closing)
+    return with_validators(response)
+
+
+def deliver_file(path: str, mimetype: str, download_name: str = None, etag: str = None,
+                 as_attachment: bool = True) -> Response:
+    """
+    Send a file, or hand its transfer to nginx when ``FILE_DELIVERY_MODE`` is ``x-accel``: the response then
+    only carries an ``X-Accel-Redirect`` to the internal location that maps the uploads folder, and nginx
+    streams the bytes (ranges and validators included) without holding a Python worker. Files outside the
+    uploads folder, and every file in development, are sent directly with ``file_response``.
+    """
+    internal_uri = x_accel_uri(path) if file_delivery_mode() == "x-accel" else None
+    if internal_uri is None:
+        return file_response(path, mimetype, download_name, etag, as_attachment)
+
+    response = Response(mimetype=mimetype)
+    response.headers["X-Accel-Redirect"] = internal_uri
+    response.headers["Content-Disposition"] = content_disposition(download_name or os.path.basename(path),
+                                                                  as_attachment)
+    if etag:
+        response.set_etag(etag)
+    return response
+
+
+def x_accel_uri(path: str):
+    """URI of ``path`` under the nginx internal location, or None when it is not in the uploads folder."""
+    root = os.path.abspath(os.path.join(os.getenv("WORKING_DIR", ""), uploads_folder_name()))
+    path = os.path.abspath(path)
+    if os.path.commonpath([root, path]) != root:
+        return None
+    prefix = os.getenv("X_ACCEL_PREFIX", "/protected-uploads/").rstrip("/")
+    return f"{prefix}/{quote(os.path.relpath(path, root).replace(os.sep, '/'))}"
+
+
+def content_disposition(name: str, as_attachment: bool = True) -> str:
+    disposition = "attachment" if as_attachment else "inline"
+    try:
+        name.encode("ascii")
+        return f"{disposition}; filename={quote_header_value(name)}"
+    except UnicodeEncodeError:
+        # ASCII fallback plus the RFC 5987 form for clients that support it
+        simple = unicodedata.normalize("NFKD", name).encode("ascii", "ignore").decode("ascii")
+        return f"{disposition}; filename={quote_header_value(simple)}; filename*=UTF-8''{quote(name, safe='')}"
+
+
+def requested_ranges(size: int, etag: str, last_modified: datetime):
+    """
+    The byte ranges the current request asks for, as sorted, merged ``(start, stop)`` pairs.
+
+    Returns:
+        list: The satisfiable ranges (empty when none is, which calls for a 416), or None when the whole
+        file must be sent: no usable ``Range`` header, a failed ``If-Range`` or too many ranges.
+    """
+    parsed = parse_byte_ranges(request.headers.get("Range"))
+    if parsed is None or size == 0:
+        return None
+
+    if_range = request.headers.get("If-Range", "").strip()
+    if if_range.startswith(("\"", "W/")):
+        # Strong comparison: a weak tag never matches
+        if if_range != f'"{etag}"':
+            return None
+    elif if_range and parse_date(if_range) != last_modified:
+        return None
+
+    ranges = []
+    for start, stop in parsed:
+        if start is None:
+            # Suffix range: the last ``stop`` bytes
+            start, stop = max(size - stop, 0), size
+        else:
+            stop = size if stop is None else min(stop, size)
+        if start < stop:
+            ranges.append((start, stop))
+
+    merged = []
+    for start, stop in sorted(ranges):
+        if merged and start <= merged[-1][1]:
+            merged[-1] = (merged[-1][0], max(merged[-1][1], stop))
+        else:
+            merged.append((start, stop))
+
+    if len(merged) > MAX_RANGES:
+        return None
+    return merged
+
+
+def parse_byte_ranges(header: str):
+    """
+    Parse a ``Range: bytes=...`` header into ``(start, stop)`` pairs, ``stop`` exclusive (None for open
+    ranges) and ``start`` None for suffix ranges, where ``stop`` is the suffix length. Unlike werkzeug's
+    parser it accepts ranges out of order or overlapping, as RFC 7233 allows. Returns None when the header
+    is missing or malformed, in which case it must be ignored.
+    """
+    if not header:
+        return None
+    units, _, spec = header.partition("=")
+    if units.strip().lower() != "bytes":
+        return None
+
+    ranges = []
+    for part in spec.split(","):
+        part = part.strip()
+        if not part:
+            continue
+        first, separator, last = part.partition("-")
+        if not separator:
+            return None
+        try:
+            if not first.strip():
+                ranges.append((None, int(last)))
+                continue
+            start = int(first)
+            stop = int(last) + 1 if last.strip() else None
+        except ValueError:
+            return None
+        if start < 0 or (stop is not None and stop <= start):
+            return None
+        ranges.append((start, stop))
+    return ranges or None
+
+
+def _read(path, ranges, chunk_size):
+    with open(path, "rb") as file:
+        for start, stop in ranges:
+            file.seek(start)
+            remaining = stop - start
+            while remaining > 0:
+                chunk = file.read(min(chunk_size, remaining))
+                if not chunk:
+                    return
+                remaining -= len(chunk)
+                yield chunk
@@ -0,0 +1,79 @@
+import io
+import os
+import zipfile
+
+CHUNK_SIZE = 64 * 1024
+
+
+class _ChunkBuffer(io.RawIOBase):
+    """
+    Write-only, unseekable sink for ``zipfile``: it keeps what was written since the last ``drain`` and the
+    total offset, which is all ``zipfile`` needs to write an archive front to back (with data descriptors).
+    """
+
+    def __init__(self):
+        super().__init__()
+        self._chunks = []
+        self._offset = 0
+
+    def writable(self):
+        return True
+
+    def write(self, data):
+        data = bytes(data)
+        self._chunks.append(data)
+        self._offset += len(data)
+        return len(data)
+
+    def tell(self):
+        return self._offset
+
+    def drain(self) -> bytes:
+        data = b"".join(self._chunks)
+        self._chunks = []
+        return data
+
+
+def stream_zip(entries, compression: int = zipfile.ZIP_DEFLATED, chunk_size: int = CHUNK_SIZE):
+    """
+    Build a zip archive on the fly and yield it chunk by chunk, reading each file as it goes. Nothing is
+    written to disk and memory use does not depend on the size of the files.
+
+    Args:
+        entries: Iterable of ``(arcname, path)`` pairs. Instead of a path an entry can also be a ``bytes``
+            object or an iterable of ``bytes`` chunks, which is consumed lazily.
+        compression (int): ``zipfile.ZIP_DEFLATED`` or ``zipfile.ZIP_STORED``.
+        chunk_size (int): Bytes read from each file at a time.
+
+    Yields:
+        bytes: Consecutive pieces of the archive.
+    """
+    buffer = _ChunkBuffer()
+    with zipfile.ZipFile(buffer, "w", compression=compression) as archive:
+        for arcname, source in entries:
+            if isinstance(source, (str, os.PathLike)):
+                info = zipfile.ZipInfo.from_file(source, arcname)
+                info.compress_type = compression
+                with open(source, "rb") as file:
+                    chunks = iter(lambda: file.read(chunk_size), b"")
+                    yield from _write_entry(archive, buffer, info, chunks)
+            else:
+                info = zipfile.ZipInfo(arcname)
+                info.compress_type = compression
+                # Unknown size: allow entries over 4 GiB
+                chunks = [source] if isinstance(source, bytes) else source
+                yield from _write_entry(archive, buffer, info, chunks, force_zip64=not isinstance(source, bytes))
+    # The central directory is written when the archive is closed
+    yield buffer.drain()
+
+
+def _write_entry(archive, buffer, info, chunks, force_zip64=False):
+    with archive.open(info, "w", force_zip64=force_zip64) as entry:
+        for chunk in chunks:
+            entry.write(chunk)
+            data = buffer.drain()
+            if data:
+                yield data
+    data = buffer.drain()
+    if data:
+        yield data
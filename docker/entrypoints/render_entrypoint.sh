@@ -51,6 +51,14 @@ else
     flask db upgrade
 fi
 
+# Render runs a single container: start the background worker next to the web server, restarting it if it
+# stops. It analyzes and publishes the uploaded datasets; without it they stay in "created"
+(while true; do rosemary worker; echo "Worker stopped, restarting..."; sleep 5; done) &
+
 # Start the application using Gunicorn, binding it to port 80
-# Set the logging level to info and the timeout to 3600 seconds
-exec gunicorn --bind 0.0.0.0:80 app:app --log-level info --timeout 3600
+# Set the logging level to info and the timeout to GUNICORN_TIMEOUT seconds (3600 by default). Datasets are
+# analyzed and published by the worker, but downloads still stream from these sync workers for their whole
+# transfer: dataset and bulk archives built on the fly, files outside the uploads folder and, unless
+# FILE_DELIVERY_MODE=x-accel, every file. Only lower it when nginx offloads downloads and no streamed
+# download can take that long
+exec gunicorn --bind 0.0.0.0:80 app:app --log-level info --timeout "${GUNICORN_TIMEOUT:-3600}"
@@ -0,0 +1,15 @@
+# Loaded automatically by gunicorn from the working directory (see docker/entrypoints)
+
+
+def post_worker_init(worker):
+    # Warm the UVL parser and the SAT solver and start the analysis pool before serving requests
+    from app.modules.flamapy.executor import get_executor
+    from app.modules.flamapy.runtime import get_runtime
+
+    try:
+        get_runtime().warm_up()
+    except Exception as exc:
+        worker.log.warning(f"Could not warm up the analysis runtime: {exc}")
+        get_executor()
+    else:
+        worker.log.info(f"Analysis runtime warmed up: {get_runtime().timings}")
@@ -0,0 +1,50 @@
+"""hubfile analysis
+
+Revision ID: 003
+Revises: 002
+Create Date: 2026-10-18 10:00:00.000000
+
+"""
+from alembic import op
+import sqlalchemy as sa
+from sqlalchemy.engine.reflection import Inspector
+
+# revision identifiers, used by Alembic.
+revision = '003'
+down_revision = '002'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    conn = op.get_bind()
+    inspector = Inspector.from_engine(conn)
+    tables = inspector.get_table_names()
+
+    if 'hubfile_analysis' not in tables:
+        op.create_table('hubfile_analysis',
+            sa.Column('id', sa.Integer(), nullable=False),
+            sa.Column('file_id', sa.Integer(), nullable=False),
+            sa.Column('checksum', sa.String(length=120), nullable=False),
+            sa.Column('is_valid', sa.Boolean(), nullable=False),
+            sa.Column('errors', sa.JSON(), nullable=True),
+            sa.Column('number_of_configurations', sa.Float(precision=53), nullable=True),
+            sa.Column('number_of_features', sa.Integer(), nullable=True),
+            sa.Column('number_of_constraints', sa.Integer(), nullable=True),
+            sa.Column('analyzed_at', sa.DateTime(), nullable=False),
+            sa.ForeignKeyConstraint(['file_id'], ['file.id'], ),
+            sa.PrimaryKeyConstraint('id'),
+            sa.UniqueConstraint('file_id')
+        )
+        with op.batch_alter_table('hubfile_analysis', schema=None) as batch_op:
+            batch_op.create_index(batch_op.f('ix_hubfile_analysis_is_valid'), ['is_valid'], unique=False)
+            batch_op.create_index(batch_op.f('ix_hubfile_analysis_number_of_configurations'),
+                                  ['number_of_configurations'], unique=False)
+
+
+def downgrade():
+    with op.batch_alter_table('hubfile_analysis', schema=None) as batch_op:
+        batch_op.drop_index(batch_op.f('ix_hubfile_analysis_number_of_configurations'))
+        batch_op.drop_index(batch_op.f('ix_hubfile_analysis_is_valid'))
+
+    op.drop_table('hubfile_analysis')
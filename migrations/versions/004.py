@@ -0,0 +1,49 @@
+"""flamapy jobs
+
+Revision ID: 004
+Revises: 003
+Create Date: 2026-10-18 11:00:00.000000
+
+"""
+from alembic import op
+import sqlalchemy as sa
+from sqlalchemy.engine.reflection import Inspector
+
+# revision identifiers, used by Alembic.
+revision = '004'
+down_revision = '003'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    conn = op.get_bind()
+    inspector = Inspector.from_engine(conn)
+    tables = inspector.get_table_names()
+
+    if 'flamapy_job' not in tables:
+        op.create_table('flamapy_job',
+            sa.Column('id', sa.Integer(), nullable=False),
+            sa.Column('file_id', sa.Integer(), nullable=False),
+            sa.Column('user_id', sa.Integer(), nullable=True),
+            sa.Column('operation', sa.String(length=50), nullable=False),
+            sa.Column('status', sa.String(length=20), nullable=False),
+            sa.Column('result', sa.JSON(), nullable=True),
+            sa.Column('artifact_path', sa.String(length=512), nullable=True),
+            sa.Column('error', sa.Text(), nullable=True),
+            sa.Column('created_at', sa.DateTime(), nullable=False),
+            sa.Column('started_at', sa.DateTime(), nullable=True),
+            sa.Column('finished_at', sa.DateTime(), nullable=True),
+            sa.ForeignKeyConstraint(['file_id'], ['file.id'], ),
+            sa.ForeignKeyConstraint(['user_id'], ['user.id'], ),
+            sa.PrimaryKeyConstraint('id')
+        )
+        with op.batch_alter_table('flamapy_job', schema=None) as batch_op:
+            batch_op.create_index(batch_op.f('ix_flamapy_job_status'), ['status'], unique=False)
+
+
+def downgrade():
+    with op.batch_alter_table('flamapy_job', schema=None) as batch_op:
+        batch_op.drop_index(batch_op.f('ix_flamapy_job_status'))
+
+    op.drop_table('flamapy_job')
@@ -0,0 +1,38 @@
+"""approximate configuration counts
+
+Revision ID: 005
+Revises: 004
+Create Date: 2026-10-18 12:00:00.000000
+
+"""
+from alembic import op
+import sqlalchemy as sa
+from sqlalchemy.engine.reflection import Inspector
+
+# revision identifiers, used by Alembic.
+revision = '005'
+down_revision = '004'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    conn = op.get_bind()
+    inspector = Inspector.from_engine(conn)
+    columns = [column['name'] for column in inspector.get_columns('hubfile_analysis')]
+
+    with op.batch_alter_table('hubfile_analysis', schema=None) as batch_op:
+        if 'configurations_approximate' not in columns:
+            batch_op.add_column(sa.Column('configurations_approximate', sa.Boolean(), nullable=False,
+                                          server_default=sa.false()))
+        if 'configurations_lower_bound' not in columns:
+            batch_op.add_column(sa.Column('configurations_lower_bound', sa.Float(precision=53), nullable=True))
+        if 'configurations_upper_bound' not in columns:
+            batch_op.add_column(sa.Column('configurations_upper_bound', sa.Float(precision=53), nullable=True))
+
+
+def downgrade():
+    with op.batch_alter_table('hubfile_analysis', schema=None) as batch_op:
+        batch_op.drop_column('configurations_upper_bound')
+        batch_op.drop_column('configurations_lower_bound')
+        batch_op.drop_column('configurations_approximate')
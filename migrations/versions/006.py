@@ -0,0 +1,37 @@
+"""upload-time feature model metrics
+
+Revision ID: 006
+Revises: 005
+Create Date: 2026-10-18 13:00:00.000000
+
+"""
+from alembic import op
+import sqlalchemy as sa
+from sqlalchemy.engine.reflection import Inspector
+
+# revision identifiers, used by Alembic.
+revision = '006'
+down_revision = '005'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    conn = op.get_bind()
+    inspector = Inspector.from_engine(conn)
+    columns = [column['name'] for column in inspector.get_columns('fm_metrics')]
+
+    with op.batch_alter_table('fm_metrics', schema=None) as batch_op:
+        if 'number_of_features' not in columns:
+            batch_op.add_column(sa.Column('number_of_features', sa.Integer(), nullable=True))
+        if 'number_of_constraints' not in columns:
+            batch_op.add_column(sa.Column('number_of_constraints', sa.Integer(), nullable=True))
+        if 'depth' not in columns:
+            batch_op.add_column(sa.Column('depth', sa.Integer(), nullable=True))
+
+
+def downgrade():
+    with op.batch_alter_table('fm_metrics', schema=None) as batch_op:
+        batch_op.drop_column('depth')
+        batch_op.drop_column('number_of_constraints')
+        batch_op.drop_column('number_of_features')
@@ -0,0 +1,84 @@
+"""typed dataset and feature model metrics
+
+Revision ID: 007
+Revises: 006
+Create Date: 2026-10-18 14:00:00.000000
+
+"""
+from alembic import op
+import sqlalchemy as sa
+from sqlalchemy.engine.reflection import Inspector
+
+# revision identifiers, used by Alembic.
+revision = '007'
+down_revision = '006'
+branch_labels = None
+depends_on = None
+
+DS_METRICS_INDEXED = ['number_of_models', 'number_of_features', 'number_of_constraints', 'max_depth',
+                      'number_of_configurations']
+FM_METRICS_INDEXED = ['number_of_features', 'number_of_constraints', 'cross_tree_constraints_ratio', 'depth',
+                      'number_of_configurations']
+
+
+def upgrade():
+    conn = op.get_bind()
+    inspector = Inspector.from_engine(conn)
+
+    ds_columns = {column['name']: column for column in inspector.get_columns('ds_metrics')}
+    to_convert = [name for name in ('number_of_models', 'number_of_features')
+                  if not isinstance(ds_columns[name]['type'], sa.Integer)]
+    if to_convert:
+        # Seeded values are plain integers stored as text; anything else cannot be converted and is dropped
+        rows = conn.execute(sa.text(f"SELECT id, {', '.join(to_convert)} FROM ds_metrics")).mappings().all()
+        for row in rows:
+            values = {name: row[name].strip() if row[name] is not None else None for name in to_convert}
+            values = {name: int(value) if value and value.isdigit() else None for name, value in values.items()}
+            conn.execute(
+                sa.text(f"UPDATE ds_metrics SET {', '.join(f'{name} = :{name}' for name in to_convert)} "
+                        f"WHERE id = :id"),
+                dict(values, id=row['id'])
+            )
+
+    with op.batch_alter_table('ds_metrics', schema=None) as batch_op:
+        for name in to_convert:
+            batch_op.alter_column(name, existing_type=sa.String(length=120), type_=sa.Integer(),
+                                  existing_nullable=True)
+        if 'number_of_constraints' not in ds_columns:
+            batch_op.add_column(sa.Column('number_of_constraints', sa.Integer(), nullable=True))
+        if 'max_depth' not in ds_columns:
+            batch_op.add_column(sa.Column('max_depth', sa.Integer(), nullable=True))
+        if 'number_of_configurations' not in ds_columns:
+            batch_op.add_column(sa.Column('number_of_configurations', sa.Float(precision=53), nullable=True))
+
+    fm_columns = [column['name'] for column in inspector.get_columns('fm_metrics')]
+    with op.batch_alter_table('fm_metrics', schema=None) as batch_op:
+        if 'cross_tree_constraints_ratio' not in fm_columns:
+            batch_op.add_column(sa.Column('cross_tree_constraints_ratio', sa.Float(), nullable=True))
+        if 'number_of_configurations' not in fm_columns:
+            batch_op.add_column(sa.Column('number_of_configurations', sa.Float(precision=53), nullable=True))
+
+    for table, names in (('ds_metrics', DS_METRICS_INDEXED), ('fm_metrics', FM_METRICS_INDEXED)):
+        indexes = [index['name'] for index in inspector.get_indexes(table)]
+        for name in names:
+            if f'ix_{table}_{name}' not in indexes:
+                op.create_index(f'ix_{table}_{name}', table, [name], unique=False)
+
+
+def downgrade():
+    for table, names in (('ds_metrics', DS_METRICS_INDEXED), ('fm_metrics', FM_METRICS_INDEXED)):
+        for name in names:
+            op.drop_index(f'ix_{table}_{name}', table_name=table)
+
+    with op.batch_alter_table('fm_metrics', schema=None) as batch_op:
+        batch_op.drop_column('number_of_configurations')
+        batch_op.drop_column('cross_tree_constraints_ratio')
+
+    with op.batch_alter_table('ds_metrics', schema=None) as batch_op:
+        batch_op.drop_column('number_of_configurations')
+        batch_op.drop_column('max_depth')
+        batch_op.drop_column('number_of_constraints')
+        batch_op.alter_column('number_of_features', existing_type=sa.Integer(), type_=sa.String(length=120),
+                              existing_nullable=True)
+        batch_op.alter_column('number_of_models', existing_type=sa.Integer(), type_=sa.String(length=120),
+                              existing_nullable=True)
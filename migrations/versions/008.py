@@ -0,0 +1,111 @@
+"""content-addressed file blobs
+
+Revision ID: 008
+Revises: 007
+Create Date: 2026-10-18 16:00:00.000000
+
+"""
+import filecmp
+import hashlib
+import os
+import shutil
+
+from alembic import op
+import sqlalchemy as sa
+from sqlalchemy.engine.reflection import Inspector
+
+# revision identifiers, used by Alembic.
+revision = '008'
+down_revision = '007'
+branch_labels = None
+depends_on = None
+
+FILES_QUERY = sa.text(
+    "SELECT file.name, file.checksum, data_set.id AS dataset_id, data_set.user_id FROM file "
+    "JOIN feature_model ON file.feature_model_id = feature_model.id "
+    "JOIN data_set ON feature_model.data_set_id = data_set.id "
+    "ORDER BY file.id"
+)
+
+
+def uploads_dir():
+    return os.path.join(os.getenv('WORKING_DIR', ''), os.getenv('UPLOADS_DIR', 'uploads'))
+
+
+def legacy_path(row):
+    return os.path.join(uploads_dir(), f"user_{row['user_id']}", f"dataset_{row['dataset_id']}", row['name'])
+
+
+def blob_path(checksum):
+    return os.path.join(uploads_dir(), 'blobs', checksum[:2], checksum[2:4], checksum)
+
+
+def md5(path):
+    digest = hashlib.md5()
+    with open(path, 'rb') as file:
+        for chunk in iter(lambda: file.read(64 * 1024), b''):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def upgrade():
+    conn = op.get_bind()
+    inspector = Inspector.from_engine(conn)
+
+    if 'file_blob' not in inspector.get_table_names():
+        op.create_table(
+            'file_blob',
+            sa.Column('id', sa.Integer(), nullable=False),
+            sa.Column('checksum', sa.String(length=120), nullable=False),
+            sa.Column('size', sa.Integer(), nullable=False),
+            sa.Column('ref_count', sa.Integer(), nullable=False),
+            sa.Column('created_at', sa.DateTime(), nullable=False),
+            sa.PrimaryKeyConstraint('id'),
+        )
+        op.create_index('ix_file_blob_checksum', 'file_blob', ['checksum'], unique=True)
+
+    # Move the existing uploads into the store: one blob per content, the duplicates are dropped. Files whose
+    # content does not match their checksum (or collides with a stored one) stay where they are.
+    references = {}
+    for row in conn.execute(FILES_QUERY).mappings():
+        path = legacy_path(row)
+        checksum = row['checksum']
+        if not os.path.exists(path) or md5(path) != checksum:
+            continue
+        target = blob_path(checksum)
+        if os.path.exists(target):
+            if not filecmp.cmp(path, target, shallow=False):
+                continue
+            os.remove(path)
+        else:
+            os.makedirs(os.path.dirname(target), exist_ok=True)
+            os.replace(path, target)
+        references[checksum] = references.get(checksum, 0) + 1
+
+    known = {checksum for (checksum,) in conn.execute(sa.text("SELECT checksum FROM file_blob"))}
+    for checksum, count in references.items():
+        if checksum in known:
+            conn.execute(sa.text("UPDATE file_blob SET ref_count = ref_count + :count WHERE checksum = :checksum"),
+                         {"count": count, "checksum": checksum})
+        else:
+            conn.execute(
+                sa.text("INSERT INTO file_blob (checksum, size, ref_count, created_at) "
+                        "VALUES (:checksum, :size, :count, CURRENT_TIMESTAMP)"),
+                {"checksum": checksum, "size": os.path.getsize(blob_path(checksum)), "count": count}
+            )
+
+
+def downgrade():
+    conn = op.get_bind()
+
+    # Give every file its own copy in the dataset folder again
+    for row in conn.execute(FILES_QUERY).mappings():
+        path = legacy_path(row)
+        source = blob_path(row['checksum'])
+        if not os.path.exists(path) and os.path.exists(source):
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            shutil.copy2(source, path)
+    shutil.rmtree(os.path.join(uploads_dir(), 'blobs'), ignore_errors=True)
+
+    op.drop_index('ix_file_blob_checksum', table_name='file_blob')
+    op.drop_table('file_blob')
@@ -0,0 +1,48 @@
+"""dataset publication pipeline
+
+Revision ID: 009
+Revises: 008
+Create Date: 2026-10-18 20:00:00.000000
+
+"""
+from alembic import op
+import sqlalchemy as sa
+from sqlalchemy.engine.reflection import Inspector
+
+# revision identifiers, used by Alembic.
+revision = '009'
+down_revision = '008'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    conn = op.get_bind()
+    inspector = Inspector.from_engine(conn)
+    tables = inspector.get_table_names()
+
+    if 'ds_publication' not in tables:
+        op.create_table('ds_publication',
+            sa.Column('id', sa.Integer(), nullable=False),
+            sa.Column('dataset_id', sa.Integer(), nullable=False),
+            sa.Column('state', sa.String(length=20), nullable=False),
+            sa.Column('attempts', sa.Integer(), nullable=False),
+            sa.Column('error', sa.Text(), nullable=True),
+            sa.Column('next_attempt_at', sa.DateTime(), nullable=True),
+            sa.Column('locked_until', sa.DateTime(), nullable=True),
+            sa.Column('failed_at', sa.DateTime(), nullable=True),
+            sa.Column('created_at', sa.DateTime(), nullable=False),
+            sa.Column('updated_at', sa.DateTime(), nullable=False),
+            sa.ForeignKeyConstraint(['dataset_id'], ['data_set.id'], ),
+            sa.PrimaryKeyConstraint('id'),
+            sa.UniqueConstraint('dataset_id')
+        )
+        with op.batch_alter_table('ds_publication', schema=None) as batch_op:
+            batch_op.create_index(batch_op.f('ix_ds_publication_state'), ['state'], unique=False)
+
+
+def downgrade():
+    with op.batch_alter_table('ds_publication', schema=None) as batch_op:
+        batch_op.drop_index(batch_op.f('ix_ds_publication_state'))
+
+    op.drop_table('ds_publication')
@@ -0,0 +1,64 @@
+"""blob references of files
+
+Revision ID: 010
+Revises: 009
+Create Date: 2026-10-19 10:00:00.000000
+
+"""
+import os
+
+from alembic import op
+import sqlalchemy as sa
+from sqlalchemy.engine.reflection import Inspector
+
+# revision identifiers, used by Alembic.
+revision = '010'
+down_revision = '009'
+branch_labels = None
+depends_on = None
+
+FILES_QUERY = sa.text(
+    "SELECT file.id, file.name, file_blob.id AS blob_id, data_set.id AS dataset_id, data_set.user_id FROM file "
+    "JOIN file_blob ON file.checksum = file_blob.checksum "
+    "JOIN feature_model ON file.feature_model_id = feature_model.id "
+    "JOIN data_set ON feature_model.data_set_id = data_set.id "
+    "ORDER BY file.id"
+)
+
+
+def uploads_dir():
+    return os.path.join(os.getenv('WORKING_DIR', ''), os.getenv('UPLOADS_DIR', 'uploads'))
+
+
+def legacy_path(row):
+    return os.path.join(uploads_dir(), f"user_{row['user_id']}", f"dataset_{row['dataset_id']}", row['name'])
+
+
+def upgrade():
+    conn = op.get_bind()
+    inspector = Inspector.from_engine(conn)
+
+    if 'blob_id' not in [column['name'] for column in inspector.get_columns('file')]:
+        with op.batch_alter_table('file', schema=None) as batch_op:
+            batch_op.add_column(sa.Column('blob_id', sa.Integer(), nullable=True))
+            batch_op.create_index(batch_op.f('ix_file_blob_id'), ['blob_id'], unique=False)
+            batch_op.create_foreign_key('fk_file_blob_id', 'file_blob', ['blob_id'], ['id'], ondelete='SET NULL')
+
+    # Files moved into the store by 008 (or by uploads since) are those left without a copy in their dataset
+    # folder while a blob of their content exists
+    for row in conn.execute(FILES_QUERY).mappings():
+        if not os.path.exists(legacy_path(row)):
+            conn.execute(sa.text("UPDATE file SET blob_id = :blob_id WHERE id = :id"),
+                         {"blob_id": row['blob_id'], "id": row['id']})
+
+    # The reference counts are the recorded references from now on
+    conn.execute(sa.text(
+        "UPDATE file_blob SET ref_count = (SELECT COUNT(*) FROM file WHERE file.blob_id = file_blob.id)"
+    ))
+
+
+def downgrade():
+    with op.batch_alter_table('file', schema=None) as batch_op:
+        batch_op.drop_constraint('fk_file_blob_id', type_='foreignkey')
+        batch_op.drop_index(batch_op.f('ix_file_blob_id'))
+        batch_op.drop_column('blob_id')
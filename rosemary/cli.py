@@ -19,6 +19,11 @@ from rosemary.commands.info import info, info2
 from rosemary.commands.make_module import make_module
 from rosemary.commands.env import env
 from rosemary.commands.test import test
+from rosemary.commands.worker import worker
+from rosemary.commands.metrics_backfill import metrics_backfill
+from rosemary.commands.uploads_dedupe import uploads_dedupe
+from rosemary.commands.hubfile_analyze import hubfile_analyze
+from rosemary.commands.uploads_cleanup import uploads_cleanup
 
 
 class RosemaryCLI(click.Group):
@@ -58,6 +63,11 @@ cli.add_command(locust)
 cli.add_command(stop)
 cli.add_command(selenium)
 cli.add_command(module_list)
+cli.add_command(worker)
+cli.add_command(metrics_backfill)
+cli.add_command(uploads_dedupe)
+cli.add_command(hubfile_analyze)
+cli.add_command(uploads_cleanup)
 
 
 if __name__ == '__main__':
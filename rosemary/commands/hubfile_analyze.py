@@ -0,0 +1,21 @@
+import click
+from flask.cli import with_appcontext
+
+
+@click.command('hubfile:analyze', help="Analyzes the UVL files that have no up to date analysis yet.")
+@click.option('--batch-size', default=50, show_default=True, help="Files processed (and committed) per batch.")
+@with_appcontext
+def hubfile_analyze(batch_size):
+    from app.modules.hubfile.services import HubfileService
+
+    files = analyzed = 0
+    try:
+        for file_ids, batch_analyzed in HubfileService().backfill_analyses(batch_size):
+            files += len(file_ids)
+            analyzed += batch_analyzed
+            click.echo(click.style(f"Files {file_ids[0]}-{file_ids[-1]}: {batch_analyzed} analyzed.", fg='blue'))
+    except Exception as e:
+        click.echo(click.style(f"Error analyzing files: {e}", fg='red'))
+        return
+
+    click.echo(click.style(f"{analyzed} of {files} pending files analyzed.", fg='green'))
@@ -0,0 +1,26 @@
+import click
+from flask.cli import with_appcontext
+
+
+@click.command('metrics:backfill', help="Computes the dataset and feature model metrics of existing datasets.")
+@click.option('--batch-size', default=20, show_default=True, help="Datasets processed (and committed) per batch.")
+@click.option('--all', 'recompute_all', is_flag=True, help="Recompute every dataset, not only those missing metrics.")
+@with_appcontext
+def metrics_backfill(batch_size, recompute_all):
+    from app.modules.dataset.services import DataSetService
+    from app.modules.flamapy.executor import get_executor
+
+    click.echo(click.style(f"Computing metrics with {get_executor().workers} parallel workers...", fg='green'))
+
+    datasets = models = 0
+    try:
+        for dataset_ids, computed in DataSetService().backfill_metrics(batch_size, only_missing=not recompute_all):
+            datasets += len(dataset_ids)
+            models += computed
+            click.echo(click.style(f"Datasets {dataset_ids[0]}-{dataset_ids[-1]}: {computed} feature models.",
+                                   fg='blue'))
+    except Exception as e:
+        click.echo(click.style(f"Error computing metrics: {e}", fg='red'))
+        return
+
+    click.echo(click.style(f"Metrics computed for {datasets} datasets ({models} feature models).", fg='green'))
@@ -0,0 +1,21 @@
+import os
+
+import click
+from flask.cli import with_appcontext
+
+from core.configuration.configuration import uploads_folder_name
+
+
+@click.command('uploads:cleanup', help="Removes the chunked uploads that received nothing for UPLOAD_CHUNKED_TTL.")
+@with_appcontext
+def uploads_cleanup():
+    from app.modules.dataset.services import ChunkedUploadService
+
+    temp_root = os.path.join(os.getenv('WORKING_DIR', ''), uploads_folder_name(), 'temp')
+    try:
+        removed = ChunkedUploadService().cleanup_all(temp_root)
+    except Exception as e:
+        click.echo(click.style(f"Error cleaning up uploads: {e}", fg='red'))
+        return
+
+    click.echo(click.style(f"{removed} abandoned chunked uploads removed.", fg='green'))
@@ -0,0 +1,21 @@
+import click
+from flask.cli import with_appcontext
+
+
+@click.command('uploads:dedupe', help="Moves the files still in dataset folders into the deduplicated blob store.")
+@click.option('--batch-size', default=200, show_default=True, help="Files processed (and committed) per batch.")
+@with_appcontext
+def uploads_dedupe(batch_size):
+    from app.modules.hubfile.services import HubfileBlobService
+
+    moved = freed = 0
+    try:
+        for batch_moved, batch_freed in HubfileBlobService().deduplicate(batch_size):
+            moved += batch_moved
+            freed += batch_freed
+    except Exception as e:
+        click.echo(click.style(f"Error deduplicating uploads: {e}", fg='red'))
+        return
+
+    click.echo(click.style(f"{moved} files moved into the blob store, {freed} bytes of duplicates freed.",
+                           fg='green'))
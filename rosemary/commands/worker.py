@@ -0,0 +1,49 @@
+import time
+
+import click
+from flask.cli import with_appcontext
+
+
+@click.command('worker', help="Processes queued background jobs (flamapy analysis jobs and dataset publications).")
+@click.option('--once', is_flag=True, help="Drain the queue and exit instead of waiting for new jobs.")
+@click.option('--sleep', default=2.0, show_default=True, help="Seconds to wait when the queue is empty.")
+@with_appcontext
+def worker(once, sleep):
+    from app import db
+    from app.modules.dataset.services import DSPublicationService
+    from app.modules.flamapy.services import FlamapyJobService
+
+    click.echo(click.style("Worker started, waiting for jobs...", fg='green'))
+
+    while True:
+        try:
+            job = FlamapyJobService().run_next()
+        except Exception as e:
+            click.echo(click.style(f"Error processing jobs: {e}", fg='red'))
+            db.session.rollback()
+            job = None
+
+        if job is not None:
+            color = 'blue' if job.status == 'done' else 'red'
+            click.echo(click.style(f"Job {job.id} ({job.operation}) {job.status}.", fg=color))
+
+        try:
+            publication = DSPublicationService().advance_next()
+        except Exception as e:
+            click.echo(click.style(f"Error processing publications: {e}", fg='red'))
+            db.session.rollback()
+            publication = None
+
+        if publication is not None:
+            color = 'red' if publication.error else 'blue'
+            suffix = f" ({publication.error})" if publication.error else ""
+            click.echo(click.style(f"Publication of dataset {publication.dataset_id}: {publication.state}{suffix}.",
+                                   fg=color))
+
+        if job is not None or publication is not None:
+            continue
+
+        if once:
+            click.echo(click.style("Queue drained.", fg='green'))
+            return
+        time.sleep(sleep)